@@ -0,0 +1,160 @@
+# backend/analytics.py
+"""Dashboard aggregates over saved problems, served from rollup tables.
+
+save_problems calls record_problems in the same transaction as its INSERT,
+adding each batch's counts to the rollups (migrations 6 and 8):
+
+- problem_rollup_namaste: problems per NAMASTE code
+- problem_rollup_category: problems and NAMASTE codes per category,
+  recomputed from the per-code rollup when a reference reload changes
+  categories, so a new category applies to past problems too
+- problem_rollup_icd: codings per ICD-11 code
+- problem_rollup_daily: problems and ICD codings per UTC day
+
+Each ICD code of a saved entry is a coding and a row in `problems`. A
+problem is a distinct (patient, NAMASTE code, created_at): the rows of one
+saved entry, merged with any saved for the same patient and code in the
+same second, which is how rebuild_rollups counts them from `problems`.
+Reads touch one row per bucket, never the problems table.
+
+    python analytics.py [--rebuild]
+"""
+import argparse
+import json
+import time
+from collections import Counter, defaultdict
+
+from db import CATEGORY_ROLLUP_BACKFILL, CONCEPT_MAP_ICD_DISPLAY, ROLLUP_BACKFILL, connection, init_db
+
+TOP_ICD_MAX = 100
+
+
+def day_of(timestamp):
+    return time.strftime("%Y-%m-%d", time.gmtime(timestamp))
+
+
+def saved_at(conn, keys, created_at):
+    """The (patient_id, namaste_code) `keys` that have rows saved at `created_at`"""
+    return {tuple(r) for r in conn.execute(
+        """SELECT DISTINCT p.patient_id, p.namaste_code FROM json_each(?) j
+           JOIN problems p ON p.patient_id = json_extract(j.value, '$[0]') AND p.created_at = ?
+                          AND p.namaste_code = json_extract(j.value, '$[1]')""",
+        (json.dumps(list(keys)), created_at),
+    )}
+
+
+def record_problems(conn, problems, created_at):
+    """Add (patient_id, namaste_code, icd_codes) problems about to be saved at
+    `created_at` to the rollups, inside the caller's transaction, which must
+    hold the write lock, and before their rows are inserted"""
+    saved, icd = Counter(), Counter()  # (patient_id, namaste_code) -> codings
+    for patient_id, namaste_code, icd_codes in problems:
+        if not icd_codes:
+            continue  # nothing is inserted for it
+        saved[(patient_id, namaste_code)] += len(icd_codes)
+        icd.update(icd_codes)
+    if not saved:
+        return
+    # rows for a (patient, code) already saved this second belong to that problem
+    joined = saved_at(conn, saved, created_at)
+    namaste = Counter(key[1] for key in saved if key not in joined)
+    if namaste:
+        codes = json.dumps(list(namaste))
+        categories = dict(conn.execute(
+            "SELECT code, COALESCE(category, 'Unknown') FROM namaste WHERE code IN (SELECT value FROM json_each(?))",
+            (codes,),
+        ).fetchall())
+        known = {r[0] for r in conn.execute(
+            "SELECT namaste_code FROM problem_rollup_namaste WHERE namaste_code IN (SELECT value FROM json_each(?))",
+            (codes,),
+        )}
+        per_category = defaultdict(lambda: [0, 0])  # category -> [problems, new codes]
+        for code, n in namaste.items():
+            bucket = per_category[categories.get(code, "Unknown")]
+            bucket[0] += n
+            bucket[1] += code not in known
+        conn.executemany(
+            """INSERT INTO problem_rollup_namaste(namaste_code, problems, last_at) VALUES (?, ?, ?)
+               ON CONFLICT(namaste_code) DO UPDATE SET problems = problems + excluded.problems,
+                                                       last_at = MAX(last_at, excluded.last_at)""",
+            [(code, n, created_at) for code, n in namaste.items()],
+        )
+        conn.executemany(
+            """INSERT INTO problem_rollup_category(category, problems, codes) VALUES (?, ?, ?)
+               ON CONFLICT(category) DO UPDATE SET problems = problems + excluded.problems,
+                                                   codes = codes + excluded.codes""",
+            [(category, n, new) for category, (n, new) in per_category.items()],
+        )
+    conn.executemany(
+        """INSERT INTO problem_rollup_icd(icd_code, codings, last_at) VALUES (?, ?, ?)
+           ON CONFLICT(icd_code) DO UPDATE SET codings = codings + excluded.codings,
+                                               last_at = MAX(last_at, excluded.last_at)""",
+        [(code, n, created_at) for code, n in icd.items()],
+    )
+    conn.execute(
+        """INSERT INTO problem_rollup_daily(day, problems, codings) VALUES (?, ?, ?)
+           ON CONFLICT(day) DO UPDATE SET problems = problems + excluded.problems,
+                                          codings = codings + excluded.codings""",
+        (day_of(created_at), sum(namaste.values()), sum(saved.values())),
+    )
+
+
+def rebuild_category_rollup(conn):
+    """Recompute problem_rollup_category after NAMASTE categories changed,
+    inside the caller's transaction"""
+    conn.execute("DELETE FROM problem_rollup_category")
+    conn.execute(CATEGORY_ROLLUP_BACKFILL)
+
+
+def rebuild_rollups():
+    """Recompute the rollups from the problems table in one transaction"""
+    with connection() as conn:
+        for table in ("problem_rollup_namaste", "problem_rollup_icd", "problem_rollup_daily"):
+            conn.execute(f"DELETE FROM {table}")
+        for statement in ROLLUP_BACKFILL:
+            conn.execute(statement)
+        rebuild_category_rollup(conn)
+        return conn.execute("SELECT COUNT(*) FROM problem_rollup_namaste").fetchone()[0]
+
+
+def category_counts():
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT category, problems, codes FROM problem_rollup_category ORDER BY problems DESC, category"
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def top_icd_codes(limit=10):
+    with connection() as conn:
+        rows = conn.execute(
+            f"""SELECT r.icd_code AS code, COALESCE(ic.display, {CONCEPT_MAP_ICD_DISPLAY.format("r.icd_code")}) AS display,
+                      ic.module, r.codings, r.last_at AS lastAt
+               FROM problem_rollup_icd r LEFT JOIN icd_cache ic ON ic.code = r.icd_code
+               ORDER BY r.codings DESC, r.icd_code LIMIT ?""",
+            (limit,),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+def daily_volume(start=None, end=None):
+    """Problems and codings per day, oldest first; start/end are YYYY-MM-DD, inclusive"""
+    with connection() as conn:
+        rows = conn.execute(
+            "SELECT day, problems, codings FROM problem_rollup_daily WHERE day BETWEEN ? AND ? ORDER BY day",
+            (start or "0000-00-00", end or "9999-99-99"),
+        ).fetchall()
+    return [dict(r) for r in rows]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rebuild", action="store_true", help="recompute rollups from the problems table")
+    args = parser.parse_args()
+
+    init_db()
+    if args.rebuild:
+        print(f"Rebuilt rollups ({rebuild_rollups()} NAMASTE codes)")
+    print(category_counts())
+    print(top_icd_codes())
+    print(daily_volume()[-7:])
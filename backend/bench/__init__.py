@@ -0,0 +1,5 @@
+# backend/bench/__init__.py
+# Benchmarks and load tests. Run them as modules from backend/, so the app
+# modules import as usual:
+#
+#   python -m bench.bench_suite
@@ -0,0 +1,81 @@
+# backend/bench/bench_analytics.py
+# Analytics queries from the rollup tables against the same aggregates
+# computed from the problems table, on a scratch database with synthetic
+# problems saved through save_problems (so the rollups are maintained the
+# way the API maintains them).
+#
+#   python -m bench.bench_analytics [problems] [batch_size]
+import os
+import random
+import sys
+import tempfile
+import time
+
+PROBLEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+ROUNDS = 20
+
+os.environ["AYUSYNC_DB"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+import analytics  # noqa: E402
+from db import connection, init_db  # noqa: E402
+from problems import save_problems  # noqa: E402
+from reference_data import load_reference_data  # noqa: E402
+
+# the same aggregates, computed from raw rows
+RAW_QUERIES = {
+    "categories": """SELECT COALESCE(n.category, 'Unknown'), COUNT(*) FROM (
+                       SELECT namaste_code FROM problems GROUP BY patient_id, namaste_code, created_at) s
+                     LEFT JOIN namaste n ON n.code = s.namaste_code GROUP BY 1 ORDER BY 2 DESC""",
+    "top-icd": "SELECT icd_code, COUNT(*) AS c FROM problems GROUP BY icd_code ORDER BY c DESC LIMIT 10",
+    "daily": """SELECT date(created_at, 'unixepoch') AS day, COUNT(*) FROM problems
+                GROUP BY day ORDER BY day""",
+}
+ROLLUP_QUERIES = {
+    "categories": analytics.category_counts,
+    "top-icd": analytics.top_icd_codes,
+    "daily": analytics.daily_volume,
+}
+
+
+def seed():
+    rng = random.Random(7)
+    with connection() as conn:
+        namaste = [r[0] for r in conn.execute("SELECT code FROM namaste")]
+    icd = [f"B{i:04d}" for i in range(2000)]
+    start = time.perf_counter()
+    saved = 0
+    while saved < PROBLEMS:
+        batch = [(f"patient-{rng.randrange(50_000)}", rng.choice(namaste),
+                  rng.sample(icd, rng.randint(1, 3))) for _ in range(min(BATCH_SIZE, PROBLEMS - saved))]
+        save_problems(batch)
+        saved += len(batch)
+    elapsed = time.perf_counter() - start
+    with connection() as conn:
+        rows = conn.execute("SELECT COUNT(*) FROM problems").fetchone()[0]
+    print(f"{saved} problems ({rows} rows) saved in {elapsed:.1f}s, {saved / elapsed:.0f} problems/s "
+          f"including rollup upserts\n")
+
+
+def timed(fn):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        fn()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def raw(sql):
+    def run():
+        with connection() as conn:
+            conn.execute(sql).fetchall()
+    return run
+
+
+if __name__ == "__main__":
+    init_db()
+    load_reference_data()
+    seed()
+    for name in RAW_QUERIES:
+        raw_ms = timed(raw(RAW_QUERIES[name]))
+        rollup_ms = timed(ROLLUP_QUERIES[name])
+        print(f"{name:<11} problems table {raw_ms:9.1f}ms   rollup {rollup_ms:7.3f}ms   x{raw_ms / rollup_ms:,.0f}")
@@ -0,0 +1,174 @@
+# backend/bench/bench_cold_start.py
+# Time to first fast response after a restart, with and without warm-up.
+#
+#   python -m bench.bench_cold_start [--scale 1m] [--runs 2] [--rounds 30]
+#
+# Uses a bench_suite dataset (generated on first use) and a WHO stub with
+# WHO_LATENCY_MS per call. A first server records history (ICD and unified
+# searches, kept in icd_query_cache); then, per run, the stored WHO token is
+# deleted, the database file is dropped from the OS page cache and a fresh
+# `uvicorn main:app` is started with WARMUP_ENABLED off and on. Like a load balancer, the client waits for /health/ready and
+# then sends rounds of a request mix. For each run it reports when the
+# server was live and ready, the latency of each endpoint's first response
+# against its steady state, and the time from process start until a whole
+# round was fast (within 1.5x the steady round).
+import argparse
+import asyncio
+import os
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench import bench_suite, who_stub
+
+BACKEND = Path(__file__).resolve().parent.parent
+PORT = 8767
+WHO_LATENCY_MS = 150
+HISTORY_QUERIES = 100
+
+
+class SlowWHOHandler(who_stub.StubWHOHandler):
+    token_ms = latency_ms = WHO_LATENCY_MS
+
+
+def pick(values, i):
+    return values[i % len(values)]
+
+
+# (name, path(ctx, round)); ICD and unified searches for the first
+# HISTORY_QUERIES terms were made before the restart, "new" ones differ in
+# every run
+MIX = [
+    ("namaste-search", lambda c, i: f"/api/namaste/search?q={pick(c['namasteTerms'], i)}"),
+    ("icd-search-history", lambda c, i: f"/api/icd/search?q={pick(c['icdTerms'], i)}"),
+    ("icd-search-new", lambda c, i: f"/api/icd/search?q={pick(c['icdTerms'], i)}{c['run']}x{i}"),
+    ("unified-search", lambda c, i: f"/api/search/unified?q={pick(c['namasteTerms'], i)}"),
+    ("concept-map", lambda c, i: f"/api/concept-map/{pick(c['namasteCodes'], i)}"),
+    ("patient-problems", lambda c, i: f"/api/patients/{pick(c['patients'], i)}/problems"),
+    ("analytics-categories", lambda c, i: "/api/analytics/categories"),
+    ("analytics-top-icd", lambda c, i: "/api/analytics/top-icd?limit=20"),
+]
+
+
+def make_cold(db_path):
+    """Forget the stored WHO token and evict the database files from the OS page cache"""
+    with sqlite3.connect(db_path) as conn:
+        conn.execute("DELETE FROM shared_state WHERE key = 'who_token'")
+    conn.close()
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm")):
+        if path.exists():
+            fd = os.open(path, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+
+
+async def wait_for(client, server, path, status=200):
+    while True:
+        if server.poll() is not None:
+            raise RuntimeError(f"server exited with {server.returncode}")
+        try:
+            if (await client.get(path)).status_code == status:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.02)
+
+
+async def serve(env, body):
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT),
+                               "--log-level", "warning"], cwd=BACKEND, env=env,
+                              stdout=subprocess.DEVNULL)
+    spawned = time.perf_counter()
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", timeout=600) as client:
+            return await body(client, server, spawned)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+async def record_history(env, ctx):
+    async def body(client, server, spawned):
+        await wait_for(client, server, "/health/ready")
+        for i in range(HISTORY_QUERIES):
+            await client.get(f"/api/icd/search?q={pick(ctx['icdTerms'], i)}")
+            await client.get(f"/api/search/unified?q={pick(ctx['namasteTerms'], i)}")
+    await serve(env, body)
+
+
+async def cold_run(env, ctx, rounds):
+    async def body(client, server, spawned):
+        await wait_for(client, server, "/health/live")
+        live = time.perf_counter() - spawned
+        await wait_for(client, server, "/health/ready")
+        ready = time.perf_counter() - spawned
+        timings = []  # per round: {endpoint: ms}, and when the round ended
+        for i in range(rounds):
+            latencies = {}
+            for name, path in MIX:
+                start = time.perf_counter()
+                r = await client.get(path(ctx, i))
+                latencies[name] = (time.perf_counter() - start) * 1000
+                assert r.status_code == 200, (name, r.status_code, r.text[:200])
+            timings.append((latencies, time.perf_counter() - spawned))
+        warmup = (await client.get("/health/ready")).json()
+        return live, ready, timings, warmup
+    return await serve(env, body)
+
+
+def report(label, live, ready, timings, warmup):
+    steady = {name: statistics.median(t[0][name] for t in timings[len(timings) // 3:]) for name, _ in MIX}
+    steady_round = sum(steady.values())
+    fast_at = next((at for latencies, at in timings if sum(latencies.values()) <= 1.5 * steady_round), None)
+    first = timings[0][0]
+    fast = f"first fast round at {fast_at:.2f}s" if fast_at else "no fast round"
+    print(f"\n{label}: live {live:.2f}s, ready {ready:.2f}s (warm-up {warmup['warmupSeconds']}s), {fast}")
+    print(f"  first round {sum(first.values()):8.1f}ms   steady round {steady_round:8.1f}ms")
+    for name, _ in MIX:
+        print(f"  {name:<22} first {first[name]:8.1f}ms   steady {steady[name]:7.1f}ms")
+    if warmup.get("steps"):
+        print("  warm-up steps: " + ", ".join(f"{n} {s['ms']}ms" for n, s in warmup["steps"].items()))
+    return {"live": live, "ready": ready, "fastAt": fast_at, "firstRoundMs": sum(first.values()),
+            "steadyRoundMs": steady_round}
+
+
+async def run(args):
+    ctx = bench_suite.ensure_dataset(args, args.scale)
+    scratch, ref_dir = bench_suite.scratch_copy(args, args.scale)
+    env = dict(os.environ, **bench_suite.start_who_stub(SlowWHOHandler), AYUSYNC_DB=str(scratch), REFERENCE_DATA_DIR=str(ref_dir))
+    try:
+        await record_history(env, ctx)
+        summary = {}
+        for run_no in range(args.runs):
+            for enabled in ("0", "1"):
+                make_cold(scratch)
+                ctx["run"] = f"r{run_no}w{enabled}"
+                result = await cold_run(dict(env, WARMUP_ENABLED=enabled), ctx, args.rounds)
+                label = f"run {run_no + 1} warm-up {'on' if enabled == '1' else 'off'}"
+                summary.setdefault(enabled, []).append(report(label, *result))
+        print()
+        for enabled, runs in summary.items():
+            print(f"warm-up {'on ' if enabled == '1' else 'off'}: ready {statistics.median(r['ready'] for r in runs):.2f}s, "
+                  f"first round {statistics.median(r['firstRoundMs'] for r in runs):.1f}ms, "
+                  f"first fast round at {statistics.median(r['fastAt'] or float('inf') for r in runs):.2f}s")
+    finally:
+        shutil.rmtree(scratch.parent, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AyuSync cold-start benchmark")
+    parser.add_argument("--scale", default="1m", choices=list(bench_suite.SCALES))
+    parser.add_argument("--runs", type=int, default=2)
+    parser.add_argument("--rounds", type=int, default=30, help=f"at most {HISTORY_QUERIES}")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "ayusync-bench"))
+    asyncio.run(run(parser.parse_args()))
@@ -0,0 +1,115 @@
+# backend/bench/bench_export.py
+# Export of the problems table on a scratch database: the NDJSON stream of
+# /api/debug/problems against the gzip CSV and columnar exports, with
+# elapsed time, output size and peak Python memory (traced in a second
+# pass), plus a check that an
+# export interrupted and resumed with `after` yields exactly the full rows.
+#
+#   python -m bench.bench_export [rows]
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROWS = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+
+os.environ["AYUSYNC_DB"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from db import connection, init_db  # noqa: E402
+from export import ProblemExport  # noqa: E402
+from main import DEBUG_PROBLEMS  # noqa: E402
+from pagination import stream_ndjson  # noqa: E402
+from reference_data import load_reference_data  # noqa: E402
+
+
+def seed():
+    rng = random.Random(3)
+    now = int(time.time())
+    with connection() as conn:
+        namaste = [r[0] for r in conn.execute("SELECT code FROM namaste")]
+        conn.executemany(
+            "INSERT INTO problems(patient_id, namaste_code, icd_code, created_at) VALUES (?, ?, ?, ?)",
+            ((f"patient-{rng.randrange(ROWS // 10 or 1)}", rng.choice(namaste), f"B{rng.randrange(5000):04d}",
+              now - rng.randrange(365 * 86400)) for _ in range(ROWS)),
+        )
+
+
+def measure(label, produce):
+    start = time.perf_counter()
+    size = produce()
+    elapsed = time.perf_counter() - start
+    # second pass for memory: tracemalloc slows allocation too much to time under it
+    tracemalloc.start()
+    produce()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<26} {elapsed:6.2f}s  {ROWS / elapsed:9.0f} rows/s  {size / 2**20:7.1f} MiB  "
+          f"peak {peak / 2**20:5.1f} MiB")
+
+
+def debug_ndjson():
+    async def run():
+        size = 0
+        async for chunk in stream_ndjson(DEBUG_PROBLEMS, None, 1000):
+            size += len(chunk.encode())
+        return size
+    return asyncio.run(run())
+
+
+def export_size(fmt):
+    job, size = ProblemExport(fmt), 0
+    while (chunk := job.next_chunk()) is not None:
+        size += len(chunk)
+    return size
+
+
+def export(fmt, after=None, max_chunks=None):
+    job, parts = ProblemExport(fmt, after=after), []
+    while (chunk := job.next_chunk()) is not None:
+        parts.append(chunk)
+        if max_chunks and len(parts) == max_chunks:
+            break
+    return b"".join(parts)
+
+
+def csv_keys(data):
+    rows = list(csv.reader(io.StringIO(gzip.decompress(data).decode())))[1:]
+    return [(int(r[4]), int(r[0])) for r in rows]
+
+
+def columnar_rows(data):
+    dictionaries, rows = {}, 0
+    for line in gzip.decompress(data).decode().splitlines():
+        item = json.loads(line)
+        if "dictionary" in item:
+            dictionaries.setdefault(item["dictionary"], []).extend(item["values"])
+        else:
+            rows += item["rows"]
+    return rows, {k: len(v) for k, v in dictionaries.items()}
+
+
+if __name__ == "__main__":
+    init_db()
+    load_reference_data()
+    seed()
+    print(f"{ROWS} problems\n")
+    measure("debug NDJSON (uncompressed)", debug_ndjson)
+    measure("export csv.gz", lambda: export_size("csv"))
+    measure("export columnar.gz", lambda: export_size("columnar"))
+    print(f"\ncolumnar rows / dictionary sizes: {columnar_rows(export('columnar'))}")
+
+    # interrupt after two chunks (a truncated gzip stream), resume from the last complete row
+    partial = export("csv", max_chunks=2)
+    text = gzip.GzipFile(fileobj=io.BytesIO(partial)).read1(1 << 30).decode()
+    head = [line.split(",") for line in text.splitlines()[1:]]
+    head = head[:-1] if not text.endswith("\n") else head  # drop a cut-off last line
+    after = f"{head[-1][4]},{head[-1][0]}"
+    resumed = [(int(r[4]), int(r[0])) for r in head] + csv_keys(export("csv", after=after))
+    print(f"resumed after {len(head)} rows: {'identical' if resumed == csv_keys(export('csv')) else 'MISMATCH'}")
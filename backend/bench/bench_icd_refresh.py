@@ -0,0 +1,78 @@
+# backend/bench/bench_icd_refresh.py
+# Runs the background ICD cache refresher against a local WHO stub that
+# rate-limits (429) and fails (503) a share of requests, on a scratch
+# database of stale entries, and checks that every entry is refreshed,
+# most-hit first.
+#
+#   python -m bench.bench_icd_refresh [entries] [batch_size]
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+from bench import who_stub
+
+ENTRIES = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+
+
+class FlakyWHOHandler(who_stub.StubWHOHandler):
+    latency_ms = 10
+    failures = {429: 13, 503: 17}
+    entity_title = "Refreshed entity {}"
+
+
+BASE = who_stub.start(FlakyWHOHandler)
+os.environ.update(who_stub.env(BASE), AYUSYNC_DB=os.path.join(tempfile.mkdtemp(), "bench.db"),
+                  ICD_REFRESH_BACKOFF="0.05")
+
+import icd_client  # noqa: E402
+from db import connection, init_db  # noqa: E402
+from icd_refresh import ICDRefreshScheduler  # noqa: E402
+
+
+def seed():
+    init_db()
+    old = int(time.time()) - 30 * 86400
+    with connection() as conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO icd_cache(code, display, module, raw_json, last_synced) VALUES (?,?,?,?,?)",
+            [(f"http://id.who.int/icd/entity/{i}", f"Old title {i}", "05",
+              json.dumps({"id": f"http://id.who.int/icd/entity/{i}"}), old + i) for i in range(ENTRIES)],
+        )
+
+
+async def main():
+    seed()
+    refresher = ICDRefreshScheduler(batch_size=BATCH_SIZE, concurrency=8)
+    # the last few entries are the popular ones and must be refreshed first
+    hot = [f"http://id.who.int/icd/entity/{i}" for i in range(ENTRIES - 5, ENTRIES)]
+    refresher.record_hits(hot * 3)
+
+    start = time.perf_counter()
+    refreshed = await refresher.run_once()
+    with connection() as conn:
+        fresh = {r[0] for r in conn.execute("SELECT code FROM icd_cache WHERE display LIKE 'Refreshed%'")}
+    assert set(hot) <= fresh, "hot entries were not refreshed in the first batch"
+    print(f"cycle 1: {refreshed} refreshed, hot entries first: ok")
+
+    while refresher.progress["stale"] > 0:
+        refreshed = await refresher.run_once()
+        print(f"cycle {refresher.progress['cycles']}: {refreshed} refreshed, {refresher.progress['stale']} stale")
+        if not refreshed:
+            break
+    elapsed = time.perf_counter() - start
+
+    with connection() as conn:
+        left = conn.execute("SELECT COUNT(*) FROM icd_cache WHERE display NOT LIKE 'Refreshed%'").fetchone()[0]
+    status = refresher.status()
+    print(f"\n{ENTRIES} entries in {elapsed:.2f}s ({ENTRIES / elapsed:.0f}/s), {left} not refreshed")
+    print(f"stub requests={who_stub.counts['get']} 429s={who_stub.counts[429]} 503s={who_stub.counts[503]} "
+          f"retries={status['retries']} failed={status['failed']}")
+    await icd_client.close_who_client()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,108 @@
+# backend/bench/bench_icd_resolve.py
+# Batch ICD lookups against a local WHO stub (codeinfo + entity endpoints,
+# with latency and a share of 429/503 responses) on a scratch database:
+# concurrent overlapping batches must reach WHO once per code, and unknown
+# codes (also ones only concept_map knows) must come back resolved from
+# problem save and strict bundle upload, and the cache warm-up must fill
+# icd_cache for concept_map codes.
+#
+#   python -m bench.bench_icd_resolve [codes] [callers]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from bench import who_stub
+
+CODES = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+CALLERS = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+codeinfo_requests = who_stub.codeinfo
+
+
+class FlakyWHOHandler(who_stub.StubWHOHandler):
+    latency_ms = 20
+    failures = {429: 23, 503: 29}
+    entity_title = "Resolved {}"
+
+
+BASE = who_stub.start(FlakyWHOHandler)
+os.environ.update(who_stub.env(BASE), AYUSYNC_DB=os.path.join(tempfile.mkdtemp(), "bench.db"),
+                  ICD_RESOLVE_BACKOFF="0.05", ICD_REFRESH_ENABLED="0")
+
+import httpx  # noqa: E402
+import icd_client  # noqa: E402
+import main  # noqa: E402
+import problems  # noqa: E402
+from db import connection  # noqa: E402
+
+
+async def one_by_one(codes):
+    """The old shape of a lookup: one code after another"""
+    fetcher = icd_client.WHOFetcher(3, 0.05, 1)
+    token = await icd_client.get_who_token()
+    for code in codes:
+        await fetcher.entity(code, token)
+
+
+async def main_():
+    codes = [f"Z{i:04d}" for i in range(CODES)]
+    sample = codes[:50]
+    start = time.perf_counter()
+    await one_by_one(sample)
+    sequential = (time.perf_counter() - start) / len(sample)
+    codeinfo_requests.clear()
+
+    # overlapping batches: every code is asked for by about CALLERS/4 callers at once
+    batches = [codes[i::4] + ["NOPE-1"] for i in range(4)] * (CALLERS // 4)
+    start = time.perf_counter()
+    results = await asyncio.gather(*(icd_client.icd_resolver.resolve(b) for b in batches))
+    elapsed = time.perf_counter() - start
+    with connection() as conn:
+        cached = conn.execute("SELECT COUNT(*) FROM icd_cache WHERE display LIKE 'Resolved %'").fetchone()[0]
+    duplicates = sum(n - 1 for n in codeinfo_requests.values())
+    print(f"{CODES} codes in {len(batches)} overlapping batches: {elapsed:.2f}s "
+          f"(one by one: {sequential * CODES:.2f}s at {sequential * 1000:.0f}ms/code)")
+    print(f"  upstream codeinfo calls {sum(codeinfo_requests.values())} for {len(codeinfo_requests)} codes "
+          f"({duplicates} duplicates), 429s={who_stub.counts[429]} 503s={who_stub.counts[503]}")
+    print(f"  resolved per caller {sorted({len(r) for r in results})}, icd_cache rows {cached}, "
+          f"stats {icd_client.icd_resolver.stats}")
+    assert duplicates == 0 and cached == CODES and all(len(r) == CODES // 4 for r in results)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        r = await client.post("/api/problem-list", json={"patientId": "p1", "namasteCode": "NAM-001",
+                                                         "icdCodes": ["NEW-1"]})
+        display = r.json()["fhirCondition"]["code"]["coding"][1]["display"]
+        print(f"problem save with an unknown code: display {display!r}")
+        assert display == "Resolved NEW-1"
+
+        # a code picked from the concept map that icd_cache has not fetched yet
+        with connection() as conn:
+            mapped = [r[0] for r in conn.execute("""
+                SELECT DISTINCT icd_code FROM concept_map cm
+                WHERE NOT EXISTS (SELECT 1 FROM icd_cache c WHERE c.code = cm.icd_code) LIMIT 2""")]
+            fallback = problems.icd_displays(conn, {mapped[1]})[mapped[1]]
+        r = await client.post("/api/problem-list", json={"patientId": "p1", "namasteCode": "NAM-001",
+                                                         "icdCodes": [mapped[0]]})
+        display = r.json()["fhirCondition"]["code"]["coding"][1]["display"]
+        print(f"problem save with concept_map code {mapped[0]}: display {display!r}, "
+              f"codeinfo calls {codeinfo_requests[mapped[0]]}; without WHO {mapped[1]} shows {fallback!r}")
+        assert display == f"Resolved {mapped[0]}" and codeinfo_requests[mapped[0]] == 1
+        assert fallback != mapped[1]
+        bundle = {"resourceType": "Bundle", "entry": [{"resource": {
+            "resourceType": "Condition", "subject": {"reference": "Patient/p2"},
+            "code": {"coding": [{"system": "urn:namaste", "code": "NAM-002"},
+                                {"system": "http://who.int/icd11", "code": code}]}}} for code in ("NEW-2", "NOPE-2")]}
+        r = await client.post("/api/bundle?strict_icd=true", json=bundle)
+        print(f"strict bundle: saved {r.json()['saved']}, rejected {r.json()['rejected']} "
+              f"({[e['detail'] for e in r.json()['errors']]})")
+        r = await client.post("/api/icd/cache/warm")
+        warm = r.json()
+        print(f"cache warm: {warm['resolved']} of {warm['missing']} concept_map codes fetched into icd_cache")
+    await icd_client.close_who_client()
+
+
+if __name__ == "__main__":
+    main.startup()
+    asyncio.run(main_())
@@ -0,0 +1,89 @@
+# backend/bench/bench_namaste_fuzzy.py
+# Fuzzy NAMASTE search over synthetic transliterated terms: index build time
+# and memory, per-query latency and recall for misspelled/variant queries,
+# against a brute-force edit-distance scan of the whole vocabulary.
+#
+#   python -m bench.bench_namaste_fuzzy [terms] [queries]
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+from search_index import NamasteIndex, edit_distance, max_edits, normalize, phonetic
+
+TERMS = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+QUERIES = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+BRUTE_FORCE_QUERIES = 20
+
+CONSONANTS = ["k", "kh", "g", "gh", "ch", "j", "jh", "t", "th", "d", "dh", "n", "p", "ph", "b", "bh",
+              "m", "y", "r", "l", "v", "sh", "s", "h", "ksh", "tr", "pr", "shr"]
+VOWELS = ["a", "aa", "i", "ee", "u", "oo", "e", "ai", "o", "au", "ri"]
+
+
+def word(rng):
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(3, 5)))
+
+
+def variant(rng, term):
+    """A clinician's spelling: transliteration drift plus, sometimes, a typo"""
+    out = term
+    for a, b in (("aa", "a"), ("ee", "i"), ("oo", "u"), ("sh", "s"), ("th", "t"), ("dh", "d"), ("v", "w")):
+        if a in out and rng.random() < 0.5:
+            out = out.replace(a, b, 1)
+    if out.endswith("a") and rng.random() < 0.5:
+        out = out[:-1]
+    if len(out) > 6 and rng.random() < 0.5:
+        i = rng.randrange(1, len(out) - 1)
+        out = rng.choice([out[:i] + out[i + 1:],                       # deletion
+                          out[:i] + rng.choice("aeiou") + out[i + 1:],  # substitution
+                          out[:i] + out[i + 1] + out[i] + out[i + 2:]])  # transposition
+    return out
+
+
+def brute_force(vocab, term):
+    key = phonetic(normalize(term))
+    limit = max_edits(key)
+    return [t for t in vocab if edit_distance(key, phonetic(t), limit) <= limit]
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+if __name__ == "__main__":
+    rng = random.Random(42)
+    terms = list(dict.fromkeys(word(rng) for _ in range(int(TERMS * 1.05))))[:TERMS]
+    rows = [(f"NAM-F{i:06d}", term.capitalize(), "Bench") for i, term in enumerate(terms)]
+
+    index = NamasteIndex()
+    tracemalloc.start()
+    start = time.perf_counter()
+    index.build(rows)
+    build_s = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{len(terms)} terms indexed in {build_s:.1f}s, peak {peak / 2**20:.0f} MiB "
+          f"({len(index._keys)} phonetic keys, {len(index._deletes)} delete variants)\n")
+
+    targets = [rng.randrange(len(terms)) for _ in range(QUERIES)]
+    queries = [variant(rng, terms[i]) for i in targets]
+
+    exact_found = sum(1 for q, i in zip(queries, targets) if rows[i][:3] in index.search(q, 10))
+    latencies, found = [], 0
+    for q, i in zip(queries, targets):
+        t = time.perf_counter()
+        hits = index.search_fuzzy(q, 10)
+        latencies.append((time.perf_counter() - t) * 1000)
+        found += rows[i] in hits
+    print(f"exact search   recall@10 {exact_found / QUERIES:6.1%}")
+    print(f"fuzzy search   recall@10 {found / QUERIES:6.1%}  "
+          f"p50={statistics.median(latencies):.3f}ms p99={percentile(latencies, 99):.3f}ms")
+
+    vocab = list(index._postings)
+    t = time.perf_counter()
+    for q in queries[:BRUTE_FORCE_QUERIES]:
+        brute_force(vocab, q)
+    per_query = (time.perf_counter() - t) / BRUTE_FORCE_QUERIES * 1000
+    print(f"brute force    {per_query:.1f}ms/query (edit distance against every token)")
@@ -0,0 +1,51 @@
+# backend/bench/bench_problem_batch.py
+# Rows/sec for POST /api/problem-list (one call per problem) versus
+# POST /api/problem-list/batch, in-process against a scratch database.
+#
+#   python -m bench.bench_problem_batch [problems] [batch_size]
+import os
+import sys
+import tempfile
+import time
+
+PROBLEMS = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+BATCH_SIZE = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+ICD_PER_PROBLEM = 2
+
+os.environ["AYUSYNC_DB"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+
+from fastapi.testclient import TestClient  # noqa: E402
+import main  # noqa: E402
+
+
+def problems(n):
+    return [
+        {
+            "patientId": f"bench-{i % 500}",
+            "namasteCode": f"NAM-{(i % 10) + 1:03d}",
+            "icdCodes": ["5A10", "5A11"][:ICD_PER_PROBLEM],
+        }
+        for i in range(n)
+    ]
+
+
+def report(label, rows, elapsed):
+    print(f"{label:<28} {rows:>7} rows in {elapsed:6.2f}s  {rows / elapsed:10.0f} rows/s")
+
+
+if __name__ == "__main__":
+    data = problems(PROBLEMS)
+    rows = PROBLEMS * ICD_PER_PROBLEM
+    print(f"{PROBLEMS} problems x {ICD_PER_PROBLEM} ICD codes, batch size {BATCH_SIZE}\n")
+    with TestClient(main.app) as client:
+        start = time.perf_counter()
+        for problem in data:
+            client.post("/api/problem-list", json=problem).raise_for_status()
+        report("per-item /api/problem-list", rows, time.perf_counter() - start)
+
+        start = time.perf_counter()
+        for i in range(0, PROBLEMS, BATCH_SIZE):
+            r = client.post("/api/problem-list/batch", json={"problems": data[i:i + BATCH_SIZE]})
+            r.raise_for_status()
+            assert r.json()["saved"] == len(data[i:i + BATCH_SIZE])
+        report("/api/problem-list/batch", rows, time.perf_counter() - start)
@@ -0,0 +1,99 @@
+# backend/bench/bench_responses.py
+# Requests/sec for the terminology endpoints before and after the response
+# cache: the previous handlers (lists of dicts through the default
+# JSONResponse, SQLite on every empty ICD query) against the cached bytes,
+# and against conditional requests answered with 304.
+#
+#   python -m bench.bench_responses [requests] [namaste_codes]
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+NAMASTE_CODES = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+
+os.environ["AYUSYNC_DB"] = os.path.join(tempfile.mkdtemp(), "bench.db")
+os.environ["ICD_REFRESH_ENABLED"] = "0"
+
+import httpx  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+
+import main  # noqa: E402
+from db import fetch_all, run_db  # noqa: E402
+from search_index import namaste_index  # noqa: E402
+
+QUERIES = ["vata", "pitta", "kapha", "roga", "jwara", "shotha", "nam", "dosha"]
+
+
+# The handlers as they were before the response cache
+@main.app.get("/bench/baseline/namaste/search")
+async def baseline_namaste(q: str = ""):
+    rows = namaste_index.search(q, limit=50)
+    return JSONResponse([
+        {"code": code, "display": display, "category": category, "system": "urn:namaste"}
+        for code, display, category in rows
+    ])
+
+
+@main.app.get("/bench/baseline/icd/search")
+async def baseline_icd():
+    rows = await run_db(fetch_all, "SELECT code, display, module FROM icd_cache LIMIT 10")
+    return JSONResponse([dict(r) for r in rows])
+
+
+def seed():
+    main.startup()
+    words = ["Vata", "Pitta", "Kapha", "Roga", "Jwara", "Shotha", "Dosha", "Vikara"]
+    namaste_index.add_many(
+        (f"NAM-B{i:05d}", f"{words[i % 8]} {words[(i // 8) % 8]} condition {i}", "Bench")
+        for i in range(NAMASTE_CODES)
+    )
+    from icd_client import write_icd_rows, _icd_row
+    write_icd_rows([_icd_row(f"B{i:04d}", f"Bench ICD entity {i}", "Biomed", {}) for i in range(10)])
+
+
+async def rate(client, label, path_for, headers_for=None):
+    start = time.perf_counter()
+    statuses = set()
+    for i in range(REQUESTS):
+        headers = headers_for(i) if headers_for else None
+        r = await client.get(path_for(i), headers=headers)
+        statuses.add(r.status_code)
+    elapsed = time.perf_counter() - start
+    print(f"{label:<40} {REQUESTS / elapsed:9.0f} req/s  status={sorted(statuses)}")
+
+
+async def bench():
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        etags = {}
+        for q in QUERIES:
+            etags[q] = (await client.get("/api/namaste/search", params={"q": q})).headers["etag"]
+        icd_etag = (await client.get("/api/icd/search")).headers["etag"]
+        cm_etag = (await client.get("/api/concept-map/NAM-001")).headers["etag"]
+
+        q = lambda i: QUERIES[i % len(QUERIES)]  # noqa: E731
+        print(f"NAMASTE search ({NAMASTE_CODES} codes, up to 50 results)")
+        await rate(client, "  before: dicts + JSONResponse", lambda i: f"/bench/baseline/namaste/search?q={q(i)}")
+        await rate(client, "  after: cached bytes (200)", lambda i: f"/api/namaste/search?q={q(i)}")
+        await rate(client, "  after: If-None-Match (304)", lambda i: f"/api/namaste/search?q={q(i)}",
+                   lambda i: {"If-None-Match": etags[q(i)]})
+
+        print("Empty-query ICD search")
+        await rate(client, "  before: SQLite + JSONResponse", lambda i: "/bench/baseline/icd/search")
+        await rate(client, "  after: cached bytes (200)", lambda i: "/api/icd/search")
+        await rate(client, "  after: If-None-Match (304)", lambda i: "/api/icd/search",
+                   lambda i: {"If-None-Match": icd_etag})
+
+        print("Concept map")
+        await rate(client, "  pre-rendered bytes (200)", lambda i: "/api/concept-map/NAM-001")
+        await rate(client, "  If-None-Match (304)", lambda i: "/api/concept-map/NAM-001",
+                   lambda i: {"If-None-Match": cm_etag})
+
+
+if __name__ == "__main__":
+    seed()
+    asyncio.run(bench())
+    main.shutdown_db()
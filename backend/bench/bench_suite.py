@@ -0,0 +1,407 @@
+# backend/bench/bench_suite.py
+# Reproducible benchmark of every API endpoint over synthetic datasets.
+#
+#   python -m bench.bench_suite [--scales 1k,100k,1m] [--modes inproc,http]
+#                               [--requests 200] [--clients 8] [--output bench_results.json]
+#                               [--compare previous.json] [--threshold 0.2]
+#
+# For each scale a seeded dataset (NAMASTE codes, icd_cache entries, two
+# mappings per code, problems) is generated once and cached in --data-dir;
+# NAMASTE and concept_map go through reference_data like real source files.
+# Each (scale, mode) then runs in its own process on a fresh copy of that
+# database, with the WHO API replaced by a local stub:
+#
+#   inproc  requests through httpx.ASGITransport, no network or server
+#   http    a `uvicorn main:app` subprocess driven over localhost
+#
+# Every endpoint gets --requests requests from --clients concurrent clients
+# (HEAVY endpoints get HEAVY_REQUESTS, one at a time). Results are written as
+# JSON: requests/s, latency p50/p90/p99/max, status codes, peak RSS of the
+# process serving the requests, and the commit, Python and SQLite versions.
+# --compare prints the change against an earlier result file and exits 1
+# when throughput or p99 regressed by more than --threshold.
+import argparse
+import asyncio
+import csv
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench import who_stub
+
+BACKEND = Path(__file__).resolve().parent.parent
+# rows per table; NAMASTE stops at 100k (the in-memory search index for a
+# real-world vocabulary is tens of thousands of codes and 1M does not fit
+# in a small box), the other tables grow to the full scale
+SCALES = {
+    "1k": {"namaste": 1_000, "icd": 1_000, "problems": 1_000},
+    "100k": {"namaste": 100_000, "icd": 100_000, "problems": 100_000},
+    "1m": {"namaste": 100_000, "icd": 1_000_000, "problems": 1_000_000},
+}
+# bump when the generated data changes, so cached datasets are rebuilt
+DATASET_VERSION = 1
+SEED = 20240101
+HEAVY_REQUESTS = 3
+PORT = 8766
+
+CATEGORIES = ["Dosha", "Metabolic", "Respiratory", "Digestive", "Musculoskeletal", "Skin", "Mental", "Fever"]
+MODULES = ["TM2", "Biomedical"]
+CONSONANTS = ["k", "kh", "g", "ch", "j", "t", "th", "d", "dh", "n", "p", "ph", "b", "bh",
+              "m", "y", "r", "l", "v", "sh", "s", "h", "tr", "pr"]
+VOWELS = ["a", "aa", "i", "ee", "u", "oo", "e", "ai", "o"]
+ENGLISH = ["acute", "chronic", "disorder", "syndrome", "fever", "pain", "infection", "deficiency",
+           "inflammation", "of", "the", "upper", "lower", "tract", "joint", "skin", "bowel", "liver"]
+
+
+# ------------------- Dataset -------------------
+def word(rng):
+    return "".join(rng.choice(CONSONANTS) + rng.choice(VOWELS) for _ in range(rng.randint(2, 4)))
+
+
+def dataset_paths(data_dir, scale):
+    base = Path(data_dir) / f"{scale}-v{DATASET_VERSION}"
+    return base, base / "ayusync.db", base / "reference", base / "context.json"
+
+
+def generate(data_dir, scale):
+    """Build the cached dataset for `scale` (run in a child process: db reads AYUSYNC_DB at import)"""
+    sizes = SCALES[scale]
+    base, db_path, ref_dir, ctx_path = dataset_paths(data_dir, scale)
+    os.environ["AYUSYNC_DB"] = str(db_path)
+    import analytics
+    import mapping_suggest
+    from db import connection, init_db
+    from reference_data import load_reference_data
+
+    rng = random.Random(SEED)
+    start = time.perf_counter()
+    ref_dir.mkdir(parents=True, exist_ok=True)
+    namaste = [(f"NAM-B{i:07d}", f"{word(rng).capitalize()} {word(rng)}", rng.choice(CATEGORIES))
+               for i in range(sizes["namaste"])]
+    icd = [(f"X{i:06X}", " ".join(rng.choice(ENGLISH) for _ in range(rng.randint(2, 5))).capitalize(),
+            rng.choice(MODULES)) for i in range(sizes["icd"])]
+    with open(ref_dir / "namaste.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["code", "display", "category"])
+        writer.writerows(namaste)
+    with open(ref_dir / "concept_map.csv", "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["namaste_code", "icd_code", "icd_display", "module", "confidence", "mapping_type"])
+        for code, _, _ in namaste:
+            for i in rng.sample(range(len(icd)), 2):
+                writer.writerow([code, icd[i][0], icd[i][1], icd[i][2], rng.randint(50, 99), "automatic"])
+
+    init_db()
+    load_reference_data(ref_dir)
+    now = int(time.time())
+    with connection() as conn:
+        conn.executemany(
+            "INSERT INTO icd_cache(code, display, module, raw_json, last_synced) VALUES (?, ?, ?, ?, ?)",
+            [(code, display, module, json.dumps({"id": f"http://id.who.int/icd/entity/{i}"}), now)
+             for i, (code, display, module) in enumerate(icd)],
+        )
+        patients = sizes["problems"] // 10
+        rows = []
+        while len(rows) < sizes["problems"]:
+            patient = f"patient-{rng.randrange(patients)}"
+            created = now - rng.randrange(365 * 86400)
+            namaste_code = rng.choice(namaste)[0]
+            for i in rng.sample(range(len(icd)), rng.randint(1, 3)):
+                rows.append((patient, namaste_code, icd[i][0], created))
+        conn.executemany("INSERT INTO problems(patient_id, namaste_code, icd_code, created_at) VALUES (?, ?, ?, ?)",
+                         rows[:sizes["problems"]])
+        # steady state for suggestions: every code already scored against this icd_cache
+        conn.executemany("INSERT INTO mapping_suggest_state(namaste_code, fingerprint, computed_at) VALUES (?, ?, ?)",
+                         [(code, mapping_suggest._fingerprint(display), now) for code, display, _ in namaste])
+        conn.execute("""INSERT INTO mapping_suggest_runs(icd_watermark, codes, suggestions, backend, elapsed_ms, ran_at)
+                        VALUES (?, 0, 0, 'bench', 0, ?)""", (mapping_suggest._icd_watermark(conn), now))
+    analytics.rebuild_rollups()
+    with connection() as conn:
+        conn.execute("ANALYZE")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    sample = rng.sample(range(len(namaste)), 200)
+    context = {
+        "scale": scale, "rows": sizes, "generatedSeconds": round(time.perf_counter() - start, 1),
+        "namasteCodes": [namaste[i][0] for i in sample],
+        "namasteTerms": [namaste[i][1].split()[0][:5].lower() for i in sample],
+        "icdCodes": [icd[i][0] for i in sample],
+        "icdTerms": [" ".join(icd[i][1].split()[:2]).lower() for i in sample],
+        "patients": sorted({r[0] for r in rows[:1000]}),
+    }
+    ctx_path.write_text(json.dumps(context))
+
+
+def ensure_dataset(args, scale):
+    base, db_path, _, ctx_path = dataset_paths(args.data_dir, scale)
+    if not ctx_path.exists():
+        print(f"Generating {scale} dataset in {base} ...", flush=True)
+        shutil.rmtree(base, ignore_errors=True)
+        subprocess.run([sys.executable, "-m", "bench.bench_suite", "--generate", scale, "--data-dir", args.data_dir],
+                       cwd=BACKEND, check=True)
+    return json.loads(ctx_path.read_text())
+
+
+# ------------------- WHO stub -------------------
+def start_who_stub(handler=who_stub.StubWHOHandler):
+    return dict(who_stub.env(who_stub.start(handler)), ICD_REFRESH_ENABLED="0")
+
+
+# ------------------- Endpoints -------------------
+def bundle_body(ctx, i):
+    entries = [{"resource": {
+        "resourceType": "Condition",
+        "subject": {"reference": f"Patient/bench-bundle-{i}"},
+        "code": {"coding": [
+            {"system": "urn:namaste", "code": ctx["namasteCodes"][(i + j) % len(ctx["namasteCodes"])]},
+            {"system": "http://who.int/icd11", "code": ctx["icdCodes"][(i + j) % len(ctx["icdCodes"])]},
+        ]},
+    }} for j in range(10)]
+    return {"resourceType": "Bundle", "type": "collection", "entry": entries}
+
+
+def pick(values, i):
+    return values[i % len(values)]
+
+
+# (name, method, path(ctx, i), json body(ctx, i) or None, heavy). The
+# heavy ones go first: suggestions are measured in their steady state (the
+# dataset is already scored), before ICD searches add entries to icd_cache
+# and make the next run a full rescore.
+ENDPOINTS = [
+    ("concept-map-suggest", "POST", lambda c, i: "/api/concept-map/suggest", None, True),
+    ("reference-reload", "POST", lambda c, i: "/api/reference/reload", None, True),
+    ("root", "GET", lambda c, i: "/", None, False),
+    ("namaste-search", "GET", lambda c, i: f"/api/namaste/search?q={pick(c['namasteTerms'], i)}", None, False),
+    ("namaste-search-fuzzy", "GET",
+     lambda c, i: f"/api/namaste/search?q={pick(c['namasteTerms'], i)}a&mode=fuzzy", None, False),
+    ("icd-search", "GET", lambda c, i: f"/api/icd/search?q={pick(c['icdTerms'], i)}", None, False),
+    ("icd-search-default", "GET", lambda c, i: "/api/icd/search", None, False),
+    ("icd-search-cache-stats", "GET", lambda c, i: "/api/icd/search/cache-stats", None, False),
+    ("response-cache-stats", "GET", lambda c, i: "/api/response-cache/stats", None, False),
+    ("icd-cache-sync-status", "GET", lambda c, i: "/api/icd/cache/sync", None, False),
+    ("icd-cache-sync-trigger", "POST", lambda c, i: "/api/icd/cache/sync", None, False),
+    ("unified-search", "GET", lambda c, i: f"/api/search/unified?q={pick(c['namasteTerms'], i)}", None, False),
+    ("concept-map", "GET", lambda c, i: f"/api/concept-map/{pick(c['namasteCodes'], i)}", None, False),
+    ("concept-map-bulk", "POST", lambda c, i: "/api/concept-map/bulk",
+     lambda c, i: {"codes": [pick(c["namasteCodes"], i + j) for j in range(50)]}, False),
+    ("problem-create", "POST", lambda c, i: "/api/problem-list",
+     lambda c, i: {"patientId": pick(c["patients"], i), "namasteCode": pick(c["namasteCodes"], i),
+                   "icdCodes": [pick(c["icdCodes"], i)]}, False),
+    ("problem-batch", "POST", lambda c, i: "/api/problem-list/batch",
+     lambda c, i: {"problems": [{"patientId": pick(c["patients"], i + j), "namasteCode": pick(c["namasteCodes"], i + j),
+                                 "icdCodes": [pick(c["icdCodes"], i + j)]} for j in range(50)]}, False),
+    ("patient-problems", "GET", lambda c, i: f"/api/patients/{pick(c['patients'], i)}/problems", None, False),
+    ("analytics-categories", "GET", lambda c, i: "/api/analytics/categories", None, False),
+    ("analytics-top-icd", "GET", lambda c, i: "/api/analytics/top-icd?limit=20", None, False),
+    ("analytics-daily", "GET", lambda c, i: "/api/analytics/daily", None, False),
+    ("bundle", "POST", lambda c, i: "/api/bundle", bundle_body, False),
+    ("export-problems-30d", "GET",
+     lambda c, i: f"/api/export/problems?format=columnar&from={time.strftime('%Y-%m-%d', time.gmtime(time.time() - 30 * 86400))}",
+     None, True),
+    ("logs-recent", "GET", lambda c, i: "/api/logs/recent", None, False),
+    ("metrics-routes", "GET", lambda c, i: "/api/metrics/routes", None, False),
+    ("metrics-prometheus", "GET", lambda c, i: "/metrics", None, False),
+    ("debug-problems", "GET", lambda c, i: "/api/debug/problems?limit=100", None, False),
+    ("debug-concept-map", "GET", lambda c, i: "/api/debug/concept-map?limit=100", None, False),
+    ("debug-namaste", "GET", lambda c, i: "/api/debug/namaste?limit=100", None, False),
+    ("debug-icd-cache", "GET", lambda c, i: "/api/debug/icd-cache?limit=100", None, False),
+]
+
+
+def percentile(ordered, pct):
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def drive(client, ctx, requests, clients, only=None):
+    results = []
+    for name, method, path, body, heavy in ENDPOINTS:
+        if only and name not in only:
+            continue
+        count, concurrency = (HEAVY_REQUESTS, 1) if heavy else (requests, clients)
+        latencies, statuses = [], {}
+
+        async def one_client(c):
+            for i in range(c, count, concurrency):
+                start = time.perf_counter()
+                r = await client.request(method, path(ctx, i), json=body(ctx, i) if body else None)
+                await r.aread()
+                latencies.append((time.perf_counter() - start) * 1000)
+                statuses[str(r.status_code)] = statuses.get(str(r.status_code), 0) + 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one_client(c) for c in range(concurrency)))
+        elapsed = time.perf_counter() - start
+        ordered = sorted(latencies)
+        results.append({
+            "endpoint": name, "method": method, "requests": count, "clients": concurrency,
+            "rps": round(count / elapsed, 2),
+            "p50Ms": round(percentile(ordered, 50), 3), "p90Ms": round(percentile(ordered, 90), 3),
+            "p99Ms": round(percentile(ordered, 99), 3), "maxMs": round(ordered[-1], 3),
+            "statuses": statuses,
+            "errors": sum(n for s, n in statuses.items() if not s.startswith(("2", "3"))),
+        })
+        print(f"  {name:<24} {results[-1]['rps']:9.1f} req/s  p50={results[-1]['p50Ms']:8.2f}ms "
+              f"p99={results[-1]['p99Ms']:8.2f}ms  {statuses}", file=sys.stderr, flush=True)
+    return results
+
+
+# ------------------- Runs -------------------
+def scratch_copy(args, scale):
+    _, db_path, ref_dir, _ = dataset_paths(args.data_dir, scale)
+    scratch = Path(tempfile.mkdtemp(prefix=f"ayusync-bench-{scale}-")) / "ayusync.db"
+    shutil.copyfile(db_path, scratch)
+    return scratch, ref_dir
+
+
+def peak_rss_mb(pid=None):
+    if pid is None:
+        return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    try:
+        for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+            if line.startswith("VmHWM:"):
+                return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return None
+
+
+async def run_inproc(args, ctx):
+    import httpx
+    import main
+
+    start = time.perf_counter()
+    async with main.app.router.lifespan_context(main.app):
+        startup_s = time.perf_counter() - start
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            results = await drive(client, ctx, args.requests, args.clients, args.only)
+    return results, startup_s, peak_rss_mb()
+
+
+async def run_http(args, ctx):
+    import httpx
+
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT),
+                               "--log-level", "warning"], cwd=BACKEND, env=os.environ.copy())
+    try:
+        limits = httpx.Limits(max_connections=args.clients)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=600) as client:
+            while True:
+                if server.poll() is not None:
+                    raise RuntimeError(f"server exited with {server.returncode}")
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.2)
+            startup_s = time.perf_counter() - start
+            results = await drive(client, ctx, args.requests, args.clients, args.only)
+        return results, startup_s, peak_rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait(timeout=60)
+
+
+def run_one(args):
+    """Child process: one (scale, mode) run, JSON on stdout"""
+    ctx = ensure_dataset(args, args.scale)
+    scratch, ref_dir = scratch_copy(args, args.scale)
+    os.environ.update(start_who_stub(), AYUSYNC_DB=str(scratch), REFERENCE_DATA_DIR=str(ref_dir))
+    runner = run_inproc if args.mode == "inproc" else run_http
+    results, startup_s, rss = asyncio.run(runner(args, ctx))
+    shutil.rmtree(scratch.parent, ignore_errors=True)
+    print(json.dumps({"scale": args.scale, "mode": args.mode, "rows": ctx["rows"],
+                      "startupSeconds": round(startup_s, 2), "peakRssMb": rss, "endpoints": results}))
+
+
+def metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(), "cpus": os.cpu_count(),
+        "requests": args.requests, "clients": args.clients, "heavyRequests": HEAVY_REQUESTS,
+        "seed": SEED, "datasetVersion": DATASET_VERSION,
+    }
+
+
+def compare(current, previous_path, threshold):
+    """Print per-endpoint changes against an earlier result file; True if anything regressed"""
+    previous = json.loads(Path(previous_path).read_text())
+    before = {(r["scale"], r["mode"], e["endpoint"]): e for r in previous["runs"] for e in r["endpoints"]}
+    print(f"\nCompared with {previous['meta'].get('commit')} ({previous_path}), threshold {threshold:.0%}:")
+    regressed = False
+    for run in current["runs"]:
+        for e in run["endpoints"]:
+            old = before.get((run["scale"], run["mode"], e["endpoint"]))
+            if old is None:
+                continue
+            rps = e["rps"] / old["rps"] - 1
+            p99 = e["p99Ms"] / old["p99Ms"] - 1 if old["p99Ms"] else 0
+            bad = rps < -threshold or p99 > threshold
+            regressed |= bad
+            print(f"  {'REGRESSED' if bad else 'ok':<9} {run['scale']:>5} {run['mode']:<6} {e['endpoint']:<24} "
+                  f"req/s {rps:+7.1%}  p99 {p99:+7.1%}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AyuSync backend benchmark suite")
+    parser.add_argument("--scales", default="1k", help=f"comma-separated, from {','.join(SCALES)}")
+    parser.add_argument("--modes", default="inproc,http", help="comma-separated: inproc, http")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--clients", type=int, default=8, help="concurrent clients")
+    parser.add_argument("--only", default="", help="comma-separated endpoint names")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "ayusync-bench"))
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--generate", help=argparse.SUPPRESS)
+    parser.add_argument("--scale", help=argparse.SUPPRESS)
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    args.only = set(filter(None, args.only.split(",")))
+
+    if args.generate:
+        return generate(args.data_dir, args.generate)
+    if args.scale:
+        return run_one(args)
+
+    report = {"meta": metadata(args), "runs": []}
+    for scale in args.scales.split(","):
+        if scale not in SCALES:
+            parser.error(f"unknown scale {scale}")
+        ctx = ensure_dataset(args, scale)
+        for mode in args.modes.split(","):
+            print(f"{scale} {ctx['rows']}, {mode}:", file=sys.stderr, flush=True)
+            cmd = [sys.executable, "-m", "bench.bench_suite", "--scale", scale, "--mode", mode, "--data-dir", args.data_dir,
+                   "--requests", str(args.requests), "--clients", str(args.clients), "--only", ",".join(args.only)]
+            out = subprocess.run(cmd, cwd=BACKEND, check=True, stdout=subprocess.PIPE, text=True).stdout
+            run = json.loads(out.strip().splitlines()[-1])
+            run["datasetSeconds"] = ctx["generatedSeconds"]
+            report["runs"].append(run)
+            print(f"  startup {run['startupSeconds']}s, peak RSS {run['peakRssMb']} MiB", file=sys.stderr)
+
+    Path(args.output).write_text(json.dumps(report, indent=2))
+    print(f"Wrote {args.output}")
+    if args.compare and compare(report, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+# backend/bench/bench_who_client.py
+# Compares the old per-call httpx.AsyncClient against the shared WHO client,
+# using a local stub of the WHO token and search endpoints.
+#
+#   python -m bench.bench_who_client [requests] [handshake_ms]
+#
+# handshake_ms is added once per new TCP connection to stand in for the
+# TCP+TLS setup cost to id.who.int that keep-alive pooling avoids.
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+from bench import who_stub
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+HANDSHAKE_MS = float(sys.argv[2]) if len(sys.argv) > 2 else 20.0
+CONCURRENCY = 10
+
+
+class HandshakeWHOHandler(who_stub.StubWHOHandler):
+    handshake_ms = HANDSHAKE_MS
+    token_ms = 50  # slow token endpoint widens the stampede window
+
+
+BASE = who_stub.start(HandshakeWHOHandler)
+os.environ.update(who_stub.env(BASE), AYUSYNC_DB=os.path.join(tempfile.mkdtemp(), "bench.db"))
+
+import httpx  # noqa: E402
+import icd_client  # noqa: E402  (reads the WHO_* settings above)
+import shared_state  # noqa: E402
+from db import init_db  # noqa: E402
+
+
+async def per_call_search(query):
+    """The previous behaviour: a new client (and connection) per call"""
+    token = await icd_client.get_who_token()
+    async with httpx.AsyncClient() as client:
+        r = await client.get(f"{BASE}/icd/release/11/mms/search", params={"q": query},
+                             headers={"Authorization": f"Bearer {token}"}, timeout=10)
+        r.raise_for_status()
+        return r.json()
+
+
+async def timed(fn, n):
+    latencies = []
+    sem = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i):
+        async with sem:
+            start = time.perf_counter()
+            await fn(f"term{i % 20}")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(n)))
+    return latencies, time.perf_counter() - start
+
+
+def report(label, latencies, elapsed):
+    ordered = sorted(latencies)
+    p99 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))]
+    print(f"{label:<22} mean={statistics.mean(latencies):7.2f}ms p50={statistics.median(latencies):7.2f}ms "
+          f"p99={p99:7.2f}ms req/s={len(latencies) / elapsed:8.1f}")
+
+
+async def token_stampede(n=50):
+    """n concurrent searches arriving with an expired token"""
+    icd_client.WHO_TOKEN, icd_client.WHO_TOKEN_EXPIRES = None, 0
+    shared_state.put("who_token", None)
+    who_stub.counts["token"] = 0
+    await asyncio.gather(*(icd_client.search_who_icd("stampede") for _ in range(n)))
+    return who_stub.counts["token"]
+
+
+async def main():
+    print(f"Stub WHO server at {BASE}; {REQUESTS} searches, concurrency {CONCURRENCY}, "
+          f"{HANDSHAKE_MS:.0f}ms per new connection\n")
+    await icd_client.get_who_token()
+
+    report("per-call AsyncClient", *await timed(per_call_search, REQUESTS))
+    report("shared AsyncClient", *await timed(lambda q: icd_client.search_who_icd(q), REQUESTS))
+
+    print(f"\nToken refreshes for 50 concurrent searches on expiry: {await token_stampede()}")
+    await icd_client.close_who_client()
+
+
+if __name__ == "__main__":
+    init_db()
+    asyncio.run(main())
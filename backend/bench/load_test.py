@@ -0,0 +1,78 @@
+# backend/bench/load_test.py
+# Measures /api/namaste/search latency with and without concurrent
+# /api/problem-list writes. Run against a live server: python main.py
+#
+#   python -m bench.load_test
+import asyncio
+import statistics
+import sys
+import time
+
+import httpx
+
+BASE_URL = "http://localhost:8000"
+SEARCH_TERMS = ["vata", "pitta", "madhu", "grahani", "nam-00", "rhin", "bowel", "kapha"]
+SEARCHES = 2000
+SEARCH_CLIENTS = 20
+WRITERS = 10
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def run_searches(client, count, latencies):
+    for i in range(count):
+        q = SEARCH_TERMS[i % len(SEARCH_TERMS)]
+        start = time.perf_counter()
+        r = await client.get(f"{BASE_URL}/api/namaste/search", params={"q": q})
+        latencies.append((time.perf_counter() - start) * 1000)
+        r.raise_for_status()
+
+
+async def run_writer(client, stop, written):
+    n = 0
+    while not stop.is_set():
+        r = await client.post(f"{BASE_URL}/api/problem-list", json={
+            "patientId": f"load-test-{n % 50}",
+            "namasteCode": "NAM-004",
+            "icdCodes": ["5A10", "5A11"],
+        })
+        r.raise_for_status()
+        written.append(1)
+        n += 1
+
+
+async def measure(with_writes):
+    latencies, written = [], []
+    stop = asyncio.Event()
+    limits = httpx.Limits(max_connections=SEARCH_CLIENTS + WRITERS)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        writers = [asyncio.create_task(run_writer(client, stop, written))
+                   for _ in range(WRITERS if with_writes else 0)]
+        start = time.perf_counter()
+        await asyncio.gather(*(run_searches(client, SEARCHES // SEARCH_CLIENTS, latencies)
+                               for _ in range(SEARCH_CLIENTS)))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await asyncio.gather(*writers)
+
+    label = "with writes" if with_writes else "reads only "
+    print(f"{label}: p50={statistics.median(latencies):7.2f}ms "
+          f"p95={percentile(latencies, 95):7.2f}ms p99={percentile(latencies, 99):7.2f}ms "
+          f"searches/s={len(latencies) / elapsed:8.1f} writes/s={len(written) / elapsed:7.1f}")
+    return percentile(latencies, 99)
+
+
+async def main():
+    print(f"Load testing {BASE_URL} ({SEARCHES} searches, {SEARCH_CLIENTS} clients, {WRITERS} writers)")
+    baseline = await measure(with_writes=False)
+    loaded = await measure(with_writes=True)
+    print(f"\np99 ratio under writes: {loaded / baseline:.2f}x")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        BASE_URL = sys.argv[1]
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+# backend/bench/load_test_workers.py
+# Throughput of `uvicorn main:app --workers N` for N = 1, 2, 4 against a
+# stub WHO server, on a scratch database. Also counts how many token and
+# search requests reach WHO: with the token and query cache shared through
+# SQLite, that stays at one token fetch and one search per distinct query
+# however many workers are running.
+#
+#   python -m bench.load_test_workers [requests] [workers ...]
+#
+# Scaling is bounded by the cores available (os.cpu_count() is printed).
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import httpx
+
+from bench import who_stub
+
+REQUESTS = int(sys.argv[1]) if len(sys.argv) > 1 else 4000
+WORKER_COUNTS = [int(n) for n in sys.argv[2:]] or [1, 2, 4]
+CLIENTS = 32
+PORT = 8765
+NAMASTE_TERMS = ["vata", "pitta", "kapha", "jwara", "grahani", "madhu", "nam-00", "kasa"]
+ICD_TERMS = [f"stub term {i}" for i in range(16)]
+BACKEND = Path(__file__).resolve().parent.parent
+
+
+class SlowWHOHandler(who_stub.StubWHOHandler):
+    token_ms = 50
+    latency_ms = 20
+
+
+def start_server(workers, who_base):
+    env = dict(os.environ, **who_stub.env(who_base),
+               AYUSYNC_DB=os.path.join(tempfile.mkdtemp(), "load.db"),
+               ICD_REFRESH_ENABLED="0")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(PORT), "--workers", str(workers),
+         "--log-level", "warning"],
+        cwd=BACKEND, env=env,
+    )
+
+
+async def wait_ready(client, proc):
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"server exited with {proc.returncode}")
+        try:
+            if (await client.get("/api/namaste/search", params={"q": "vata"})).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("server did not start")
+
+
+async def drive(client):
+    statuses = {}
+
+    async def one_client(c):
+        for i in range(c, REQUESTS, CLIENTS):
+            if i % 4 == 3:
+                r = await client.get("/api/icd/search", params={"q": ICD_TERMS[(i // 4) % len(ICD_TERMS)]})
+            else:
+                r = await client.get("/api/namaste/search", params={"q": NAMASTE_TERMS[i % len(NAMASTE_TERMS)]})
+            statuses[r.status_code] = statuses.get(r.status_code, 0) + 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_client(c) for c in range(CLIENTS)))
+    return REQUESTS / (time.perf_counter() - start), statuses
+
+
+async def run(workers, who_base):
+    who_stub.counts.clear()
+    proc = start_server(workers, who_base)
+    try:
+        limits = httpx.Limits(max_connections=CLIENTS)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+            await wait_ready(client, proc)
+            rate, statuses = await drive(client)
+    finally:
+        proc.terminate()
+        proc.wait(timeout=30)
+    return rate, statuses
+
+
+async def main():
+    who_base = who_stub.start(SlowWHOHandler)
+    print(f"{REQUESTS} requests, {CLIENTS} clients, {os.cpu_count()} CPUs; "
+          f"{len(ICD_TERMS)} distinct WHO queries\n")
+    baseline = None
+    for workers in WORKER_COUNTS:
+        rate, statuses = await run(workers, who_base)
+        baseline = baseline or rate
+        print(f"workers={workers}  {rate:8.0f} req/s  x{rate / baseline:4.2f}  "
+              f"WHO token fetches={who_stub.counts['token']} searches={who_stub.counts['search']}  "
+              f"status={statuses}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,99 @@
+# backend/bench/who_stub.py
+"""Local stand-in for the WHO ICD-11 API, shared by the benchmarks.
+
+StubWHOHandler answers the token endpoint (POST) and three kinds of GET:
+searches (a fixed page of ten entities), codeinfo lookups (codes starting
+with NOPE are unknown) and entities (titled `entity_title`). Benchmarks
+subclass it and set class attributes for latency, per-connection
+handshake cost or a share of 429/503 answers; `counts` tallies what
+reached the stub.
+
+    base = who_stub.start(SlowHandler)
+    os.environ.update(who_stub.env(base))
+"""
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# "token", "search", "codeinfo", "entity", "get" (every GET) and per status
+# code for injected failures
+counts = Counter()
+# codeinfo lookups per code
+codeinfo = Counter()
+
+SEARCH_PAYLOAD = json.dumps({"destinationEntities": [
+    {"id": f"http://id.who.int/icd/entity/stub{i}", "theCode": f"S{i:03d}",
+     "title": {"value": f"Stub entity {i}"}, "chapter": "05"} for i in range(10)
+]}).encode()
+
+
+class StubWHOHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive
+    disable_nagle_algorithm = True
+
+    handshake_ms = 0      # once per new connection, standing in for TCP+TLS setup
+    token_ms = 0          # per token request
+    latency_ms = 0        # per GET
+    failures = {}         # {status: n}: every n-th GET is answered with status
+    entity_title = "Stub entity {}"
+
+    def setup(self):
+        time.sleep(self.handshake_ms / 1000)
+        super().setup()
+
+    def _send(self, status, body, headers=()):
+        self.send_response(status)
+        for name, value in headers:
+            self.send_header(name, value)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        counts["token"] += 1
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.token_ms / 1000)
+        self._send(200, json.dumps({"access_token": "stub-token", "expires_in": 3600}).encode())
+
+    def do_GET(self):
+        counts["get"] += 1
+        n = counts["get"]
+        time.sleep(self.latency_ms / 1000)
+        for status, every in self.failures.items():
+            if n % every == 0:
+                counts[status] += 1
+                return self._send(status, b"{}", [("Retry-After", "0")] if status == 429 else ())
+
+        last = self.path.split("?")[0].rstrip("/").rsplit("/", 1)[-1]
+        if "/search" in self.path:
+            counts["search"] += 1
+            return self._send(200, SEARCH_PAYLOAD)
+        if "/codeinfo/" in self.path:
+            counts["codeinfo"] += 1
+            codeinfo[last] += 1
+            if last.startswith("NOPE"):
+                return self._send(404, b"{}")
+            return self._send(200, json.dumps({"code": last, "stemId": f"http://id.who.int/icd/entity/{last}"}).encode())
+        counts["entity"] += 1
+        self._send(200, json.dumps({"@id": f"http://id.who.int/icd/entity/{last}", "chapter": "05",
+                                    "title": {"@language": "en", "@value": self.entity_title.format(last)}}).encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def start(handler=StubWHOHandler):
+    """Serve `handler` on a free localhost port in a daemon thread; returns the base URL"""
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def env(base):
+    """WHO_* settings pointing the app at the stub at `base`"""
+    return {"WHO_API_BASE": base, "WHO_TOKEN_URL": f"{base}/connect/token",
+            "WHO_CLIENT_ID": "bench", "WHO_CLIENT_SECRET": "bench"}
@@ -0,0 +1,175 @@
+# backend/bundle.py
+import json
+import os
+
+from db import connection
+from jsonstream import JSONStreamReader
+from problems import save_problems
+
+BUNDLE_BATCH_SIZE = int(os.getenv("BUNDLE_BATCH_SIZE", "1000"))
+BUNDLE_MAX_ERRORS = 100
+
+ICD11_SYSTEMS = {
+    "http://who.int/icd11",
+    "http://hl7.org/fhir/sid/icd-11",
+    "http://id.who.int/icd/release/11/mms",
+}
+
+
+def is_namaste_system(system):
+    return system == "urn:namaste" or (system or "").startswith("http://namaste.gov.in/")
+
+
+def condition_problem(resource):
+    """(patient_id, namaste_code, icd_codes) for a Condition, or an error string"""
+    subject = resource.get("subject") or {}
+    if not isinstance(subject, dict):
+        return "Condition subject must be an object"
+    reference = subject.get("reference") or ""
+    if not isinstance(reference, str):
+        return "Condition subject reference must be a string"
+    patient_id = reference.rsplit("/", 1)[-1]
+    if not patient_id:
+        return "Condition has no subject reference"
+
+    concept = resource.get("code") or {}
+    if not isinstance(concept, dict):
+        return "Condition code must be an object"
+    codings = concept.get("coding") or []
+    if not isinstance(codings, list):
+        return "Condition code.coding must be an array"
+
+    namaste_code, icd_codes = None, []
+    for coding in codings:
+        if not isinstance(coding, dict):
+            return "Condition coding entries must be objects"
+        system, code = coding.get("system"), coding.get("code")
+        if not code:
+            continue
+        if not isinstance(code, str) or not isinstance(system, (str, type(None))):
+            return "Condition coding system and code must be strings"
+        if is_namaste_system(system):
+            namaste_code = namaste_code or code
+        elif system in ICD11_SYSTEMS:
+            icd_codes.append(code)
+    if namaste_code is None:
+        return "Condition has no NAMASTE coding"
+    return patient_id, namaste_code, icd_codes
+
+
+def known_icd_codes(conn, codes):
+    if not codes:
+        return set()
+    param = json.dumps(list(codes))
+    rows = conn.execute(
+        """SELECT code FROM icd_cache WHERE code IN (SELECT value FROM json_each(?))
+           UNION SELECT icd_code FROM concept_map WHERE icd_code IN (SELECT value FROM json_each(?))""",
+        (param, param),
+    )
+    return {r[0] for r in rows}
+
+
+def scan_bundle(fp):
+    """Parse a whole Bundle from `fp` without saving anything.
+
+    Raises ValueError where process_bundle would stop, so an upload can be
+    refused before its first batch is committed. Returns the distinct ICD-11
+    codes of its Conditions.
+    """
+    codes = set()
+    reader = JSONStreamReader(fp)
+    head, found = reader.members_until("entry")
+    if head.get("resourceType", "Bundle") != "Bundle":
+        raise ValueError(f"Expected a Bundle, got {head.get('resourceType')}")
+    if found:
+        for entry in reader.items():
+            resource = entry.get("resource") if isinstance(entry, dict) else None
+            if isinstance(resource, dict) and resource.get("resourceType") == "Condition":
+                try:
+                    problem = condition_problem(resource)
+                except (AttributeError, TypeError):
+                    continue  # rejected by process_bundle
+                if not isinstance(problem, str):
+                    codes.update(problem[2])
+    return codes
+
+
+class BundleIngest:
+    """Validates and persists Conditions from a Bundle, one batch at a time"""
+
+    def __init__(self, conn, strict_icd=False):
+        self.conn = conn
+        self.strict_icd = strict_icd
+        self.batch = []  # (entry index, resource id, problem)
+        self.summary = {"entries": 0, "conditions": 0, "saved": 0, "rejected": 0,
+                        "unknownIcdCodes": 0, "errors": []}
+
+    def reject(self, index, resource_id, reason):
+        self.summary["rejected"] += 1
+        if len(self.summary["errors"]) < BUNDLE_MAX_ERRORS:
+            self.summary["errors"].append({"entry": index, "id": resource_id, "detail": reason})
+
+    def add_entry(self, index, entry):
+        self.summary["entries"] += 1
+        resource = entry.get("resource") if isinstance(entry, dict) else None
+        if not isinstance(resource, dict) or resource.get("resourceType") != "Condition":
+            return
+        self.summary["conditions"] += 1
+        try:
+            problem = condition_problem(resource)
+        except (AttributeError, TypeError) as e:
+            # any shape the checks above missed rejects this entry, not the upload
+            problem = f"Malformed Condition: {e}"
+        if isinstance(problem, str):
+            self.reject(index, resource.get("id"), problem)
+            return
+        self.batch.append((index, resource.get("id"), problem))
+        if len(self.batch) >= BUNDLE_BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        known = known_icd_codes(self.conn, {c for _, _, p in batch for c in p[2]})
+
+        accepted = []
+        for index, resource_id, problem in batch:
+            unknown = [c for c in problem[2] if c not in known]
+            self.summary["unknownIcdCodes"] += len(unknown)
+            if unknown and self.strict_icd:
+                self.reject(index, resource_id, f"Unknown ICD-11 codes: {', '.join(unknown)}")
+            else:
+                accepted.append((index, resource_id, problem))
+
+        conditions, rejected = save_problems([p for _, _, p in accepted], self.conn)
+        self.summary["saved"] += len(conditions)
+        for i in rejected:
+            index, resource_id, _ = accepted[i]
+            self.reject(index, resource_id, "NAMASTE code not found")
+
+
+def process_bundle(fp, strict_icd=False):
+    """Stream-parse a FHIR Bundle from `fp` and persist its Conditions.
+
+    Entries are decoded one at a time and written in batches of
+    BUNDLE_BATCH_SIZE, so memory is bounded by the batch, not the Bundle.
+    Batches are committed as they fill, so run scan_bundle over the same
+    input first: on malformed input the summary carries an "error" and counts
+    only what was saved before the problem.
+    """
+    with connection() as conn:
+        ingest = BundleIngest(conn, strict_icd)
+        try:
+            reader = JSONStreamReader(fp)
+            head, found = reader.members_until("entry")
+            if head.get("resourceType", "Bundle") != "Bundle":
+                raise ValueError(f"Expected a Bundle, got {head.get('resourceType')}")
+            if found:
+                for index, entry in enumerate(reader.items()):
+                    ingest.add_entry(index, entry)
+            ingest.flush()
+        except ValueError as e:
+            ingest.flush()
+            ingest.summary["error"] = str(e)
+        return ingest.summary
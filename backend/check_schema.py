@@ -1,9 +1,84 @@
 # backend/check_schema.py
+import os
 import sqlite3
+import sys
 from pathlib import Path
 
+# (description, query, params, index the plan must use); the keyset
+# listings the app pages through come from app_queries()
+HOT_QUERIES = [
+    ("Problems by NAMASTE code",
+     "SELECT COUNT(*) FROM problems WHERE namaste_code = ?",
+     ("NAM-001",), "idx_problems_namaste"),
+    ("Concept map for a NAMASTE code",
+     """SELECT icd_code, icd_display, module, confidence, mapping_type FROM concept_map
+        WHERE namaste_code = ? ORDER BY confidence DESC""",
+     ("NAM-001",), "idx_concept_map_lookup"),
+    ("Concept map display for an ICD code",
+     """SELECT icd_code, icd_display FROM concept_map
+        WHERE icd_code IN (SELECT value FROM json_each(?)) AND icd_display IS NOT NULL""",
+     ('["XM4KH5"]',), "idx_concept_map_icd"),
+    ("Analytics: top ICD codes",
+     "SELECT icd_code, codings FROM problem_rollup_icd ORDER BY codings DESC, icd_code LIMIT 10",
+     (), "idx_problem_rollup_icd_codings"),
+    ("Analytics: daily volume",
+     "SELECT day, problems, codings FROM problem_rollup_daily WHERE day BETWEEN ? AND ? ORDER BY day",
+     ("2024-01-01", "2024-12-31"), "sqlite_autoindex_problem_rollup_daily_1"),
+    ("Warm-up: most asked searches",
+     "SELECT search_key FROM search_hits WHERE kind = ? ORDER BY hits DESC LIMIT ?",
+     ("icd", 2000), "idx_search_hits_rank"),
+]
+
+def app_queries():
+    """The keyset queries main.py and export.py run, as HOT_QUERIES entries
+    for their first page and a later one"""
+    from export import PROBLEMS_EXPORT
+    from main import DEBUG_CONCEPT_MAP, DEBUG_ICD_CACHE, DEBUG_NAMASTE, DEBUG_PROBLEMS, PATIENT_PROBLEMS
+    from pagination import encode_cursor
+
+    # (description, query, params, values of a cursor, index)
+    queries = [
+        ("Per-patient problem list", PATIENT_PROBLEMS, ("patient-1",), [0, 0], "idx_problems_patient"),
+        ("Problems newest first", DEBUG_PROBLEMS, (), [0, 0], "idx_problems_created"),
+        ("Concept map by confidence", DEBUG_CONCEPT_MAP, (), [0, 0], "idx_concept_map_confidence"),
+        ("NAMASTE codes by code", DEBUG_NAMASTE, (), ["NAM-001"], "sqlite_autoindex_namaste_1"),
+        ("ICD cache most recently synced", DEBUG_ICD_CACHE, (), [0, ""], "idx_icd_cache_synced"),
+        ("Problems export by date range", PROBLEMS_EXPORT, (0, 2 ** 62), [0, 0], "idx_problems_created"),
+    ]
+    entries = []
+    for description, query, params, after, index in queries:
+        for page, cursor in (("", None), (", next page", encode_cursor(after))):
+            sql, bound = query.sql(cursor, params)
+            entries.append((description + page, sql + " LIMIT 500", tuple(bound), index))
+    return entries
+
+def plan_problem(conn, sql, params, index):
+    """None if the plan of `sql` uses `index` without a full scan or a temp
+    sort, otherwise the plan"""
+    plan = [row[3] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params)]
+    uses_index = any(f"INDEX {index}" in step for step in plan)
+    # a SCAN without an index is a full table scan (tables may be aliased)
+    full_scan = any(step.startswith("SCAN ") and "INDEX" not in step for step in plan)
+    temp_sort = any("USE TEMP B-TREE" in step for step in plan)
+    if uses_index and not full_scan and not temp_sort:
+        return None
+    return " | ".join(plan)
+
+def check_query_plans(conn):
+    """EXPLAIN QUERY PLAN each hot query and assert it uses its index"""
+    print("\n🧭 Query plans:")
+    failures = 0
+    for description, sql, params, index in HOT_QUERIES + app_queries():
+        problem = plan_problem(conn, sql, params, index)
+        if problem is None:
+            print(f"   ✅ {description}: {index}")
+        else:
+            failures += 1
+            print(f"   ❌ {description}: expected {index}, got {problem}")
+    return failures
+
 def check_schema():
-    DB_FILE = Path(__file__).parent / "ayusync.db"
+    DB_FILE = Path(os.getenv("AYUSYNC_DB", Path(__file__).parent / "ayusync.db"))
     
     print("🔍 Checking database schema...")
     
@@ -35,10 +110,19 @@ def check_schema():
         for column in cur.fetchall():
             print(f"   {column[1]} ({column[2]})")
         
+        # Check applied migrations
+        print("\n📋 Schema version:")
+        cur.execute("SELECT version, description FROM schema_version ORDER BY version")
+        for version, description in cur.fetchall():
+            print(f"   {version}: {description}")
+        
+        failures = check_query_plans(conn)
         conn.close()
+        return failures
         
     except Exception as e:
         print(f"❌ Error checking schema: {e}")
+        return 1
 
 if __name__ == "__main__":
-    check_schema()
\ No newline at end of file
+    sys.exit(1 if check_schema() else 0)
\ No newline at end of file
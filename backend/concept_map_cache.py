@@ -0,0 +1,156 @@
+# backend/concept_map_cache.py
+import hashlib
+import json
+import threading
+
+from db import connection
+
+
+def _dumps(value):
+    # same compact form Starlette's JSONResponse produces
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def etag(body):
+    """Strong ETag from the response bytes"""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def _mapping(row):
+    return {
+        "code": row["icd_code"],
+        "display": row["icd_display"],
+        "module": row["module"],
+        "confidence": row["confidence"],
+        "mappingType": row["mapping_type"],
+    }
+
+
+_EMPTY = (b"[]", etag(b"[]"))
+
+
+class ConceptMapCache:
+    """NAMASTE code -> ICD-11 mappings, held in memory.
+
+    Each code's mappings are sorted by confidence and pre-rendered to JSON
+    bytes once, so a lookup is a dict hit with no SQL or serialization.
+    Call reload() after bulk changes or refresh(codes) after targeted ones;
+    sync() applies changes another process made without knowing which codes.
+    """
+
+    _SELECT = """SELECT namaste_code, icd_code, icd_display, module, confidence, mapping_type
+                 FROM concept_map {where} ORDER BY namaste_code, confidence DESC"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._codes = frozenset()   # every known NAMASTE code
+        self._json = {}             # code -> pre-rendered mapping list (bytes)
+        self._tagged = {}           # code -> (bytes, ETag), read together
+        self._mappings = {}         # code -> mapping list
+
+    def __len__(self):
+        return len(self._json)
+
+    def _build(self, rows):
+        grouped = {}
+        for row in rows:
+            grouped.setdefault(row["namaste_code"], []).append(_mapping(row))
+        return grouped
+
+    def _read_all(self):
+        with connection() as conn:
+            codes = frozenset(r["code"] for r in conn.execute("SELECT code FROM namaste"))
+            grouped = self._build(conn.execute(self._SELECT.format(where="")))
+        return codes, grouped
+
+    def reload(self):
+        """Rebuild the whole cache from the database"""
+        codes, grouped = self._read_all()
+        rendered = {code: _dumps(maps) for code, maps in grouped.items()}
+        tagged = {code: (body, etag(body)) for code, body in rendered.items()}
+        with self._lock:
+            self._codes = codes
+            self._mappings = grouped
+            self._json = rendered
+            self._tagged = tagged
+
+    def sync(self):
+        """Bring the cache in line with the database, re-rendering only the
+        codes whose mappings changed; returns how many did"""
+        codes, grouped = self._read_all()
+        mappings = self._mappings
+        changed = [code for code in grouped.keys() | mappings.keys() if grouped.get(code) != mappings.get(code)]
+        rendered = {code: _dumps(grouped[code]) for code in changed if code in grouped}
+        with self._lock:
+            self._codes = codes
+            for code in changed:
+                if code in rendered:
+                    self._mappings[code] = grouped[code]
+                    self._json[code] = rendered[code]
+                    self._tagged[code] = (rendered[code], etag(rendered[code]))
+                else:
+                    self._mappings.pop(code, None)
+                    self._json.pop(code, None)
+                    self._tagged.pop(code, None)
+        return len(changed)
+
+    def refresh(self, codes):
+        """Re-read the mappings (and existence) of the given NAMASTE codes"""
+        codes = list(set(codes))
+        if not codes:
+            return
+        with connection() as conn:
+            known, grouped = set(), {}
+            for i in range(0, len(codes), 500):
+                chunk = codes[i:i + 500]
+                marks = ",".join("?" * len(chunk))
+                known.update(r["code"] for r in conn.execute(
+                    f"SELECT code FROM namaste WHERE code IN ({marks})", chunk))
+                grouped.update(self._build(conn.execute(
+                    self._SELECT.format(where=f"WHERE namaste_code IN ({marks})"), chunk)))
+        with self._lock:
+            self._codes = (self._codes - set(codes)) | known
+            for code in codes:
+                if code in grouped:
+                    self._mappings[code] = grouped[code]
+                    self._json[code] = _dumps(grouped[code])
+                    self._tagged[code] = (self._json[code], etag(self._json[code]))
+                else:
+                    self._mappings.pop(code, None)
+                    self._json.pop(code, None)
+                    self._tagged.pop(code, None)
+
+    def __contains__(self, code):
+        return code in self._codes
+
+    def get(self, code):
+        """Mapping list for `code` ([] if none), or None for an unknown code"""
+        if code not in self._codes:
+            return None
+        return self._mappings.get(code, [])
+
+    def get_json(self, code):
+        """Pre-rendered JSON bytes for `code`, or None for an unknown code"""
+        if code not in self._codes:
+            return None
+        return self._json.get(code, b"[]")
+
+    def get_tagged(self, code):
+        """(JSON bytes, ETag) for `code`, or None for an unknown code"""
+        if code not in self._codes:
+            return None
+        return self._tagged.get(code, _EMPTY)
+
+    def bulk_json(self, codes):
+        """One JSON document resolving many codes: {"mappings": {...}, "notFound": [...]}"""
+        parts, missing = [], []
+        for code in dict.fromkeys(codes):
+            body = self.get_json(code)
+            if body is None:
+                missing.append(code)
+            else:
+                parts.append(_dumps(code) + b":" + body)
+        return b'{"mappings":{' + b",".join(parts) + b'},"notFound":' + _dumps(missing) + b"}"
+
+
+concept_map_cache = ConceptMapCache()
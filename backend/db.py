@@ -1,18 +1,203 @@
 # db.py - UPDATED
+import asyncio
+import os
+import queue
 import sqlite3
 import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 import time
 
-DB_FILE = Path(__file__).parent / "ayusync.db"
+from telemetry import add_db_time
 
-def get_conn():
-    conn = sqlite3.connect(DB_FILE)
+DB_FILE = Path(os.getenv("AYUSYNC_DB", Path(__file__).parent / "ayusync.db"))
+
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "8"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Applied to every connection. WAL lets readers run alongside the writer;
+# synchronous=NORMAL is durable in WAL mode and avoids an fsync per commit.
+PRAGMAS = (
+    "PRAGMA synchronous = NORMAL",
+    "PRAGMA temp_store = MEMORY",
+    "PRAGMA cache_size = -16000",
+    "PRAGMA mmap_size = 134217728",
+    "PRAGMA busy_timeout = 5000",
+    # REPLACE must fire delete triggers so icd_fts stays in sync
+    "PRAGMA recursive_triggers = ON",
+)
+
+def _connect(db_file=DB_FILE, check_same_thread=True):
+    # cached_statements keeps prepared statements alive for reuse
+    conn = sqlite3.connect(db_file, check_same_thread=check_same_thread, cached_statements=256)
     conn.row_factory = sqlite3.Row
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+def get_conn():
+    """Open a standalone connection (scripts, one-off maintenance)"""
+    return _connect()
+
+class ConnectionPool:
+    """Bounded pool of long-lived SQLite connections.
+
+    Connections are created lazily up to `size` and handed out one caller at a
+    time, so request handlers skip the open/schema-parse/cache-warmup cost.
+    """
+
+    def __init__(self, db_file=DB_FILE, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT):
+        self.db_file = db_file
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._wal_checked = False
+
+    def _new_conn(self):
+        conn = _connect(self.db_file, check_same_thread=False)
+        if not self._wal_checked:
+            # journal_mode is persistent in the database file; set it once
+            conn.execute("PRAGMA journal_mode = WAL")
+            self._wal_checked = True
+        return conn
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                try:
+                    return self._new_conn()
+                except Exception:
+                    self._created -= 1
+                    raise
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f"No database connection free after {self.timeout}s")
+
+    def fill(self):
+        """Open the connections not created yet now instead of on first use; returns how many"""
+        opened = []
+        with self._lock:
+            while self._created < self.size:
+                opened.append(self._new_conn())
+                self._created += 1
+        for conn in opened:
+            self._idle.put(conn)
+        return len(opened)
+
+    def release(self, conn):
+        if conn.in_transaction:
+            conn.rollback()
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        """Borrow a connection; commits on success, rolls back on error"""
+        conn = self.acquire()
+        try:
+            yield conn
+            if conn.in_transaction:
+                conn.commit()
+        except BaseException:
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._created -= 1
+
+pool = ConnectionPool()
+
+def connection():
+    """Context manager over the shared pool: `with connection() as conn:`"""
+    return pool.connection()
+
+# One worker per pooled connection: DB work never queues on the pool itself,
+# and at most DB_POOL_SIZE statements run at once.
+_executor = ThreadPoolExecutor(max_workers=DB_POOL_SIZE, thread_name_prefix="sqlite")
+
+async def run_db(fn, *args):
+    """Run blocking DB function `fn(*args)` off the event loop"""
+    loop = asyncio.get_running_loop()
+    start = time.perf_counter()
+    try:
+        return await loop.run_in_executor(_executor, fn, *args)
+    finally:
+        add_db_time((time.perf_counter() - start) * 1000)
+
+def fetch_all(sql, params=()):
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def shutdown_db():
+    _executor.shutdown(wait=True)
+    pool.close_all()
+
+def fts5_available(cur):
+    try:
+        cur.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x, tokenize='trigram')")
+        cur.execute("DROP TABLE temp._fts5_probe")
+        return True
+    except sqlite3.OperationalError:
+        return False
+
+def init_icd_fts(cur):
+    """Create the icd_fts index (if SQLite has FTS5 trigram) and its triggers"""
+    cur.execute("SELECT 1 FROM sqlite_master WHERE name = 'icd_fts'")
+    if cur.fetchone():
+        return
+    if not fts5_available(cur):
+        print("SQLite FTS5 trigram tokenizer unavailable; ICD search uses LIKE")
+        return
+    cur.execute("""
+    CREATE VIRTUAL TABLE icd_fts USING fts5(
+      code, display, content='icd_cache', tokenize='trigram'
+    )""")
+    cur.execute("""
+    CREATE TRIGGER icd_cache_ai AFTER INSERT ON icd_cache BEGIN
+      INSERT INTO icd_fts(rowid, code, display) VALUES (new.rowid, new.code, new.display);
+    END""")
+    cur.execute("""
+    CREATE TRIGGER icd_cache_ad AFTER DELETE ON icd_cache BEGIN
+      INSERT INTO icd_fts(icd_fts, rowid, code, display) VALUES ('delete', old.rowid, old.code, old.display);
+    END""")
+    cur.execute("""
+    CREATE TRIGGER icd_cache_au AFTER UPDATE ON icd_cache BEGIN
+      INSERT INTO icd_fts(icd_fts, rowid, code, display) VALUES ('delete', old.rowid, old.code, old.display);
+      INSERT INTO icd_fts(rowid, code, display) VALUES (new.rowid, new.code, new.display);
+    END""")
+    # index whatever is already cached
+    cur.execute("INSERT INTO icd_fts(icd_fts) VALUES ('rebuild')")
+
+# The display concept_map carries for an ICD code, for queries joining
+# icd_cache (see problems.icd_displays): served from idx_concept_map_icd.
+#   COALESCE(ic.display, CONCEPT_MAP_ICD_DISPLAY.format("p.icd_code"))
+CONCEPT_MAP_ICD_DISPLAY = """(SELECT cm.icd_display FROM concept_map cm
+    WHERE cm.icd_code = {} AND cm.icd_display IS NOT NULL LIMIT 1)"""
+
 def init_db():
     conn = get_conn()
+    # workers start together: one creates the schema, the others wait for it
+    conn.execute("PRAGMA busy_timeout = 60000")
+    conn.execute("BEGIN IMMEDIATE")
     cur = conn.cursor()
     
     # NAMASTE table
@@ -48,6 +233,27 @@ def init_db():
       last_synced INTEGER
     )""")
     
+    # Trigram full-text index over icd_cache, kept in sync by triggers
+    init_icd_fts(cur)
+    
+    # Bulk ICD-11 release imports (see icd_import.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS icd_import_log (
+      id INTEGER PRIMARY KEY AUTOINCREMENT,
+      release TEXT,
+      source TEXT,
+      entities INTEGER,
+      imported_at INTEGER
+    )""")
+    
+    # ICD search results by normalized query (see query_cache.py)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS icd_query_cache (
+      cache_key TEXT PRIMARY KEY,
+      results_json TEXT,
+      stored_at INTEGER
+    )""")
+    
     # Problems (saved dual-coded entries)
     cur.execute("""
     CREATE TABLE IF NOT EXISTS problems (
@@ -60,90 +266,181 @@ def init_db():
     )""")
     
     conn.commit()
+    migrate(conn)
     conn.close()
 
-def seed_sample_data():
-    conn = get_conn()
-    cur = conn.cursor()
+# --------------------------------------------------
+# Schema migrations
+# --------------------------------------------------
+# Fill the analytics rollups (see analytics.py) from existing problems. One
+# saved problem is the set of rows save_problems inserted for it together.
+ROLLUP_BACKFILL = [
+    """WITH saved AS (SELECT namaste_code, created_at FROM problems
+                      GROUP BY patient_id, namaste_code, created_at)
+       INSERT INTO problem_rollup_namaste(namaste_code, problems, last_at)
+       SELECT namaste_code, COUNT(*), MAX(created_at) FROM saved GROUP BY namaste_code""",
+    """INSERT INTO problem_rollup_icd(icd_code, codings, last_at)
+       SELECT icd_code, COUNT(*), MAX(created_at) FROM problems GROUP BY icd_code""",
+    """WITH saved AS (SELECT created_at, COUNT(*) AS codings FROM problems
+                      GROUP BY patient_id, namaste_code, created_at)
+       INSERT INTO problem_rollup_daily(day, problems, codings)
+       SELECT date(created_at, 'unixepoch'), COUNT(*), SUM(codings) FROM saved GROUP BY 1""",
+]
+# Problems and NAMASTE codes per category, from the per-code rollup; rerun
+# when NAMASTE categories change
+CATEGORY_ROLLUP_BACKFILL = """
+    INSERT INTO problem_rollup_category(category, problems, codes)
+    SELECT COALESCE(n.category, 'Unknown'), SUM(r.problems), COUNT(*)
+    FROM problem_rollup_namaste r LEFT JOIN namaste n ON n.code = r.namaste_code
+    GROUP BY 1"""
 
-    # Clear existing data to avoid duplicates
-    cur.execute("DELETE FROM namaste")
-    cur.execute("DELETE FROM concept_map")
-    
-    # Insert comprehensive NAMASTE sample data
-    namaste_samples = [
-        ("NAM-001", "Vata Dosha Imbalance", "Dosha"),
-        ("NAM-002", "Pitta Disorder", "Dosha"),
-        ("NAM-003", "Kapha Excess", "Dosha"),
-        ("NAM-004", "Madhumeha (Diabetes)", "Metabolic"),
-        ("NAM-005", "Kustha (Skin Disorder)", "Dermatology"),
-        ("NAM-006", "Pratishyaya (Rhinitis)", "Respiratory"),
-        ("NAM-007", "Grahani (Irritable Bowel)", "Gastrointestinal"),
-        ("NAM-008", "Rajayakshma (Tuberculosis)", "Respiratory"),
-        ("NAM-009", "Arsha (Hemorrhoids)", "Gastrointestinal"),
-        ("NAM-010", "Hridroga (Heart Disease)", "Cardiac"),
-    ]
-    
-    for code, display, category in namaste_samples:
-        cur.execute(
-            "INSERT OR REPLACE INTO namaste(code, display, category) VALUES (?, ?, ?)",
-            (code, display, category)
-        )
-
-    # Seed comprehensive concept mappings
-    concept_mappings = [
-        # Vata mappings
-        ("NAM-001", "TM2.A01.1Z", "Traditional Medicine - Vata Disorder", "TM2", 95, "automatic"),
-        ("NAM-001", "K59.1", "Functional diarrhea", "Biomedical", 85, "automatic"),
-        
-        # Pitta mappings
-        ("NAM-002", "TM2.B05.2", "Traditional Medicine - Pitta Disorder", "TM2", 90, "automatic"),
-        ("NAM-002", "L20.9", "Atopic dermatitis, unspecified", "Biomedical", 80, "automatic"),
-        ("NAM-002", "K29.70", "Gastritis, unspecified", "Biomedical", 75, "automatic"),
-        
-        # Kapha mappings
-        ("NAM-003", "TM2.C08.3", "Traditional Medicine - Kapha Disorder", "TM2", 90, "automatic"),
-        ("NAM-003", "J40", "Bronchitis, not specified as acute or chronic", "Biomedical", 80, "automatic"),
-        
-        # Diabetes mappings
-        ("NAM-004", "5A10", "Type 1 diabetes mellitus", "Biomedical", 95, "automatic"),
-        ("NAM-004", "5A11", "Type 2 diabetes mellitus", "Biomedical", 90, "automatic"),
-        
-        # Skin disorder mappings
-        ("NAM-005", "L20.9", "Atopic dermatitis, unspecified", "Biomedical", 85, "automatic"),
-        ("NAM-005", "L40.9", "Psoriasis, unspecified", "Biomedical", 80, "automatic"),
-        
-        # Respiratory mappings
-        ("NAM-006", "CA20.0", "Acute sinusitis", "Biomedical", 85, "automatic"),
-        ("NAM-006", "CA20.1", "Chronic sinusitis", "Biomedical", 80, "automatic"),
-        
-        # Gastrointestinal mappings
-        ("NAM-007", "K58.0", "Irritable bowel syndrome with diarrhea", "Biomedical", 90, "automatic"),
-        ("NAM-007", "K58.9", "Irritable bowel syndrome without diarrhea", "Biomedical", 85, "automatic"),
-        
-        # Tuberculosis mapping
-        ("NAM-008", "1B10", "Tuberculosis", "Biomedical", 95, "automatic"),
-        
-        # Hemorrhoids mapping
-        ("NAM-009", "KB60.0", "Internal hemorrhoids", "Biomedical", 90, "automatic"),
-        
-        # Heart disease mapping
-        ("NAM-010", "BA70", "Hypertensive heart disease", "Biomedical", 85, "automatic"),
-    ]
-    
-    for mapping in concept_mappings:
-        cur.execute(
-            """INSERT OR REPLACE INTO concept_map 
-               (namaste_code, icd_code, icd_display, module, confidence, mapping_type) 
-               VALUES (?, ?, ?, ?, ?, ?)""",
-            mapping
-        )
-    
+# Forward-only and append-only: never edit a released entry, add a new one.
+# Each migration runs in its own transaction together with its
+# schema_version row, so a failed migration leaves no partial state.
+MIGRATIONS = [
+    (1, "Indexes for problem, concept_map and icd_cache hot queries", [
+        # per-patient problem list, newest first; covering for the list columns
+        """CREATE INDEX IF NOT EXISTS idx_problems_patient
+           ON problems(patient_id, created_at, id, namaste_code, icd_code)""",
+        # global newest-first listing (debug/export keyset order)
+        "CREATE INDEX IF NOT EXISTS idx_problems_created ON problems(created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_problems_namaste ON problems(namaste_code)",
+        # mappings for a NAMASTE code by confidence; covering for the response
+        """CREATE INDEX IF NOT EXISTS idx_concept_map_lookup
+           ON concept_map(namaste_code, confidence DESC, icd_code, icd_display, module, mapping_type)""",
+        "CREATE INDEX IF NOT EXISTS idx_concept_map_confidence ON concept_map(confidence, id)",
+        "CREATE INDEX IF NOT EXISTS idx_icd_cache_synced ON icd_cache(last_synced, code)",
+    ]),
+    (2, "Track loaded reference data versions", [
+        """CREATE TABLE IF NOT EXISTS reference_data_version (
+             source TEXT PRIMARY KEY,
+             version TEXT,
+             checksum TEXT,
+             rows INTEGER,
+             loaded_at INTEGER
+           )""",
+    ]),
+    (3, "Recent hit counts for ICD cache refresh priority", [
+        """CREATE TABLE IF NOT EXISTS icd_hits (
+             code TEXT PRIMARY KEY,
+             hits REAL,
+             last_hit INTEGER
+           )""",
+    ]),
+    (4, "State for incremental NAMASTE -> ICD-11 mapping suggestions", [
+        """CREATE TABLE IF NOT EXISTS mapping_suggest_state (
+             namaste_code TEXT PRIMARY KEY,
+             fingerprint TEXT,
+             computed_at INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS mapping_suggest_runs (
+             id INTEGER PRIMARY KEY AUTOINCREMENT,
+             icd_watermark TEXT,
+             codes INTEGER,
+             suggestions INTEGER,
+             backend TEXT,
+             elapsed_ms REAL,
+             ran_at INTEGER
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_concept_map_type ON concept_map(mapping_type, namaste_code)",
+    ]),
+    (5, "State shared between worker processes", [
+        """CREATE TABLE IF NOT EXISTS shared_state (
+             key TEXT PRIMARY KEY,
+             value TEXT,
+             expires_at REAL
+           )""",
+        """CREATE TABLE IF NOT EXISTS shared_leases (
+             name TEXT PRIMARY KEY,
+             owner TEXT,
+             expires_at REAL
+           )""",
+    ]),
+    (6, "Analytics rollups of saved problems", [
+        """CREATE TABLE IF NOT EXISTS problem_rollup_namaste (
+             namaste_code TEXT PRIMARY KEY,
+             problems INTEGER NOT NULL,
+             last_at INTEGER
+           )""",
+        """CREATE TABLE IF NOT EXISTS problem_rollup_icd (
+             icd_code TEXT PRIMARY KEY,
+             codings INTEGER NOT NULL,
+             last_at INTEGER
+           )""",
+        # top ICD codes straight off the index, no sort
+        "CREATE INDEX IF NOT EXISTS idx_problem_rollup_icd_codings ON problem_rollup_icd(codings DESC, icd_code)",
+        """CREATE TABLE IF NOT EXISTS problem_rollup_daily (
+             day TEXT PRIMARY KEY,
+             problems INTEGER NOT NULL,
+             codings INTEGER NOT NULL
+           )""",
+        *ROLLUP_BACKFILL,
+    ]),
+    (7, "Concept map lookup by ICD code", [
+        # known/display lookups of ICD codes that icd_cache has not fetched
+        "CREATE INDEX IF NOT EXISTS idx_concept_map_icd ON concept_map(icd_code, icd_display)",
+    ]),
+    (8, "Analytics rollup per NAMASTE category", [
+        """CREATE TABLE IF NOT EXISTS problem_rollup_category (
+             category TEXT PRIMARY KEY,
+             problems INTEGER NOT NULL,
+             codes INTEGER NOT NULL
+           )""",
+        CATEGORY_ROLLUP_BACKFILL,
+    ]),
+    (9, "Tell full mapping suggestion runs from incremental ones", [
+        # earlier runs refitted against all of icd_cache whenever it changed
+        "ALTER TABLE mapping_suggest_runs ADD COLUMN full_run INTEGER NOT NULL DEFAULT 1",
+    ]),
+    (10, "Search frequencies for the warm-up", [
+        # decayed counts per ICD query-cache key or NAMASTE search (see search_hits.py)
+        """CREATE TABLE IF NOT EXISTS search_hits (
+             kind TEXT NOT NULL,
+             search_key TEXT NOT NULL,
+             hits REAL NOT NULL,
+             last_hit INTEGER,
+             PRIMARY KEY (kind, search_key)
+           )""",
+        "CREATE INDEX IF NOT EXISTS idx_search_hits_rank ON search_hits(kind, hits DESC)",
+    ]),
+]
+
+def schema_version(conn):
+    conn.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+      version INTEGER PRIMARY KEY,
+      description TEXT,
+      applied_at INTEGER
+    )""")
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version").fetchone()[0]
+
+def migrate(conn):
+    """Apply pending MIGRATIONS in order; safe to call on every startup"""
+    schema_version(conn)
     conn.commit()
-    conn.close()
-    print("Database seeded with comprehensive mapping data")
+    for version, description, statements in MIGRATIONS:
+        # IMMEDIATE takes the write lock before re-checking, so concurrent
+        # workers apply each migration exactly once
+        conn.execute("BEGIN IMMEDIATE")
+        if conn.execute("SELECT 1 FROM schema_version WHERE version = ?", (version,)).fetchone():
+            conn.rollback()
+            continue
+        try:
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute("INSERT INTO schema_version(version, description, applied_at) VALUES (?, ?, ?)",
+                         (version, description, int(time.time())))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"Applied migration {version}: {description}")
+    # keep planner statistics current for the new indexes
+    conn.execute("PRAGMA optimize")
 
 if __name__ == "__main__":
+    from reference_data import load_reference_data
+
     init_db()
-    seed_sample_data()
+    load_reference_data()
     print("DB initialized and seeded.")
\ No newline at end of file
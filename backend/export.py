@@ -0,0 +1,134 @@
+# backend/export.py
+"""Bulk export of the problems table for population-level analysis.
+
+Rows stream oldest first in keyset chunks of EXPORT_CHUNK_ROWS off
+idx_problems_created, so memory stays bounded by one chunk however many
+rows match, and are gzip-compressed as they are produced. Two formats:
+
+- csv: id,patient_id,namaste_code,icd_code,created_at
+- columnar: gzip NDJSON of record batches. A batch carries one array per
+  column; namaste_code and icd_code are indexes into per-column
+  dictionaries, sent (with their display text) just before the first batch
+  that uses a new code:
+
+    {"dictionary": "namaste_code", "offset": 0, "values": ["NAM-001"], "display": ["Vata ..."]}
+    {"rows": 2, "after": "1758279985,42", "columns": {"id": [41, 42], "namaste_code": [0, 0], ...}}
+
+Every row is identified by "created_at,id" (the "after" of a columnar
+batch, or those two CSV columns); passing the last one received back as
+`after` resumes the export right behind it. created_at is Unix seconds; the
+from/to filters are UTC days.
+"""
+import calendar
+import csv
+import io
+import json
+import os
+import time
+import zlib
+
+from db import connection, run_db
+from pagination import KeysetQuery, encode_cursor
+from problems import icd_displays, lookup_displays
+
+EXPORT_CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "20000"))
+EXPORT_GZIP_LEVEL = int(os.getenv("EXPORT_GZIP_LEVEL", "3"))
+EXPORT_COLUMNS = ["id", "patient_id", "namaste_code", "icd_code", "created_at"]
+DICTIONARY_COLUMNS = {
+    "namaste_code": lambda conn, codes: lookup_displays(conn, "namaste", codes),
+    "icd_code": icd_displays,
+}
+
+# served from idx_problems_created (see check_schema.py)
+PROBLEMS_EXPORT = KeysetQuery(
+    "p.id, p.patient_id, p.namaste_code, p.icd_code, p.created_at",
+    "problems p", ["p.created_at", "p.id"],
+    where="p.created_at BETWEEN ? AND ?",
+)
+
+
+def day_bounds(start=None, end=None):
+    """created_at range for inclusive YYYY-MM-DD UTC days"""
+    low = calendar.timegm(time.strptime(start, "%Y-%m-%d")) if start else 0
+    high = calendar.timegm(time.strptime(end, "%Y-%m-%d")) + 86399 if end else 2 ** 62
+    return low, high
+
+
+def parse_after(after):
+    """"created_at,id" -> keyset cursor; ValueError if malformed"""
+    try:
+        created_at, row_id = (int(v) for v in after.split(","))
+    except (AttributeError, ValueError):
+        raise ValueError("after must be 'created_at,id' of the last row received")
+    return encode_cursor([created_at, row_id])
+
+
+class ProblemExport:
+    """Produces the compressed export one chunk at a time; next_chunk runs on the DB executor"""
+
+    def __init__(self, fmt="csv", start=None, end=None, after=None, chunk_rows=EXPORT_CHUNK_ROWS):
+        self.fmt = fmt
+        self.bounds = day_bounds(start, end)
+        self.cursor = parse_after(after) if after else None
+        self.chunk_rows = chunk_rows
+        self.rows = 0
+        self.done = False
+        self._gzip = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip container
+        self._dictionaries = {column: {} for column in DICTIONARY_COLUMNS}
+        self._started = False
+
+    def next_chunk(self):
+        """Compressed bytes for the next chunk (possibly b""), or None when finished"""
+        if self.done:
+            return None
+        sql, params = PROBLEMS_EXPORT.sql(self.cursor, self.bounds)
+        with connection() as conn:
+            cur = conn.cursor()
+            cur.row_factory = None  # plain tuples: no per-row sqlite3.Row
+            rows = cur.execute(sql + " LIMIT ?", params + [self.chunk_rows]).fetchall()
+            text = self._encode(conn, rows) if rows else ""
+        if not self._started:
+            text = (",".join(EXPORT_COLUMNS) + "\n" if self.fmt == "csv" else "") + text
+            self._started = True
+        out = self._gzip.compress(text.encode("utf-8"))
+        if len(rows) < self.chunk_rows:
+            self.done = True
+            out += self._gzip.flush()
+        else:
+            self.cursor = encode_cursor([rows[-1][4], rows[-1][0]])
+        self.rows += len(rows)
+        return out
+
+    def _encode(self, conn, rows):
+        if self.fmt == "csv":
+            buf = io.StringIO()
+            csv.writer(buf, lineterminator="\n").writerows(r[:len(EXPORT_COLUMNS)] for r in rows)
+            return buf.getvalue()
+
+        lines = []
+        columns = {name: [r[i] for r in rows] for i, name in enumerate(EXPORT_COLUMNS)}
+        for name, lookup in DICTIONARY_COLUMNS.items():
+            dictionary = self._dictionaries[name]
+            new = [code for code in dict.fromkeys(columns[name]) if code not in dictionary]
+            if new:
+                displays = lookup(conn, new)
+                lines.append(json.dumps({"dictionary": name, "offset": len(dictionary), "values": new,
+                                         "display": [displays.get(code) for code in new]},
+                                        ensure_ascii=False))
+                base = len(dictionary)
+                dictionary.update((code, base + i) for i, code in enumerate(new))
+            columns[name] = [dictionary[code] for code in columns[name]]
+        last = rows[-1]
+        lines.append(json.dumps({"rows": len(rows), "after": f"{last[4]},{last[0]}",
+                                 "columns": columns}, ensure_ascii=False, separators=(",", ":")))
+        return "\n".join(lines) + "\n"
+
+
+async def stream_export(export):
+    """Yield the export's compressed chunks, one DB round-trip each"""
+    while True:
+        chunk = await run_db(export.next_chunk)
+        if chunk is None:
+            return
+        if chunk:
+            yield chunk
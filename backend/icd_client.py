@@ -1,71 +1,506 @@
-import os, time, json, httpx
-from db import get_conn
+import asyncio, os, time, json, httpx
+from urllib.parse import urlsplit
+
+import shared_state
+from db import connection, fetch_all, run_db
+from telemetry import add_upstream_time
 
 WHO_TOKEN = None
 WHO_TOKEN_EXPIRES = 0
 
 WHO_TOKEN_URL = os.getenv("WHO_TOKEN_URL", "")  # set if you have WHO OAuth token endpoint
 WHO_CLIENT_ID = os.getenv("WHO_CLIENT_ID", "")
-WHO_CLIENT_SECRET = os.getenv("WHO_CLIENT_SECRET")
+WHO_CLIENT_SECRET = os.getenv("WHO_CLIENT_SECRET", "")
+WHO_API_BASE = os.getenv("WHO_API_BASE", "https://id.who.int")
 
-# Simple token fetch (if you have WHO credentials). If not set, we skip live WHO calls.
-async def get_who_token():
-    global WHO_TOKEN, WHO_TOKEN_EXPIRES
-    if WHO_CLIENT_ID == "" or WHO_CLIENT_SECRET == "":
-        return None
-    if WHO_TOKEN and time.time() < WHO_TOKEN_EXPIRES - 30:
-        return WHO_TOKEN
+# Shared HTTP client settings
+WHO_HTTP2 = os.getenv("WHO_HTTP2", "1") == "1"
+WHO_TIMEOUT = float(os.getenv("WHO_TIMEOUT", "10"))
+WHO_MAX_CONNECTIONS = int(os.getenv("WHO_MAX_CONNECTIONS", "20"))
+WHO_MAX_KEEPALIVE = int(os.getenv("WHO_MAX_KEEPALIVE", "10"))
+WHO_KEEPALIVE_EXPIRY = float(os.getenv("WHO_KEEPALIVE_EXPIRY", "60"))
+
+# auto: answer locally once a full release is imported; local: always; live: WHO first
+ICD_SEARCH_MODE = os.getenv("ICD_SEARCH_MODE", "auto")
+
+ICD_CACHE_BATCH_SIZE = int(os.getenv("ICD_CACHE_BATCH_SIZE", "200"))
+ICD_CACHE_FLUSH_SECONDS = float(os.getenv("ICD_CACHE_FLUSH_SECONDS", "2"))
+
+_client = None
+_token_lock = asyncio.Lock()
+
+def _http2_available():
+    try:
+        import h2  # noqa: F401  (installed by httpx[http2])
+        return True
+    except ImportError:
+        return False
+
+def get_who_client():
+    """Long-lived client so WHO calls reuse pooled keep-alive connections"""
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            http2=WHO_HTTP2 and _http2_available(),
+            timeout=WHO_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=WHO_MAX_CONNECTIONS,
+                max_keepalive_connections=WHO_MAX_KEEPALIVE,
+                keepalive_expiry=WHO_KEEPALIVE_EXPIRY,
+            ),
+        )
+    return _client
+
+async def close_who_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _token_valid():
+    return WHO_TOKEN and time.time() < WHO_TOKEN_EXPIRES - 30
+
+async def _fetch_who_token():
     # NOTE: replace token endpoint path with real WHO docs endpoint
-    async with httpx.AsyncClient() as client:
-        r = await client.post(WHO_TOKEN_URL, data={
+    start = time.perf_counter()
+    try:
+        r = await get_who_client().post(WHO_TOKEN_URL, data={
             "grant_type":"client_credentials",
             "client_id": WHO_CLIENT_ID,
             "client_secret": WHO_CLIENT_SECRET
-        }, timeout=10)
-        r.raise_for_status()
-        data = r.json()
-        WHO_TOKEN = data["access_token"]
-        WHO_TOKEN_EXPIRES = time.time() + int(data.get("expires_in", 3600))
+        })
+    finally:
+        add_upstream_time((time.perf_counter() - start) * 1000)
+    r.raise_for_status()
+    data = r.json()
+    return data["access_token"], time.time() + int(data.get("expires_in", 3600))
+
+async def _shared_token():
+    """(token, expires) from the table other worker processes write, if still valid"""
+    shared = await run_db(shared_state.get, "who_token")
+    if shared and time.time() < shared[1] - 30:
+        return shared
+    return None
+
+# Simple token fetch (if you have WHO credentials). If not set, we skip live WHO calls.
+async def get_who_token():
+    global WHO_TOKEN, WHO_TOKEN_EXPIRES
+    if not WHO_CLIENT_ID or not WHO_CLIENT_SECRET:
+        return None
+    if _token_valid():
         return WHO_TOKEN
+    # Single flight: one refresh at a time, later waiters reuse its token.
+    # The lock covers this process; the shared_state lease covers the others.
+    async with _token_lock:
+        if _token_valid():
+            return WHO_TOKEN
+        deadline = time.monotonic() + WHO_TIMEOUT + 5
+        while True:
+            shared = await _shared_token()
+            if shared:
+                WHO_TOKEN, WHO_TOKEN_EXPIRES = shared
+                return WHO_TOKEN
+            if await run_db(shared_state.acquire_lease, "who_token", WHO_TIMEOUT + 5):
+                try:
+                    WHO_TOKEN, WHO_TOKEN_EXPIRES = await _fetch_who_token()
+                    await run_db(shared_state.put, "who_token", [WHO_TOKEN, WHO_TOKEN_EXPIRES], WHO_TOKEN_EXPIRES)
+                finally:
+                    await run_db(shared_state.release_lease, "who_token")
+                return WHO_TOKEN
+            if time.monotonic() > deadline:
+                raise TimeoutError("Timed out waiting for another worker's WHO token refresh")
+            # another worker is fetching; its token lands in shared_state
+            await asyncio.sleep(0.05)
 
-async def search_who_icd(query: str, limit: int = 8):
+async def search_who_icd(query: str, limit: int = 8, language: str = "en"):
     # If no WHO credentials, return empty list (we rely on local cache)
     token = await get_who_token()
     if not token:
         return []
 
-    url = f"https://id.who.int/icd/release/11/mms/search?q={httpx.utils.quote(query)}&language=en"
+    url = f"{WHO_API_BASE}/icd/release/11/mms/search"
     headers = {"Authorization": f"Bearer {token}"}
-    async with httpx.AsyncClient() as client:
-        r = await client.get(url, headers=headers, timeout=10)
-        r.raise_for_status()
-        payload = r.json()
-        # parse response -> keep entity id and title
-        results = []
-        dest = payload.get("destinationEntities") or payload.get("destinationEntities",[])
-        for ent in dest[:limit]:
-            code = ent.get("id")
-            title = ent.get("title",{}).get("value","")
-            module = ent.get("chapter","") or "Biomed"
-            results.append({"code": code, "display": title, "module": module, "raw": ent})
-            # cache into DB
-            cache_icd(code, title, module, ent)
-        return results
+    start = time.perf_counter()
+    try:
+        r = await get_who_client().get(url, params={"q": query, "language": language}, headers=headers)
+    finally:
+        add_upstream_time((time.perf_counter() - start) * 1000)
+    r.raise_for_status()
+    payload = r.json()
+    # parse response -> keep entity id and title
+    results = []
+    dest = payload.get("destinationEntities") or payload.get("destinationEntities",[])
+    for ent in dest[:limit]:
+        code = ent.get("id")
+        title = ent.get("title",{}).get("value","")
+        module = ent.get("chapter","") or "Biomed"
+        results.append({"code": code, "display": title, "module": module, "raw": ent})
+        # queue for the write-behind cache writer; no disk sync on this path
+        icd_cache_writer.add(code, title, module, ent)
+    return results
+
+def _icd_row(code, display, module, raw):
+    return (code, display, module, json.dumps(raw), int(time.time()))
+
+# bumped after every icd_cache write (by shared_watcher for other processes); keys response caches
+icd_cache_version = 0
+
+def bump_icd_cache_version():
+    global icd_cache_version
+    icd_cache_version += 1
+
+def write_icd_rows(rows):
+    """Upsert icd_cache rows in a single transaction"""
+    with connection() as conn:
+        conn.executemany("INSERT OR REPLACE INTO icd_cache(code, display, module, raw_json, last_synced) VALUES (?,?,?,?,?)",
+                         rows)
+        shared_state.bump_generation(conn, "icd_cache")
+    bump_icd_cache_version()
 
 def cache_icd(code, display, module, raw):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("INSERT OR REPLACE INTO icd_cache(code, display, module, raw_json, last_synced) VALUES (?,?,?,?,?)",
-                (code, display, module, json.dumps(raw), int(time.time())))
-    conn.commit()
-    conn.close()
-
-def search_cached_icd(query):
-    # very simple: look for code or display LIKE
-    conn = get_conn()
-    cur = conn.cursor()
-    qlike = f"%{query}%"
-    cur.execute("SELECT code,display,module FROM icd_cache WHERE display LIKE ? OR code LIKE ? LIMIT 20", (qlike, qlike))
-    rows = cur.fetchall()
-    conn.close()
-    return [{"code": r["code"], "display": r["display"], "module": r["module"]} for r in rows]
\ No newline at end of file
+    write_icd_rows([_icd_row(code, display, module, raw)])
+
+class ICDCacheWriter:
+    """Write-behind buffer for icd_cache.
+
+    Entities from WHO searches are collected in memory (latest per code wins)
+    and flushed with one executemany transaction when ICD_CACHE_BATCH_SIZE rows
+    are pending or every ICD_CACHE_FLUSH_SECONDS, and once more on shutdown.
+    """
+
+    def __init__(self, batch_size=ICD_CACHE_BATCH_SIZE, interval=ICD_CACHE_FLUSH_SECONDS):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._pending = {}
+        self._wake = None
+        self._task = None
+
+    def add(self, code, display, module, raw):
+        self._pending[code] = _icd_row(code, display, module, raw)
+        if len(self._pending) >= self.batch_size and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        rows, self._pending = list(self._pending.values()), {}
+        try:
+            await run_db(write_icd_rows, rows)
+        except Exception:
+            # keep unwritten rows unless a newer version arrived meanwhile
+            for row in rows:
+                self._pending.setdefault(row[0], row)
+            raise
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("ICD cache flush failed:", e)
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+icd_cache_writer = ICDCacheWriter()
+
+# ------------------- WHO entity lookup -------------------
+WHO_RELEASE = os.getenv("WHO_RELEASE", "2024-01")
+WHO_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+ICD_RESOLVE_CONCURRENCY = int(os.getenv("ICD_RESOLVE_CONCURRENCY", "8"))
+ICD_RESOLVE_MAX_RETRIES = int(os.getenv("ICD_RESOLVE_MAX_RETRIES", "3"))
+ICD_RESOLVE_BACKOFF = float(os.getenv("ICD_RESOLVE_BACKOFF", "0.5"))
+ICD_RESOLVE_MAX_BACKOFF = float(os.getenv("ICD_RESOLVE_MAX_BACKOFF", "30"))
+# how long a problem save waits for unknown codes before answering without them
+ICD_RESOLVE_TIMEOUT = float(os.getenv("ICD_RESOLVE_TIMEOUT", "3"))
+
+def who_configured():
+    return bool(WHO_CLIENT_ID and WHO_CLIENT_SECRET)
+
+def entity_text(value):
+    if isinstance(value, dict):
+        value = value.get("@value") or value.get("value")
+    return value or ""
+
+def who_url(url):
+    # entity ids are http://id.who.int/... URIs; send them to the configured base
+    parts = urlsplit(url)
+    return WHO_API_BASE.rstrip("/") + parts.path + (f"?{parts.query}" if parts.query else "")
+
+class WHOFetcher:
+    """GETs of WHO entities with retry.
+
+    429, 5xx and transport errors are retried with exponential backoff
+    (honouring Retry-After, capped at max_backoff); the backoff pauses every
+    request made through this fetcher, so concurrent callers slow down
+    together instead of hammering a rate-limited API.
+    """
+
+    def __init__(self, max_retries, backoff, max_backoff):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self._pause_until = 0.0
+        self.stats = {"retries": 0, "rateLimited": 0}
+
+    def backoff_seconds(self):
+        return max(self._pause_until - time.monotonic(), 0)
+
+    def _back_off(self, attempt, response):
+        delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = min(max(delay, float(retry_after)), self.max_backoff)
+        self._pause_until = max(self._pause_until, time.monotonic() + delay)
+
+    async def get(self, url, token):
+        """GET a WHO resource as JSON; None on 404"""
+        headers = {"Authorization": f"Bearer {token}", "Accept": "application/json",
+                   "API-Version": "v2", "Accept-Language": "en"}
+        for attempt in range(self.max_retries + 1):
+            delay = self.backoff_seconds()
+            if delay:
+                await asyncio.sleep(delay)
+            response = None
+            start = time.perf_counter()
+            try:
+                response = await get_who_client().get(who_url(url), headers=headers)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+            else:
+                if response.status_code == 404:
+                    return None
+                if response.status_code not in WHO_RETRY_STATUSES:
+                    response.raise_for_status()
+                    return response.json()
+                if response.status_code == 429:
+                    self.stats["rateLimited"] += 1
+                if attempt == self.max_retries:
+                    response.raise_for_status()
+            finally:
+                add_upstream_time((time.perf_counter() - start) * 1000)
+            self.stats["retries"] += 1
+            self._back_off(attempt, response)
+
+    async def entity(self, code, token, raw=None):
+        """The WHO entity for an entity URI or a bare MMS code (resolved through
+        codeinfo); `raw` is a cached entity whose id is used if present"""
+        url = (raw or {}).get("id") or (raw or {}).get("@id") or (code if code.startswith("http") else None)
+        if not url:
+            info = await self.get(f"/icd/release/11/{WHO_RELEASE}/mms/codeinfo/{code}", token)
+            url = info and info.get("stemId")
+            if not url:
+                return None
+        return await self.get(url, token)
+
+def cached_icd_entries(codes, concept_map=True):
+    """{code: entry} for codes icd_cache (or, failing that, concept_map) already knows"""
+    param = json.dumps(list(codes))
+    sql = "SELECT code, display, module FROM icd_cache WHERE code IN (SELECT value FROM json_each(?))"
+    params = (param,)
+    if concept_map:
+        sql += """ UNION ALL
+               SELECT icd_code, icd_display, module FROM concept_map
+               WHERE icd_code IN (SELECT value FROM json_each(?))"""
+        params = (param, param)
+    with connection() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    entries = {}
+    for r in rows:
+        entries.setdefault(r["code"], {"code": r["code"], "display": r["display"], "module": r["module"]})
+    return entries
+
+class ICDResolver:
+    """Batch lookup of ICD-11 codes / entity URIs, filling icd_cache.
+
+    Codes icd_cache already has are answered by one query. The rest are
+    fetched from WHO, at most `concurrency` at a time, through a WHOFetcher;
+    a code another caller is already fetching is awaited instead of fetched
+    again. Everything one call fetched is written to icd_cache in a single
+    transaction before the callers waiting on those codes are released.
+    """
+
+    def __init__(self, concurrency=ICD_RESOLVE_CONCURRENCY):
+        self.concurrency = concurrency
+        self.fetcher = WHOFetcher(ICD_RESOLVE_MAX_RETRIES, ICD_RESOLVE_BACKOFF, ICD_RESOLVE_MAX_BACKOFF)
+        self._sem = None
+        self._inflight = {}  # code -> future of its entry (None if WHO has none)
+        self.stats = {"requested": 0, "cached": 0, "fetched": 0, "coalesced": 0, "notFound": 0, "failed": 0}
+
+    async def _fetch(self, code, token):
+        async with self._sem:
+            try:
+                ent = await self.fetcher.entity(code, token)
+            except Exception as e:
+                self.stats["failed"] += 1
+                print(f"ICD lookup of {code} failed:", e)
+                return None
+        display = entity_text(ent.get("title")) if ent else ""
+        if not display:
+            self.stats["notFound"] += 1
+            return None
+        return ent, display
+
+    async def resolve(self, codes, concept_map=True):
+        """{code: {"code", "display", "module"}} for each code known locally or
+        to WHO; codes neither knows are left out. With concept_map=False only
+        icd_cache counts as known locally."""
+        codes = {c for c in codes if c}
+        if not codes:
+            return {}
+        self.stats["requested"] += len(codes)
+        found = await run_db(cached_icd_entries, codes, concept_map)
+        self.stats["cached"] += len(found)
+        missing = codes - found.keys()
+        if not missing:
+            return found
+        token = await get_who_token()
+        if not token:
+            return found
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.concurrency)
+
+        loop = asyncio.get_running_loop()
+        owned, waiting = {}, {}
+        for code in missing:
+            if code in self._inflight:
+                waiting[code] = self._inflight[code]
+            else:
+                owned[code] = self._inflight[code] = loop.create_future()
+        self.stats["coalesced"] += len(waiting)
+
+        fetched = {}
+        try:
+            if owned:
+                results = await asyncio.gather(*(self._fetch(code, token) for code in owned))
+                rows = []
+                for code, result in zip(owned, results):
+                    if result:
+                        ent, display = result
+                        module = ent.get("chapter") or "Biomed"
+                        rows.append(_icd_row(code, display, module, ent))
+                        fetched[code] = {"code": code, "display": display, "module": module}
+                if rows:
+                    await run_db(write_icd_rows, rows)
+                    self.stats["fetched"] += len(rows)
+        except BaseException:
+            fetched = {}
+            raise
+        finally:
+            for code, future in owned.items():
+                del self._inflight[code]
+                if not future.done():
+                    future.set_result(fetched.get(code))
+        found.update(fetched)
+        for code, future in waiting.items():
+            entry = await asyncio.shield(future)
+            if entry:
+                found[code] = entry
+        return found
+
+icd_resolver = ICDResolver()
+
+def _report_background_failure(task):
+    if not task.cancelled() and task.exception():
+        print("ICD lookup failed:", task.exception())
+
+async def resolve_icd_codes(codes, timeout=ICD_RESOLVE_TIMEOUT):
+    """Fill icd_cache for codes about to be saved: codes only concept_map
+    knows are fetched too, since saved Conditions take displays from
+    icd_cache. Gives up waiting after `timeout` (the lookup carries on and
+    fills icd_cache for next time) and never raises"""
+    if not who_configured():
+        return None
+    task = asyncio.ensure_future(icd_resolver.resolve(codes, concept_map=False))
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), timeout)
+    except asyncio.TimeoutError:
+        task.add_done_callback(_report_background_failure)
+    except Exception as e:
+        print("ICD lookup failed:", e)
+    return None
+
+async def warm_icd_cache(limit=1000):
+    """Resolve concept_map ICD codes that icd_cache has no entry for yet"""
+    rows = await run_db(fetch_all, """
+        SELECT DISTINCT cm.icd_code FROM concept_map cm
+        WHERE NOT EXISTS (SELECT 1 FROM icd_cache c WHERE c.code = cm.icd_code) LIMIT ?""", (limit,))
+    codes = {r[0] for r in rows}
+    resolved = await icd_resolver.resolve(codes, concept_map=False)
+    return {"missing": len(codes), "resolved": len([c for c in codes if c in resolved])}
+
+# ------------------- Local search -------------------
+_has_fts = None
+_local_release = None
+
+def _fts_ready(conn):
+    global _has_fts
+    if _has_fts is None:
+        _has_fts = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'icd_fts'").fetchone() is not None
+    return _has_fts
+
+def load_local_release():
+    """Remember the latest bulk-imported ICD-11 release, if any"""
+    global _local_release
+    with connection() as conn:
+        row = conn.execute("SELECT release, entities, imported_at FROM icd_import_log ORDER BY id DESC LIMIT 1").fetchone()
+    _local_release = dict(row) if row else None
+    return _local_release
+
+def local_search_first():
+    """Whether /api/icd/search should answer from icd_cache before asking WHO"""
+    if ICD_SEARCH_MODE == "local":
+        return True
+    return ICD_SEARCH_MODE == "auto" and _local_release is not None
+
+_RANKED_SELECT = """
+    SELECT c.code, c.display, c.module FROM icd_cache c
+    {join} WHERE {where}
+    ORDER BY CASE WHEN c.code = :q COLLATE NOCASE THEN 0
+                  WHEN c.code LIKE :prefix THEN 1
+                  WHEN c.display LIKE :prefix THEN 2
+                  ELSE 3 END, {rank} length(c.display)
+    LIMIT :limit"""
+
+def search_cached_icd(query, limit=20):
+    """Ranked search over icd_cache: exact code, code prefix, title prefix, then relevance"""
+    query = query.strip()
+    params = {"q": query, "prefix": f"{query}%", "limit": limit}
+    terms = query.replace('"', " ").split()
+    long_terms = [t for t in terms if len(t) >= 3]
+
+    with connection() as conn:
+        if long_terms and _fts_ready(conn):
+            # trigram FTS needs 3+ characters; shorter terms filter the hits
+            params["match"] = " AND ".join(f'"{t}"' for t in long_terms)
+            where = ["icd_fts MATCH :match"]
+            for i, t in enumerate(t for t in terms if len(t) < 3):
+                params[f"short{i}"] = f"%{t}%"
+                where.append(f"(c.code LIKE :short{i} OR c.display LIKE :short{i})")
+            sql = _RANKED_SELECT.format(join="JOIN icd_fts f ON f.rowid = c.rowid",
+                                        where=" AND ".join(where), rank="bm25(icd_fts),")
+        else:
+            params["like"] = f"%{query}%"
+            sql = _RANKED_SELECT.format(join="", where="c.display LIKE :like OR c.code LIKE :like", rank="")
+        rows = conn.execute(sql, params).fetchall()
+    return [{"code": r["code"], "display": r["display"], "module": r["module"]} for r in rows]
@@ -0,0 +1,116 @@
+# backend/icd_import.py
+"""Bulk-import an ICD-11 MMS release into icd_cache.
+
+Accepts the WHO simple tabulation (tab- or comma-separated, with Code/Title/
+ChapterNo columns) or a JSON dump (array or JSON Lines of entities). The file
+is streamed and written in large batched transactions; the trigram index
+(icd_fts) is maintained by triggers as rows land.
+
+    python icd_import.py LinearizationMiniOutput-MMS-en.txt --release 2024-01
+"""
+import argparse
+import csv
+import json
+import time
+from pathlib import Path
+
+from db import get_conn, init_db
+from jsonstream import iter_json_records
+
+IMPORT_BATCH_SIZE = 5000
+
+UPSERT_SQL = """INSERT OR REPLACE INTO icd_cache(code, display, module, raw_json, last_synced)
+                VALUES (?,?,?,?,?)"""
+
+
+def _module(chapter):
+    chapter = str(chapter or "").strip()
+    # Chapter 26 is the Traditional Medicine (TM2) chapter
+    if chapter in ("26", "TM2"):
+        return "TM2"
+    return chapter or "Biomed"
+
+
+def _title(value):
+    if isinstance(value, dict):
+        value = value.get("@value") or value.get("value") or ""
+    # tabulation titles are indented with "- " per depth level
+    return str(value or "").lstrip("- ").strip()
+
+
+def tabulation_rows(path):
+    """Yield entity dicts from a WHO simple tabulation file"""
+    with open(path, newline="", encoding="utf-8-sig") as fp:
+        header = fp.readline()
+        delimiter = "\t" if "\t" in header else ","
+        fp.seek(0)
+        for row in csv.DictReader(fp, delimiter=delimiter):
+            yield {
+                "code": (row.get("Code") or "").strip(),
+                "title": _title(row.get("Title")),
+                "chapter": row.get("ChapterNo"),
+                "id": row.get("Linearization URI") or row.get("Foundation URI"),
+                "classKind": row.get("ClassKind"),
+            }
+
+
+def json_rows(path):
+    """Yield entity dicts from a JSON array / JSON Lines dump"""
+    with open(path, "rb") as fp:
+        for ent in iter_json_records(fp):
+            yield {
+                "code": (ent.get("code") or ent.get("theCode") or "").strip(),
+                "title": _title(ent.get("title")),
+                "chapter": ent.get("chapter") or ent.get("ChapterNo"),
+                "id": ent.get("id") or ent.get("@id"),
+                "classKind": ent.get("classKind"),
+            }
+
+
+def import_release(path, release=None, batch_size=IMPORT_BATCH_SIZE):
+    """Stream `path` into icd_cache; returns the number of entities written"""
+    path = Path(path)
+    rows = json_rows(path) if path.suffix.lower() in (".json", ".jsonl", ".ndjson") else tabulation_rows(path)
+
+    init_db()
+    conn = get_conn()
+    now = int(time.time())
+    total = 0
+    batch = []
+    try:
+        for ent in rows:
+            # blocks and chapters have no code; they are not searchable terms
+            if not ent["code"] or not ent["title"]:
+                continue
+            batch.append((ent["code"], ent["title"], _module(ent["chapter"]), json.dumps(ent), now))
+            if len(batch) >= batch_size:
+                with conn:
+                    conn.executemany(UPSERT_SQL, batch)
+                total += len(batch)
+                batch = []
+                print(f"  {total} entities...")
+        with conn:
+            if batch:
+                conn.executemany(UPSERT_SQL, batch)
+            conn.execute(
+                "INSERT INTO icd_import_log(release, source, entities, imported_at) VALUES (?,?,?,?)",
+                (release or path.stem, path.name, total + len(batch), now),
+            )
+        total += len(batch)
+        # refresh planner statistics for the newly loaded table
+        conn.execute("ANALYZE icd_cache")
+    finally:
+        conn.close()
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="ICD-11 MMS tabulation (.txt/.tsv/.csv) or JSON dump (.json/.jsonl)")
+    parser.add_argument("--release", help="release label, e.g. 2024-01 (defaults to the file name)")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    count = import_release(args.file, args.release, args.batch_size)
+    print(f"Imported {count} ICD-11 entities in {time.perf_counter() - start:.1f}s")
@@ -0,0 +1,172 @@
+# backend/icd_refresh.py
+"""Background refresh of stale icd_cache entries from the WHO API.
+
+Entries whose last_synced is older than ICD_REFRESH_MAX_AGE are re-fetched
+in batches, most-hit first. Requests run concurrently behind a semaphore;
+a 429 or 5xx pauses every worker (honouring Retry-After) with exponential
+backoff, and each batch is written back in one transaction.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+import icd_client
+import shared_state
+from db import connection, run_db
+
+ICD_REFRESH_ENABLED = os.getenv("ICD_REFRESH_ENABLED", "1") == "1"
+ICD_REFRESH_INTERVAL = float(os.getenv("ICD_REFRESH_INTERVAL", "300"))
+ICD_REFRESH_MAX_AGE = float(os.getenv("ICD_REFRESH_MAX_AGE", str(7 * 86400)))
+ICD_REFRESH_BATCH_SIZE = int(os.getenv("ICD_REFRESH_BATCH_SIZE", "200"))
+ICD_REFRESH_CONCURRENCY = int(os.getenv("ICD_REFRESH_CONCURRENCY", "4"))
+ICD_REFRESH_MAX_RETRIES = int(os.getenv("ICD_REFRESH_MAX_RETRIES", "4"))
+ICD_REFRESH_BACKOFF = float(os.getenv("ICD_REFRESH_BACKOFF", "1"))
+ICD_REFRESH_MAX_BACKOFF = float(os.getenv("ICD_REFRESH_MAX_BACKOFF", "60"))
+# hit counts are halved every cycle so priority follows recent use
+ICD_HIT_DECAY = 0.5
+
+
+def _store_hits(hits, decay):
+    with connection() as conn:
+        conn.execute("UPDATE icd_hits SET hits = hits * ?", (decay,))
+        conn.executemany(
+            """INSERT INTO icd_hits(code, hits, last_hit) VALUES (?, ?, ?)
+               ON CONFLICT(code) DO UPDATE SET hits = hits + excluded.hits, last_hit = excluded.last_hit""",
+            [(code, n, int(time.time())) for code, n in hits.items()],
+        )
+        conn.execute("DELETE FROM icd_hits WHERE hits < 0.01")
+
+
+def _stale_entries(cutoff, limit):
+    with connection() as conn:
+        total = conn.execute("SELECT COUNT(*) FROM icd_cache WHERE last_synced < ?", (cutoff,)).fetchone()[0]
+        rows = conn.execute(
+            """SELECT c.code, c.module, c.raw_json FROM icd_cache c
+               LEFT JOIN icd_hits h ON h.code = c.code
+               WHERE c.last_synced < ?
+               ORDER BY COALESCE(h.hits, 0) DESC, c.last_synced
+               LIMIT ?""",
+            (cutoff, limit),
+        ).fetchall()
+    return total, [(r["code"], r["module"], r["raw_json"]) for r in rows]
+
+
+def _touch(codes):
+    """Mark entries WHO no longer has as checked, so they are not retried every cycle"""
+    with connection() as conn:
+        conn.executemany("UPDATE icd_cache SET last_synced = ? WHERE code = ?",
+                         [(int(time.time()), code) for code in codes])
+
+
+class ICDRefreshScheduler:
+    def __init__(self, interval=ICD_REFRESH_INTERVAL, max_age=ICD_REFRESH_MAX_AGE,
+                 batch_size=ICD_REFRESH_BATCH_SIZE, concurrency=ICD_REFRESH_CONCURRENCY):
+        self.interval = interval
+        self.max_age = max_age
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self._hits = Counter()
+        self._task = None
+        self._wake = None
+        self.fetcher = icd_client.WHOFetcher(ICD_REFRESH_MAX_RETRIES, ICD_REFRESH_BACKOFF, ICD_REFRESH_MAX_BACKOFF)
+        self.progress = {
+            "state": "idle", "cycles": 0, "stale": 0, "batch": 0, "done": 0,
+            "refreshed": 0, "notFound": 0, "failed": 0,
+            "lastStarted": None, "lastFinished": None, "lastError": None,
+        }
+
+    def record_hits(self, codes):
+        """Count cached codes served to clients; most-hit stale entries refresh first"""
+        self._hits.update(codes)
+
+    async def _refresh_one(self, sem, entry, token, rows, missing):
+        code, module, raw_json = entry
+        async with sem:
+            try:
+                ent = await self.fetcher.entity(code, token, json.loads(raw_json) if raw_json else None)
+            except Exception as e:
+                self.progress["failed"] += 1
+                self.progress["lastError"] = f"{code}: {e}"
+                return
+            finally:
+                self.progress["done"] += 1
+        if ent is None:
+            missing.append(code)
+            self.progress["notFound"] += 1
+            return
+        display = icd_client.entity_text(ent.get("title"))
+        if not display:
+            missing.append(code)
+            return
+        rows.append(icd_client._icd_row(code, display, module, ent))
+
+    async def run_once(self):
+        """Refresh one batch of the stalest, most-hit entries; returns the count refreshed"""
+        token = await icd_client.get_who_token()
+        if not token:
+            self.progress["state"] = "disabled (no WHO credentials)"
+            return 0
+        # one worker process refreshes per interval
+        if not await run_db(shared_state.acquire_lease, "icd_refresh", self.interval * 0.9):
+            self.progress["state"] = "idle (another worker is refreshing)"
+            return 0
+
+        hits, self._hits = self._hits, Counter()
+        await run_db(_store_hits, hits, ICD_HIT_DECAY)
+        stale, entries = await run_db(_stale_entries, int(time.time() - self.max_age), self.batch_size)
+        self.progress.update(state="running", stale=stale, batch=len(entries), done=0,
+                             lastStarted=time.time())
+
+        rows, missing = [], []
+        sem = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(self._refresh_one(sem, e, token, rows, missing) for e in entries))
+        if rows:
+            await run_db(icd_client.write_icd_rows, rows)
+        if missing:
+            await run_db(_touch, missing)
+
+        self.progress["refreshed"] += len(rows)
+        self.progress["cycles"] += 1
+        self.progress.update(state="idle", stale=stale - len(rows) - len(missing), lastFinished=time.time())
+        return len(rows)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                self.progress.update(state="idle", lastError=str(e))
+                print("ICD cache refresh failed:", e)
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    def trigger(self):
+        """Start the next cycle now instead of waiting for the interval"""
+        if self._wake is not None:
+            self._wake.set()
+
+    def start(self):
+        if self._task is None and ICD_REFRESH_ENABLED:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self):
+        return dict(self.progress, **self.fetcher.stats, pendingHits=len(self._hits), running=self._task is not None,
+                    backoffSeconds=round(self.fetcher.backoff_seconds(), 3))
+
+
+icd_refresher = ICDRefreshScheduler()
@@ -0,0 +1,140 @@
+# backend/jsonstream.py
+import codecs
+import json
+
+_WS = " \t\r\n"
+_VALUE_END = _WS + ",]}:"
+
+
+class JSONStreamReader:
+    """Incremental JSON reader over a text stream.
+
+    Decodes one value at a time with json's raw_decode, reading more of the
+    stream only when the buffered text ends mid-value, so memory stays bounded
+    by the largest single value rather than the whole document.
+    """
+
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self._decoder = json.JSONDecoder()
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+
+    def _fill(self):
+        if self.eof:
+            return False
+        while True:
+            raw = self.fp.read(self.chunk_size)
+            chunk = self._utf8.decode(raw, final=not raw) if isinstance(raw, bytes) else raw
+            if chunk or not raw:
+                break  # else: only part of a multi-byte character so far
+        if not chunk:
+            self.eof = True
+            return False
+        # drop consumed text so the buffer does not grow with the document
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character ('' at end of stream)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in _WS:
+                self.pos += 1
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} at offset {self.pos}, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                # A number cut at the buffer edge ("1" of "1.5") still decodes;
+                # only trust values followed by a delimiter.
+                if self.eof or (end < len(self.buf) and self.buf[end] in _VALUE_END):
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if not self._fill():
+                value, end = self._decoder.raw_decode(self.buf, self.pos)
+                self.pos = end
+                return value
+
+    def items(self):
+        """Yield the elements of the array starting at the current position"""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            sep = self.peek()
+            self.pos += 1
+            if sep == "]":
+                return
+            if sep != ",":
+                raise ValueError(f"Expected ',' or ']' at offset {self.pos - 1}, found {sep!r}")
+
+    def _separator(self, close):
+        sep = self.peek()
+        self.pos += 1
+        if sep not in (",", close):
+            raise ValueError(f"Expected ',' or {close!r} at offset {self.pos - 1}, found {sep!r}")
+        return sep
+
+    def members_until(self, key):
+        """Decode object members up to `key`, leaving the reader at its value.
+
+        Returns (members seen before `key`, whether `key` was found).
+        """
+        self.expect("{")
+        members = {}
+        if self.peek() == "}":
+            self.pos += 1
+            return members, False
+        while True:
+            name = self.value()
+            self.expect(":")
+            if name == key:
+                return members, True
+            members[name] = self.value()
+            if self._separator("}") == "}":
+                return members, False
+
+    def remaining_members(self):
+        """Decode the members left in the current object after a value"""
+        members = {}
+        while self._separator("}") == ",":
+            name = self.value()
+            self.expect(":")
+            members[name] = self.value()
+        return members
+
+
+def iter_array(fp):
+    """Stream the elements of a top-level JSON array"""
+    return JSONStreamReader(fp).items()
+
+
+def iter_json_records(fp):
+    """Stream records from a JSON array or a JSON Lines file"""
+    reader = JSONStreamReader(fp)
+    if reader.peek() == "[":
+        yield from reader.items()
+        return
+    while reader.peek():
+        yield reader.value()
@@ -1,23 +1,53 @@
 # backend/main.py
 
+import asyncio
+import gc
 import json
+import os
+import tempfile
 from pathlib import Path
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
-from datetime import datetime
 import sqlite3
-import time
 
 # Local modules
-from db import get_conn, init_db, seed_sample_data
-from icd_client import search_who_icd, search_cached_icd, cache_icd
+import icd_client
+from analytics import TOP_ICD_MAX, category_counts, daily_volume, top_icd_codes
+from bundle import process_bundle, scan_bundle
+from concept_map_cache import concept_map_cache
+from db import CONCEPT_MAP_ICD_DISPLAY, fetch_all, get_conn, init_db, run_db, shutdown_db
+from export import ProblemExport, stream_export
+from icd_client import (
+    ICD_SEARCH_MODE, close_who_client, get_who_client, icd_cache_writer, icd_resolver, load_local_release,
+    local_search_first, resolve_icd_codes, search_who_icd, search_cached_icd, warm_icd_cache, who_configured,
+)
+from icd_refresh import icd_refresher
+from mapping_suggest import suggest_mappings
+from pagination import KeysetQuery, stream_ndjson
+from problems import save_problems
+from query_cache import icd_query_cache, query_key
+from reference_data import load_reference_data, refresh_caches
+from responses import FastJSONResponse, etag_response, response_cache
+from search_hits import namaste_search_key, search_hits
+from search_index import namaste_index
+from shared_state import shared_watcher
+from telemetry import TELEMETRY_BUFFER_SIZE, TelemetryMiddleware, telemetry
+from unified_search import unified_search
+from warmup import readiness, start_warm_up, stop_warm_up
 
 # --------------------------------------------------
 # App setup
 # --------------------------------------------------
-app = FastAPI(title="AYUSYNC API")
+app = FastAPI(title="AYUSYNC API", default_response_class=FastJSONResponse)
+
+PROBLEM_BATCH_MAX = int(os.getenv("PROBLEM_BATCH_MAX", "10000"))
+ICD_RESOLVE_MAX_CODES = int(os.getenv("ICD_RESOLVE_MAX_CODES", "1000"))
+BUNDLE_SPOOL_BYTES = int(os.getenv("BUNDLE_SPOOL_BYTES", str(8 * 1024 * 1024)))
+PATIENT_PAGE_MAX = 1000
+HEALTH_DB_TIMEOUT = float(os.getenv("HEALTH_DB_TIMEOUT", "2"))
 
 # Allow Next.js frontend
 app.add_middleware(
@@ -26,13 +56,76 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
+# Request telemetry (latency, DB/WHO time, cache result) for /api/logs/recent and /metrics
+app.add_middleware(TelemetryMiddleware)
+
 # Initialize DB on startup
 @app.on_event("startup")
 def startup():
     init_db()
-    seed_sample_data()
+    # incremental and non-destructive; a no-op when the source files are unchanged
+    try:
+        reference = load_reference_data()
+    except ValueError as e:
+        # keep serving what was loaded last; fix the file and POST /api/reference/reload
+        print("Reference data not loaded:", e)
+    else:
+        for name, counts in reference["sources"].items():
+            print(f"Reference data {name}: {counts}")
+    load_namaste_index()
+    concept_map_cache.reload()
+    release = load_local_release()
+    if release:
+        print(f"Local ICD-11 release {release['release']} ({release['entities']} entities)")
+
+def load_namaste_index():
+    """Build the in-memory NAMASTE search index from the namaste table"""
+    conn = get_conn()
+    cur = conn.cursor()
+    cur.execute("SELECT code, display, category FROM namaste")
+    # millions of small long-lived objects: collections during the build
+    # would only rescan what was just built (~20% of the build time)
+    gc.disable()
+    try:
+        namaste_index.build(cur.fetchall())
+    finally:
+        gc.enable()
+    conn.close()
+    print(f"NAMASTE search index built ({len(namaste_index)} codes)")
+
+def sync_namaste_index():
+    """Another worker changed namaste: re-index the rows that changed"""
+    changed = namaste_index.sync(fetch_all("SELECT code, display, category FROM namaste"))
+    print(f"NAMASTE search index synced ({changed} codes changed)")
+
+@app.on_event("startup")
+async def start_background_tasks():
+    get_who_client()
+    icd_cache_writer.start()
+    icd_refresher.start()
+    search_hits.start()
+    # keep in-memory copies in step with other worker processes
+    shared_watcher.watch("namaste", sync_namaste_index)
+    shared_watcher.watch("concept_map", concept_map_cache.sync)
+    shared_watcher.watch("icd_cache", icd_client.bump_icd_cache_version)
+    shared_watcher.start()
+    await icd_query_cache.purge_expired()
+    # /health/ready answers 503 until this finishes
+    start_warm_up(cached_namaste_search)
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_warm_up()
+    await shared_watcher.stop()
+    await icd_refresher.stop()
+    # flush buffered ICD cache rows and search counts before the DB executor goes away
+    await icd_cache_writer.stop()
+    await search_hits.stop()
+    await close_who_client()
+    shutdown_db()
 
 # --------------------------------------------------
 # Data Models
@@ -53,11 +146,20 @@ class ProblemCreate(BaseModel):
     namasteCode: str
     icdCodes: List[str]
 
+class ProblemBatch(BaseModel):
+    problems: List[ProblemCreate]
+
 class ProblemIn(BaseModel):
     patientId: str
     namasteCode: str
     icdCode: str
 
+class ConceptMapBulkRequest(BaseModel):
+    codes: List[str]
+
+class ICDResolveRequest(BaseModel):
+    codes: List[str]
+
 class MappingSuggestion(BaseModel):
     code: str
     display: str
@@ -72,273 +174,420 @@ class MappingSuggestion(BaseModel):
 async def root():
     return {"message": "AYUSYNC API is running"}
 
+# ------------------- Health -------------------
+@app.get("/health/live")
+async def health_live():
+    """The process is up and answering requests"""
+    return {"status": "live"}
+
+@app.get("/health/ready")
+async def health_ready():
+    """200 once warm-up has finished and the database answers; 503 before
+    that and once shutdown has begun, so load balancers hold traffic back"""
+    status = readiness.status()
+    if status["ready"]:
+        try:
+            await asyncio.wait_for(run_db(fetch_all, "SELECT 1"), HEALTH_DB_TIMEOUT)
+        except Exception as e:
+            status.update(ready=False, error=f"database: {e!r}")
+    return FastJSONResponse(status, status_code=200 if status["ready"] else 503)
+
 # ------------------- NAMASTE search -------------------
 @app.get("/api/namaste/search")
-async def search_namaste(q: str = ""):
-    """Search NAMASTE codes from database"""
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    if not q:
-        cur.execute("SELECT code, display, category FROM namaste LIMIT 50")
-    else:
-        qlike = f"%{q}%"
-        cur.execute(
-            "SELECT code, display, category FROM namaste WHERE display LIKE ? OR code LIKE ? LIMIT 50", 
-            (qlike, qlike)
-        )
-    
-    rows = cur.fetchall()
-    conn.close()
-    
-    return [
-        {
-            "code": r["code"],
-            "display": r["display"], 
-            "category": r["category"],
-            "system": "urn:namaste"
-        } for r in rows
-    ]
+async def search_namaste(
+    request: Request,
+    q: str = "",
+    mode: str = Query("auto", pattern="^(exact|fuzzy|auto)$"),
+):
+    """Search NAMASTE codes via the in-memory trigram index.
+
+    mode=fuzzy matches transliteration variants and typos; auto (default)
+    falls back to fuzzy only when the exact search finds nothing.
+    """
+    if q:
+        search_hits.record("namaste", namaste_search_key(q, mode))
+    cached = cached_namaste_search(q, mode)
+    return etag_response(request, cached[1], cached[0])
+
+def cached_namaste_search(q, mode):
+    """(etag, body) of a NAMASTE search, rendered once per index version"""
+    key = ("namaste", q, mode)
+    version = namaste_index.version
+    cached = response_cache.get(key, version)
+    if cached is None:
+        cached = response_cache.put(key, version, [
+            {
+                "code": code,
+                "display": display, 
+                "category": category,
+                "system": "urn:namaste"
+            } for code, display, category in namaste_index.search_mode(q, mode)
+        ])
+    return cached
 
 # ------------------- ICD search -------------------
 @app.get("/api/icd/search")
-async def search_icd(q: str = ""):
+async def search_icd(request: Request, q: str = "", language: str = "en"):
     """Search ICD codes with WHO API fallback to cache"""
     if not q:
         # Return some default results
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute("SELECT code, display, module FROM icd_cache LIMIT 10")
-        rows = cur.fetchall()
-        conn.close()
-        return [dict(r) for r in rows]
+        version = icd_client.icd_cache_version
+        cached = response_cache.get(("icd-default",), version)
+        if cached is None:
+            rows = await run_db(fetch_all, "SELECT code, display, module FROM icd_cache LIMIT 10")
+            cached = response_cache.put(("icd-default",), version, [dict(r) for r in rows])
+        return etag_response(request, cached[1], cached[0])
+    
+    if local_search_first():
+        # Full release imported: no network round-trip on the hot path
+        results = await run_db(search_cached_icd, q, 10)
+        if results or ICD_SEARCH_MODE == "local":
+            icd_refresher.record_hits(r["code"] for r in results)
+            return results
     
     try:
-        # Try WHO API first
-        results = await search_who_icd(q, limit=10)
+        # Try WHO API first, through the query-result cache
+        key = query_key(q, 10, language)
+        search_hits.record("icd", key)
+        results = await icd_query_cache.get_or_fetch(
+            key,
+            lambda: search_who_icd(q, limit=10, language=language),
+        )
         if results:
             return results
     except Exception as e:
         print("WHO search failed:", e)
     
     # Fallback to cache
-    return search_cached_icd(q)
+    results = await run_db(search_cached_icd, q)
+    icd_refresher.record_hits(r["code"] for r in results)
+    return results
+
+@app.get("/api/icd/search/cache-stats")
+async def icd_search_cache_stats():
+    """Hit/miss counters for the ICD query-result cache"""
+    return icd_query_cache.stats()
+
+@app.get("/api/response-cache/stats")
+async def response_cache_stats():
+    """Hit/miss counters for cached terminology responses"""
+    return response_cache.stats()
+
+@app.get("/api/icd/cache/sync")
+async def icd_cache_sync_status():
+    """Progress of the background refresh of stale icd_cache entries"""
+    return icd_refresher.status()
+
+@app.post("/api/icd/cache/sync")
+async def icd_cache_sync_now():
+    """Run the next refresh cycle now"""
+    icd_refresher.trigger()
+    return icd_refresher.status()
+
+@app.post("/api/icd/resolve")
+async def resolve_icd(request: ICDResolveRequest):
+    """Look up many ICD-11 codes at once, fetching the ones icd_cache lacks from WHO"""
+    if len(request.codes) > ICD_RESOLVE_MAX_CODES:
+        raise HTTPException(status_code=413, detail=f"At most {ICD_RESOLVE_MAX_CODES} codes per request")
+    found = await icd_resolver.resolve(request.codes)
+    return {"resolved": list(found.values()), "unknown": sorted(set(request.codes) - found.keys())}
+
+@app.post("/api/icd/cache/warm")
+async def icd_cache_warm(limit: int = Query(1000, ge=1, le=10000)):
+    """Fetch concept_map ICD codes that are not in icd_cache yet"""
+    return dict(await warm_icd_cache(limit), resolver=icd_resolver.stats)
+
+# ------------------- Unified search -------------------
+@app.get("/api/search/unified")
+async def search_unified(
+    q: str = "",
+    limit: int = Query(10, ge=1, le=50),
+    language: str = "en",
+    budgetMs: Optional[float] = Query(None, ge=0, le=5000),
+):
+    """NAMASTE matches with their mappings plus ranked ICD-11 candidates in one call"""
+    q = q.strip()
+    if not q:
+        return {"query": q, "namaste": [], "icd": [], "timings": {}}
+    if budgetMs is None:
+        return await unified_search(q, limit, language)
+    return await unified_search(q, limit, language, budgetMs)
 
 # ------------------- Mapping -------------------
+@app.post("/api/concept-map/bulk")
+async def get_concept_maps_bulk(request: ConceptMapBulkRequest):
+    """Resolve ICD-11 mappings for many NAMASTE codes in one call"""
+    return Response(content=concept_map_cache.bulk_json(request.codes), media_type="application/json")
+
+@app.post("/api/concept-map/suggest")
+async def suggest_concept_maps(full: bool = False):
+    """Recompute suggested ICD-11 mappings for changed NAMASTE codes"""
+    result = await run_db(suggest_mappings, full)
+    codes = result.pop("codes")
+    await run_db(concept_map_cache.refresh, codes)
+    if "generation" in result:
+        shared_watcher.mark_seen("concept_map", result.pop("generation"))
+    return result
+
 @app.get("/api/concept-map/{namaste_code}")
-async def get_concept_map(namaste_code: str):
-    """Get ICD-11 mappings for a NAMASTE code from database"""
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Check if NAMASTE code exists
-    cur.execute("SELECT code FROM namaste WHERE code = ?", (namaste_code,))
-    if not cur.fetchone():
-        conn.close()
+async def get_concept_map(request: Request, namaste_code: str):
+    """Get ICD-11 mappings for a NAMASTE code (served from memory)"""
+    tagged = concept_map_cache.get_tagged(namaste_code)
+    if tagged is None:
         raise HTTPException(status_code=404, detail="NAMASTE code not found")
-    
-    # Get mappings from concept_map table
-    cur.execute(
-        """SELECT icd_code, icd_display, module, confidence, mapping_type 
-           FROM concept_map WHERE namaste_code = ? ORDER BY confidence DESC""",
-        (namaste_code,)
-    )
-    rows = cur.fetchall()
-    conn.close()
-    
-    if not rows:
-        return []
-    
-    return [
-        {
-            "code": r["icd_code"],
-            "display": r["icd_display"],
-            "module": r["module"],
-            "confidence": r["confidence"],
-            "mappingType": r["mapping_type"]
-        } for r in rows
-    ]
+    return etag_response(request, *tagged)
+
+@app.post("/api/reference/reload")
+async def reload_reference_data(force: bool = False):
+    """Apply changed NAMASTE/ConceptMap source files without a restart"""
+    try:
+        result = await run_db(load_reference_data, None, force)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if result["changed"]:
+        await run_db(refresh_caches, result)
+        for name, generation in result["generations"].items():
+            shared_watcher.mark_seen(name, generation)
+    return {"changed": result["changed"], "sources": result["sources"]}
 
 # ------------------- Problems -------------------
 @app.post("/api/problem-list")
 async def create_problem(problem: ProblemCreate):
     """Save dual-coded problem to database"""
-    conn = get_conn()
-    cur = conn.cursor()
-    
-    # Verify NAMASTE code exists
-    cur.execute("SELECT code FROM namaste WHERE code = ?", (problem.namasteCode,))
-    if not cur.fetchone():
-        conn.close()
+    # fetch ICD codes icd_cache lacks, so the Condition gets their displays
+    await resolve_icd_codes(problem.icdCodes)
+    conditions, rejected = await run_db(
+        save_problems, [(problem.patientId, problem.namasteCode, problem.icdCodes)]
+    )
+    if rejected:
         raise HTTPException(status_code=404, detail="NAMASTE code not found")
     
-    # Save each ICD code mapping
-    for icd_code in problem.icdCodes:
-        cur.execute(
-            """INSERT INTO problems (patient_id, namaste_code, icd_code, created_at) 
-               VALUES (?, ?, ?, ?)""",
-            (problem.patientId, problem.namasteCode, icd_code, int(time.time()))
-        )
-    
-    conn.commit()
-    
-    # Get display names for response
-    cur.execute("SELECT display FROM namaste WHERE code = ?", (problem.namasteCode,))
-    namaste_display = cur.fetchone()["display"]
-    
-    icd_displays = []
-    for icd_code in problem.icdCodes:
-        # Try to get from cache first
-        cur.execute("SELECT display FROM icd_cache WHERE code = ?", (icd_code,))
-        cached = cur.fetchone()
-        if cached:
-            icd_displays.append(cached["display"])
-        else:
-            icd_displays.append(icd_code)
-    
-    conn.close()
-    
-    # Create FHIR-like response
-    fhir_condition = {
-        "resourceType": "Condition",
-        "code": {
-            "coding": [
-                {
-                    "system": "urn:namaste",
-                    "code": problem.namasteCode,
-                    "display": namaste_display
-                }
-            ] + [
-                {
-                    "system": "http://who.int/icd11",
-                    "code": icd_code,
-                    "display": display
-                }
-                for icd_code, display in zip(problem.icdCodes, icd_displays)
-            ]
-        },
-        "subject": {"reference": f"Patient/{problem.patientId}"}
-    }
-    
     return {
         "success": True, 
         "message": "Problem saved successfully", 
-        "fhirCondition": fhir_condition
+        "fhirCondition": conditions[0]
+    }
+
+@app.post("/api/problem-list/batch")
+async def create_problems_batch(batch: ProblemBatch):
+    """Save many dual-coded problems in one transaction"""
+    if len(batch.problems) > PROBLEM_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {PROBLEM_BATCH_MAX} problems per batch")
+    
+    await resolve_icd_codes({c for p in batch.problems for c in p.icdCodes})
+    conditions, rejected = await run_db(
+        save_problems, [(p.patientId, p.namasteCode, p.icdCodes) for p in batch.problems]
+    )
+    
+    return {
+        "success": not rejected,
+        "saved": len(conditions),
+        "rejected": [
+            {"index": i, "namasteCode": batch.problems[i].namasteCode, "detail": "NAMASTE code not found"}
+            for i in rejected
+        ],
+        "fhirConditions": conditions
     }
 
+# newest first; served from idx_problems_patient (see check_schema.py)
+PATIENT_PROBLEMS = KeysetQuery(
+    "p.id, p.namaste_code, n.display AS namaste_display, p.icd_code, "
+    f"COALESCE(ic.display, {CONCEPT_MAP_ICD_DISPLAY.format('p.icd_code')}) AS icd_display, p.created_at",
+    "problems p LEFT JOIN namaste n ON n.code = p.namaste_code "
+    "LEFT JOIN icd_cache ic ON ic.code = p.icd_code",
+    ["p.created_at", "p.id"], descending=True, where="p.patient_id = ?",
+)
+
+@app.get("/api/patients/{patient_id}/problems")
+async def patient_problems(
+    patient_id: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(100, ge=1, le=PATIENT_PAGE_MAX),
+):
+    """A patient's problem list, newest first; next page cursor in X-Next-Cursor"""
+    try:
+        rows, next_cursor = await run_db(PATIENT_PROBLEMS.page, cursor, limit, (patient_id,))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse({"patientId": patient_id, "problems": rows}, headers=headers)
+
+# ------------------- Analytics -------------------
+# Served from the rollup tables save_problems maintains (see analytics.py)
+DAY_PATTERN = r"^\d{4}-\d{2}-\d{2}$"
+
+@app.get("/api/analytics/categories")
+async def analytics_categories():
+    """Saved problems per NAMASTE category"""
+    return await run_db(category_counts)
+
+@app.get("/api/analytics/top-icd")
+async def analytics_top_icd(limit: int = Query(10, ge=1, le=TOP_ICD_MAX)):
+    """Most used ICD-11 codes in saved problems"""
+    return await run_db(top_icd_codes, limit)
+
+@app.get("/api/analytics/daily")
+async def analytics_daily(
+    start: Optional[str] = Query(None, alias="from", pattern=DAY_PATTERN),
+    end: Optional[str] = Query(None, alias="to", pattern=DAY_PATTERN),
+):
+    """Dual-coded problems and ICD codings per day (UTC), oldest first"""
+    return await run_db(daily_volume, start, end)
+
+# ------------------- Export -------------------
+@app.get("/api/export/problems")
+async def export_problems(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|columnar)$"),
+    start: Optional[str] = Query(None, alias="from", pattern=DAY_PATTERN),
+    end: Optional[str] = Query(None, alias="to", pattern=DAY_PATTERN),
+    after: Optional[str] = None,
+):
+    """Stream saved problems oldest first as gzip CSV or columnar batches (see export.py)"""
+    try:
+        export = ProblemExport(fmt, start, end, after)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    filename = "problems.csv.gz" if fmt == "csv" else "problems.columnar.ndjson.gz"
+    return StreamingResponse(stream_export(export), media_type="application/gzip",
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
+
+# ------------------- FHIR Bundle -------------------
+@app.post("/api/bundle")
+async def upload_bundle(request: Request, strict_icd: bool = False):
+    """Stream a FHIR Bundle and persist its dual-coded Conditions.
+
+    The whole Bundle is parsed before anything is saved: malformed input is
+    a 400 with nothing written, so the client can fix and resend it whole.
+    """
+    # Spool the upload (to disk past BUNDLE_SPOOL_BYTES) instead of holding it in memory
+    spool = tempfile.SpooledTemporaryFile(max_size=BUNDLE_SPOOL_BYTES)
+    try:
+        async for chunk in request.stream():
+            spool.write(chunk)
+        spool.seek(0)
+        try:
+            codes = await run_db(scan_bundle, spool)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail={"error": str(e), "saved": 0})
+        spool.seek(0)
+        if strict_icd and who_configured():
+            # look up codes icd_cache lacks before they are rejected as unknown,
+            # within the limit and timeout of /api/icd/resolve and /api/problems
+            if len(codes) > ICD_RESOLVE_MAX_CODES:
+                raise HTTPException(status_code=413,
+                                    detail=f"At most {ICD_RESOLVE_MAX_CODES} distinct ICD-11 codes with strict_icd")
+            await resolve_icd_codes(codes)
+        summary = await run_db(process_bundle, spool, strict_icd)
+    finally:
+        spool.close()
+    
+    if "error" in summary:
+        raise HTTPException(status_code=400, detail=summary)
+    return {"success": summary["rejected"] == 0, **summary}
+
 # ------------------- Logs -------------------
 @app.get("/api/logs/recent")
-async def get_recent_logs():
-    return [
-        {"timestamp": datetime.now().isoformat(), "endpoint": "GET /api/namaste/search", "status": 200},
-        {"timestamp": datetime.now().isoformat(), "endpoint": "GET /api/icd/search", "status": 200},
-        {"timestamp": datetime.now().isoformat(), "endpoint": "POST /api/problem-list", "status": 201},
-    ]
+async def get_recent_logs(limit: int = Query(50, ge=1, le=TELEMETRY_BUFFER_SIZE)):
+    """Most recent requests, newest first"""
+    return telemetry.recent(limit)
+
+@app.get("/api/metrics/routes")
+async def get_route_metrics():
+    """Per-route request counts and latency percentiles since startup"""
+    return telemetry.summary()
+
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    return PlainTextResponse(telemetry.prometheus(), media_type="text/plain; version=0.0.4")
 
 # ------------------- Debug Endpoints (FIXED for your schema) -------------------
-@app.get("/api/debug/problems")
-async def debug_problems():
-    """Debug endpoint to view saved problems - FIXED"""
+# Keyset-paginated: each call returns one page as a JSON array, with the
+# cursor for the next page in the X-Next-Cursor header. format=ndjson
+# streams every row from the cursor onwards instead.
+DEBUG_PAGE_MAX = 5000
+
+DEBUG_PROBLEMS = KeysetQuery(
+    "p.*, n.display as namaste_display",
+    "problems p LEFT JOIN namaste n ON p.namaste_code = n.code",
+    ["p.created_at", "p.id"], descending=True,
+)
+DEBUG_CONCEPT_MAP = KeysetQuery(
+    "cm.*, n.display as namaste_display",
+    "concept_map cm LEFT JOIN namaste n ON cm.namaste_code = n.code",
+    ["cm.confidence", "cm.id"], descending=True,
+)
+DEBUG_NAMASTE = KeysetQuery("*", "namaste", ["code"])
+DEBUG_ICD_CACHE = KeysetQuery(
+    "code, display, module, last_synced", "icd_cache",
+    ["last_synced", "code"], descending=True,
+)
+
+async def debug_listing(name, query, cursor, limit, fmt):
+    # reject a bad cursor before a stream has sent its 200
+    try:
+        query.sql(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    if fmt == "ndjson":
+        return StreamingResponse(stream_ndjson(query, cursor), media_type="application/x-ndjson")
+    
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Get problems with namaste display names
-        cur.execute("""
-            SELECT p.*, n.display as namaste_display 
-            FROM problems p
-            LEFT JOIN namaste n ON p.namaste_code = n.code
-            ORDER BY p.created_at DESC
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        result = []
-        for row in rows:
-            result.append(dict(row))
-        
-        return result
-        
+        rows, next_cursor = await run_db(query.page, cursor, limit)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        print(f"Error in debug_problems: {e}")
+        print(f"Error in {name}: {e}")
         return {"error": str(e)}
+    
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return JSONResponse(rows, headers=headers)
+
+@app.get("/api/debug/problems")
+async def debug_problems(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=DEBUG_PAGE_MAX),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """Debug endpoint to view saved problems, newest first"""
+    return await debug_listing("debug_problems", DEBUG_PROBLEMS, cursor, limit, fmt)
 
 @app.get("/api/debug/concept-map")
-async def debug_concept_map():
-    """Debug endpoint to view concept mappings - FIXED"""
-    try:
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Get concept maps with namaste display names
-        cur.execute("""
-            SELECT cm.*, n.display as namaste_display 
-            FROM concept_map cm 
-            LEFT JOIN namaste n ON cm.namaste_code = n.code 
-            ORDER BY cm.confidence DESC
-        """)
-        rows = cur.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        result = []
-        for row in rows:
-            result.append(dict(row))
-        
-        return result
-        
-    except Exception as e:
-        print(f"Error in debug_concept_map: {e}")
-        return {"error": str(e)}
+async def debug_concept_map(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=DEBUG_PAGE_MAX),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """Debug endpoint to view concept mappings, highest confidence first"""
+    return await debug_listing("debug_concept_map", DEBUG_CONCEPT_MAP, cursor, limit, fmt)
 
 @app.get("/api/debug/namaste")
-async def debug_namaste():
-    """Debug endpoint to view NAMASTE codes - FIXED"""
-    try:
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Get all namaste codes
-        cur.execute("SELECT * FROM namaste ORDER BY code")
-        rows = cur.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        result = []
-        for row in rows:
-            result.append(dict(row))
-        
-        return result
-        
-    except Exception as e:
-        print(f"Error in debug_namaste: {e}")
-        return {"error": str(e)}
+async def debug_namaste(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=DEBUG_PAGE_MAX),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """Debug endpoint to view NAMASTE codes by code"""
+    return await debug_listing("debug_namaste", DEBUG_NAMASTE, cursor, limit, fmt)
 
 @app.get("/api/debug/icd-cache")
-async def debug_icd_cache():
-    """Debug endpoint to view ICD cache - NEW"""
-    try:
-        conn = get_conn()
-        cur = conn.cursor()
-        
-        # Get ICD cache
-        cur.execute("SELECT code, display, module, last_synced FROM icd_cache ORDER BY last_synced DESC")
-        rows = cur.fetchall()
-        conn.close()
-        
-        # Convert to list of dictionaries
-        result = []
-        for row in rows:
-            result.append(dict(row))
-        
-        return result
-        
-    except Exception as e:
-        print(f"Error in debug_icd_cache: {e}")
-        return {"error": str(e)}
+async def debug_icd_cache(
+    cursor: Optional[str] = None,
+    limit: int = Query(500, ge=1, le=DEBUG_PAGE_MAX),
+    fmt: str = Query("json", alias="format", pattern="^(json|ndjson)$"),
+):
+    """Debug endpoint to view ICD cache, most recently synced first"""
+    return await debug_listing("debug_icd_cache", DEBUG_ICD_CACHE, cursor, limit, fmt)
 
 # ------------------- Run -------------------
+# WEB_CONCURRENCY > 1 runs that many worker processes. They share the WHO
+# token, query cache and reference data through SQLite (see shared_state.py).
+# Under gunicorn: gunicorn main:app -k uvicorn.workers.UvicornWorker -w 4
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    if workers > 1:
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,284 @@
+# backend/mapping_suggest.py
+"""Suggest ICD-11 mappings for NAMASTE codes by text similarity.
+
+Every NAMASTE display and icd_cache title becomes a TF-IDF vector of
+character n-grams (sublinear tf, smoothed idf, L2-normalised), so cosine
+similarity is a dot product. Scores for a whole batch of NAMASTE codes
+against all of icd_cache come from one sparse matrix product -- with
+scipy.sparse when it is installed, otherwise from an inverted index over
+the ICD n-grams, which computes the same product without visiting pairs
+that share no n-gram.
+
+The top SUGGEST_TOP_K candidates above SUGGEST_MIN_SCORE are written to
+concept_map with mapping_type='suggested' and confidence = score * 100.
+Runs are incremental: only NAMASTE codes whose display changed since the
+last run are scored against all of icd_cache. ICD titles added or rewritten
+since the last run are scored against the other NAMASTE codes and merged
+into their stored top-k; a code whose suggestion lost its ICD title is
+rescored in full. The idf keeps drifting as icd_cache grows, so once
+SUGGEST_REFIT_FRACTION of it is newer than the last full run, everything is
+rescored.
+
+    python mapping_suggest.py [--full]
+"""
+import argparse
+import hashlib
+import math
+import os
+import time
+
+import shared_state
+from db import connection, init_db
+from search_index import normalize
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # in requirements.txt; the inverted-index product is the fallback
+    np = sparse = None
+
+SUGGEST_TOP_K = int(os.getenv("SUGGEST_TOP_K", "5"))
+SUGGEST_MIN_SCORE = float(os.getenv("SUGGEST_MIN_SCORE", "0.25"))
+SUGGEST_NGRAMS = (3, 4)
+# Scores held per matrix product: NAMASTE rows per block shrink as icd_cache grows
+SUGGEST_BLOCK_CELLS = int(os.getenv("SUGGEST_BLOCK_CELLS", str(1 << 22)))
+SUGGEST_REFIT_FRACTION = float(os.getenv("SUGGEST_REFIT_FRACTION", "0.1"))
+# Warn when the pure-Python product scores this many NAMASTE codes or more
+SUGGEST_FALLBACK_WARN = int(os.getenv("SUGGEST_FALLBACK_WARN", "1000"))
+
+
+def ngrams(text):
+    counts = {}
+    for word in normalize(text).split():
+        padded = f" {word} "
+        for n in SUGGEST_NGRAMS:
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                counts[gram] = counts.get(gram, 0) + 1
+    return counts
+
+
+class Vectorizer:
+    """TF-IDF over character n-grams, fitted on the ICD titles"""
+
+    def __init__(self, documents):
+        df = {}
+        for counts in documents:
+            for gram in counts:
+                df[gram] = df.get(gram, 0) + 1
+        n = len(documents)
+        self.vocab = {gram: i for i, gram in enumerate(df)}
+        self.idf = [math.log((1 + n) / (1 + df[gram])) + 1 for gram in df]
+
+    def transform(self, counts):
+        """Sparse vector as {column: weight}; n-grams unseen in ICD are dropped"""
+        vec = {}
+        for gram, tf in counts.items():
+            col = self.vocab.get(gram)
+            if col is not None:
+                vec[col] = (1 + math.log(tf)) * self.idf[col]
+        norm = math.sqrt(sum(w * w for w in vec.values()))
+        return {col: w / norm for col, w in vec.items()} if norm else {}
+
+
+def _csr(vectors, columns):
+    indptr, indices, data = [0], [], []
+    for vec in vectors:
+        indices.extend(vec)
+        data.extend(vec.values())
+        indptr.append(len(indices))
+    return sparse.csr_matrix((np.array(data, dtype=np.float32), indices, indptr),
+                             shape=(len(vectors), columns))
+
+
+def top_matches_scipy(queries, corpus, columns, k, min_score):
+    """[[(corpus index, score)]] per query via chunked sparse products"""
+    corpus_t = _csr(corpus, columns).T.tocsc()
+    chunk = max(1, SUGGEST_BLOCK_CELLS // max(1, len(corpus)))
+    results = []
+    for start in range(0, len(queries), chunk):
+        block = (_csr(queries[start:start + chunk], columns) @ corpus_t).toarray()
+        kk = min(k, block.shape[1])
+        if kk == 0:
+            results.extend([] for _ in range(block.shape[0]))
+            continue
+        top = np.argpartition(-block, kk - 1, axis=1)[:, :kk]
+        for row, cols in enumerate(top):
+            scores = block[row, cols]
+            order = np.argsort(-scores)
+            results.append([(int(cols[i]), float(scores[i])) for i in order if scores[i] >= min_score])
+    return results
+
+
+def top_matches_python(queries, corpus, columns, k, min_score):
+    """Same product as top_matches_scipy, accumulated over an inverted index"""
+    postings = {}
+    for doc, vec in enumerate(corpus):
+        for col, w in vec.items():
+            postings.setdefault(col, []).append((doc, w))
+    results = []
+    for vec in queries:
+        scores = {}
+        for col, w in vec.items():
+            for doc, dw in postings.get(col, ()):
+                scores[doc] = scores.get(doc, 0.0) + w * dw
+        best = sorted(scores.items(), key=lambda kv: -kv[1])[:k]
+        results.append([(doc, score) for doc, score in best if score >= min_score])
+    return results
+
+
+def top_matches(queries, corpus, columns, k=SUGGEST_TOP_K, min_score=SUGGEST_MIN_SCORE):
+    if sparse is not None:
+        return top_matches_scipy(queries, corpus, columns, k, min_score)
+    if len(queries) >= SUGGEST_FALLBACK_WARN:
+        print(f"WARNING: numpy/scipy are not installed; scoring {len(queries)} NAMASTE codes against "
+              f"{len(corpus)} ICD titles in pure Python, which is much slower. Install requirements.txt.")
+    return top_matches_python(queries, corpus, columns, k, min_score)
+
+
+def _fingerprint(display):
+    return hashlib.sha1((display or "").encode("utf-8")).hexdigest()
+
+
+def _icd_watermark(conn):
+    # INSERT OR REPLACE gives a changed entity a new rowid, so this moves on any change
+    count, max_rowid = conn.execute("SELECT COUNT(*), MAX(rowid) FROM icd_cache").fetchone()
+    return f"{count}:{max_rowid}"
+
+
+def _watermark_rowid(watermark):
+    """icd_cache rows above this rowid were written after the watermark"""
+    rowid = watermark.partition(":")[2]
+    return int(rowid) if rowid.isdigit() else 0
+
+
+def _confidence(score):
+    return max(1, min(99, round(score * 100)))
+
+
+def suggest_mappings(full=False):
+    """Recompute suggestions for changed NAMASTE codes (all of them if `full`
+    or icd_cache changed); returns a summary with the affected codes"""
+    start = time.perf_counter()
+    # one run at a time across worker processes
+    if not shared_state.acquire_lease("mapping_suggest", 3600):
+        return {"skipped": "another worker is computing suggestions", "codes": set()}
+    try:
+        return _suggest(full, start)
+    finally:
+        shared_state.release_lease("mapping_suggest")
+
+
+def _suggest(full, start):
+    with connection() as conn:
+        watermark = _icd_watermark(conn)
+        last = conn.execute("SELECT icd_watermark FROM mapping_suggest_runs ORDER BY id DESC LIMIT 1").fetchone()
+        refit = conn.execute(
+            "SELECT icd_watermark FROM mapping_suggest_runs WHERE full_run ORDER BY id DESC LIMIT 1").fetchone()
+        if not full and last is not None and refit is not None and last["icd_watermark"] != watermark:
+            newer = conn.execute("SELECT COUNT(*) FROM icd_cache WHERE rowid > ?",
+                                 (_watermark_rowid(refit["icd_watermark"]),)).fetchone()[0]
+            full = newer > SUGGEST_REFIT_FRACTION * int(watermark.partition(":")[0])
+        full = full or last is None or refit is None
+        icd_changed = not full and last["icd_watermark"] != watermark
+
+        namaste = {r["code"]: r["display"] for r in conn.execute("SELECT code, display FROM namaste")}
+        state = {r["namaste_code"]: r["fingerprint"] for r in conn.execute(
+            "SELECT namaste_code, fingerprint FROM mapping_suggest_state")}
+        removed = [code for code in state if code not in namaste]
+        changed = [code for code, display in namaste.items()
+                   if full or state.get(code) != _fingerprint(display)]
+        summary = {"full": full, "scored": len(changed), "merged": 0, "icdScored": 0, "removed": len(removed),
+                   "suggestions": 0, "backend": "scipy" if sparse is not None else "python",
+                   "codes": set(changed) | set(removed)}
+        if not changed and not removed and not icd_changed:
+            summary["elapsedMs"] = round((time.perf_counter() - start) * 1000, 1)
+            return summary
+
+        icd = conn.execute("SELECT rowid, code, display, module FROM icd_cache WHERE display != ''").fetchall()
+        curated = {}
+        for r in conn.execute("SELECT namaste_code, icd_code FROM concept_map WHERE mapping_type IS NOT 'suggested'"):
+            curated.setdefault(r["namaste_code"], set()).add(r["icd_code"])
+
+        added, stored = [], {}
+        if icd_changed:
+            since = _watermark_rowid(last["icd_watermark"])
+            added = [i for i, r in enumerate(icd) if r["rowid"] > since]
+            titles = {r["code"]: r["display"] for r in icd}
+            for r in conn.execute("""SELECT namaste_code, icd_code, icd_display, module, confidence
+                                     FROM concept_map WHERE mapping_type = 'suggested'"""):
+                stored.setdefault(r["namaste_code"], {})[r["icd_code"]] = r
+            # a suggestion whose ICD title went away leaves a gap only a full rescore can fill
+            lost = {code for code, rows in stored.items()
+                    if any(titles.get(icd_code) != r["icd_display"] for icd_code, r in rows.items())}
+            seen = set(changed)
+            changed += [code for code in namaste if code in lost and code not in seen]
+            summary["scored"] = len(changed)
+        rescored = set(changed)
+        merging = [code for code in namaste if code not in rescored] if added else []
+        summary["icdScored"] = len(added)
+
+        icd_counts = [ngrams(r["display"]) for r in icd]
+        vectorizer = Vectorizer(icd_counts)
+        columns = len(vectorizer.vocab)
+        vectors = {code: vectorizer.transform(ngrams(namaste[code])) for code in changed + merging}
+
+        rows = []
+        if changed and icd:
+            corpus = [vectorizer.transform(c) for c in icd_counts]
+            # ask for extra candidates so curated pairs can be skipped
+            matches = top_matches([vectors[code] for code in changed], corpus, columns, SUGGEST_TOP_K * 2)
+            for code, candidates in zip(changed, matches):
+                kept = [(i, s) for i, s in candidates if icd[i]["code"] not in curated.get(code, ())][:SUGGEST_TOP_K]
+                rows.extend((code, icd[i]["code"], icd[i]["display"], icd[i]["module"], _confidence(score),
+                             "suggested") for i, score in kept)
+
+        merged = []
+        if merging:
+            corpus = [vectorizer.transform(icd_counts[i]) for i in added]
+            matches = top_matches([vectors[code] for code in merging], corpus, columns, SUGGEST_TOP_K * 2)
+            for code, candidates in zip(merging, matches):
+                current = stored.get(code, {})
+                best = {icd_code: (r["confidence"], r["icd_display"], r["module"]) for icd_code, r in current.items()}
+                for i, score in candidates:
+                    if icd[added[i]]["code"] not in curated.get(code, ()):
+                        best[icd[added[i]]["code"]] = (_confidence(score), icd[added[i]]["display"],
+                                                       icd[added[i]]["module"])
+                top = sorted(best.items(), key=lambda kv: -kv[1][0])[:SUGGEST_TOP_K]
+                if {c: v[0] for c, v in top} != {c: r["confidence"] for c, r in current.items()}:
+                    merged.append(code)
+                    rows.extend((code, icd_code, display, module, confidence, "suggested")
+                                for icd_code, (confidence, display, module) in top)
+        summary["merged"] = len(merged)
+        summary["codes"] |= set(changed) | set(merged)
+
+        now = int(time.time())
+        codes = [(c,) for c in changed + merged + removed]
+        conn.executemany("DELETE FROM concept_map WHERE mapping_type = 'suggested' AND namaste_code = ?", codes)
+        conn.executemany(
+            """INSERT INTO concept_map(namaste_code, icd_code, icd_display, module, confidence, mapping_type)
+               VALUES (?, ?, ?, ?, ?, ?)""", rows)
+        conn.executemany("DELETE FROM mapping_suggest_state WHERE namaste_code = ?", [(c,) for c in removed])
+        conn.executemany("INSERT OR REPLACE INTO mapping_suggest_state(namaste_code, fingerprint, computed_at) VALUES (?,?,?)",
+                         [(code, _fingerprint(namaste[code]), now) for code in changed])
+        summary["suggestions"] = len(rows)
+        if codes:
+            summary["generation"] = shared_state.bump_generation(conn, "concept_map")
+        summary["elapsedMs"] = round((time.perf_counter() - start) * 1000, 1)
+        conn.execute(
+            """INSERT INTO mapping_suggest_runs(icd_watermark, codes, suggestions, backend, elapsed_ms, ran_at, full_run)
+               VALUES (?,?,?,?,?,?,?)""",
+            (watermark, len(changed) + len(merged), len(rows), summary["backend"], summary["elapsedMs"], now, full),
+        )
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--full", action="store_true", help="rescore every NAMASTE code")
+    args = parser.parse_args()
+
+    init_db()
+    result = suggest_mappings(args.full)
+    result.pop("codes")
+    print(result)
@@ -0,0 +1,85 @@
+# backend/pagination.py
+import base64
+import json
+
+from db import connection, run_db
+
+
+def encode_cursor(values):
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    # only scalars can be bound as parameters
+    if not isinstance(values, list) or not all(v is None or isinstance(v, (str, int, float)) for v in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+class KeysetQuery:
+    """Cursor (keyset) pagination over a SELECT.
+
+    `keys` are SQL expressions forming a unique sort order; each page
+    continues strictly after the last row of the previous one with a
+    row-value comparison, so page N costs the same as page 1 and can use an
+    index on the keys. An optional `where` filter (with `?` placeholders
+    bound from the `params` passed to sql()/page()) narrows the rows, e.g. to
+    one patient.
+    """
+
+    def __init__(self, columns, source, keys, descending=False, where=None):
+        self.columns = columns
+        self.source = source
+        self.keys = keys
+        self.descending = descending
+        self.where = where
+
+    def sql(self, cursor=None, params=()):
+        """SQL and params for the rows after `cursor`; append LIMIT yourself"""
+        key_cols = ", ".join(f"{k} AS _k{i}" for i, k in enumerate(self.keys))
+        sql = f"SELECT {self.columns}, {key_cols} FROM {self.source}"
+        conditions = [self.where] if self.where else []
+        params = list(params)
+        if cursor:
+            after = decode_cursor(cursor)
+            if len(after) != len(self.keys):
+                raise ValueError("Invalid cursor")
+            marks = ", ".join("?" * len(self.keys))
+            conditions.append(f"({', '.join(self.keys)}) {'<' if self.descending else '>'} ({marks})")
+            params.extend(after)
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        direction = " DESC" if self.descending else ""
+        sql += " ORDER BY " + ", ".join(k + direction for k in self.keys)
+        return sql, params
+
+    def page(self, cursor=None, limit=500, params=()):
+        """(rows as dicts, next cursor or None) for one page"""
+        sql, params = self.sql(cursor, params)
+        with connection() as conn:
+            rows = conn.execute(sql + " LIMIT ?", params + [limit + 1]).fetchall()
+
+        more = len(rows) > limit
+        rows = rows[:limit]
+        items = []
+        for row in rows:
+            item = dict(row)
+            for i in range(len(self.keys)):
+                del item[f"_k{i}"]
+            items.append(item)
+        next_cursor = encode_cursor([rows[-1][f"_k{i}"] for i in range(len(self.keys))]) if more else None
+        return items, next_cursor
+
+
+async def stream_ndjson(query, cursor=None, page_size=1000):
+    """Yield every row after `cursor` as NDJSON, one page in memory at a time"""
+    while True:
+        items, cursor = await run_db(query.page, cursor, page_size)
+        if items:
+            yield "".join(json.dumps(item, ensure_ascii=False) + "\n" for item in items)
+        if cursor is None:
+            return
@@ -0,0 +1,104 @@
+# backend/problems.py
+import json
+import time
+
+from analytics import record_problems
+from db import connection
+
+NAMASTE_SYSTEM = "urn:namaste"
+ICD11_SYSTEM = "http://who.int/icd11"
+
+
+def fhir_condition(patient_id, namaste_code, namaste_display, icd_codes, icd_displays):
+    """FHIR-like Condition dual-coded with NAMASTE and ICD-11"""
+    return {
+        "resourceType": "Condition",
+        "code": {
+            "coding": [
+                {
+                    "system": NAMASTE_SYSTEM,
+                    "code": namaste_code,
+                    "display": namaste_display
+                }
+            ] + [
+                {
+                    "system": ICD11_SYSTEM,
+                    "code": icd_code,
+                    "display": icd_displays.get(icd_code, icd_code)
+                }
+                for icd_code in icd_codes
+            ]
+        },
+        "subject": {"reference": f"Patient/{patient_id}"}
+    }
+
+
+def lookup_displays(conn, table, codes):
+    """code -> display for `codes`, in one set-based query"""
+    if not codes:
+        return {}
+    rows = conn.execute(
+        f"SELECT code, display FROM {table} WHERE code IN (SELECT value FROM json_each(?))",
+        (json.dumps(list(codes)),),
+    )
+    return {r["code"]: r["display"] for r in rows}
+
+
+def icd_displays(conn, codes):
+    """code -> display for ICD codes from icd_cache, falling back to the
+    display concept_map carries for codes icd_cache has not fetched yet"""
+    displays = lookup_displays(conn, "icd_cache", codes)
+    missing = set(codes) - displays.keys()
+    if missing:
+        rows = conn.execute(
+            """SELECT icd_code, icd_display FROM concept_map
+               WHERE icd_code IN (SELECT value FROM json_each(?)) AND icd_display IS NOT NULL""",
+            (json.dumps(list(missing)),),
+        )
+        for r in rows:
+            displays.setdefault(r["icd_code"], r["icd_display"])
+    return displays
+
+
+def save_problems(problems, conn=None):
+    """Validate and insert (patient_id, namaste_code, icd_codes) problems.
+
+    NAMASTE codes are checked with one query, all rows are inserted with one
+    executemany in a single transaction, and ICD displays are resolved with
+    one lookup. The analytics rollups are updated in the same transaction.
+    Returns (conditions, rejected): a FHIR Condition per accepted
+    problem, and the indexes of problems whose NAMASTE code is unknown.
+    """
+    if conn is None:
+        with connection() as conn:
+            return save_problems(problems, conn)
+
+    namaste = lookup_displays(conn, "namaste", {p[1] for p in problems})
+    accepted, rejected = [], []
+    for i, problem in enumerate(problems):
+        (accepted if problem[1] in namaste else rejected).append(i)
+
+    now = int(time.time())
+    # the write lock first: record_problems reads which problems were saved
+    # this second, and a concurrent save must not read the same answer
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE")
+    # before the INSERT: the rollups tell new problems from rows joining one saved this second
+    record_problems(conn, [problems[i] for i in accepted], now)
+    conn.executemany(
+        """INSERT INTO problems (patient_id, namaste_code, icd_code, created_at)
+           VALUES (?, ?, ?, ?)""",
+        [
+            (patient_id, namaste_code, icd_code, now)
+            for patient_id, namaste_code, icd_codes in (problems[i] for i in accepted)
+            for icd_code in icd_codes
+        ],
+    )
+    conn.commit()
+
+    icd = icd_displays(conn, {c for i in accepted for c in problems[i][2]})
+    conditions = [
+        fhir_condition(patient_id, namaste_code, namaste[namaste_code], icd_codes, icd)
+        for patient_id, namaste_code, icd_codes in (problems[i] for i in accepted)
+    ]
+    return conditions, rejected
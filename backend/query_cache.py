@@ -0,0 +1,200 @@
+# backend/query_cache.py
+import asyncio
+import json
+import os
+import time
+from collections import OrderedDict
+
+import shared_state
+from db import connection, run_db
+from telemetry import mark_cache
+
+ICD_QUERY_CACHE_SIZE = int(os.getenv("ICD_QUERY_CACHE_SIZE", "2000"))
+ICD_QUERY_CACHE_TTL = float(os.getenv("ICD_QUERY_CACHE_TTL", "3600"))
+# How long past the TTL a stale entry may still be served while it refreshes
+ICD_QUERY_CACHE_STALE = float(os.getenv("ICD_QUERY_CACHE_STALE", "86400"))
+ICD_QUERY_CACHE_PERSIST = os.getenv("ICD_QUERY_CACHE_PERSIST", "1") == "1"
+# How long a worker may hold the lease on refreshing one entry, and how long
+# the others wait for its result before giving up on it
+ICD_QUERY_LEASE_TTL = float(os.getenv("ICD_QUERY_LEASE_TTL", "30"))
+ICD_QUERY_LEASE_WAIT = float(os.getenv("ICD_QUERY_LEASE_WAIT", "5"))
+LEASE_PREFIX = "query:"
+
+
+def query_key(query, limit, language):
+    """Cache key: case- and whitespace-insensitive query plus its options"""
+    return f"{language}|{limit}|{' '.join(query.lower().split())}"
+
+
+def _load_row(key):
+    with connection() as conn:
+        row = conn.execute("SELECT results_json, stored_at FROM icd_query_cache WHERE cache_key = ?",
+                           (key,)).fetchone()
+    return (json.loads(row["results_json"]), row["stored_at"]) if row else None
+
+
+def _store_row(key, value, stored_at):
+    with connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO icd_query_cache(cache_key, results_json, stored_at) VALUES (?,?,?)",
+                     (key, json.dumps(value), stored_at))
+
+
+def _rows_for_keys(keys, cutoff):
+    with connection() as conn:
+        rows = conn.execute("""SELECT cache_key, results_json, stored_at FROM icd_query_cache
+                               WHERE cache_key IN (SELECT value FROM json_each(?)) AND stored_at >= ?""",
+                            (json.dumps(keys), cutoff)).fetchall()
+    return {r["cache_key"]: (json.loads(r["results_json"]), r["stored_at"]) for r in rows}
+
+
+def _purge_rows(cutoff):
+    with connection() as conn:
+        return conn.execute("DELETE FROM icd_query_cache WHERE stored_at < ?", (cutoff,)).rowcount
+
+
+class QueryCache:
+    """LRU + TTL cache of query -> results with stale-while-revalidate.
+
+    Fresh entries are returned directly. Entries past the TTL but inside the
+    stale window are returned immediately while one background task refreshes
+    them. Entries are optionally written through to the icd_query_cache table
+    so popular searches survive restarts. Empty results are not cached, so a
+    failed or empty upstream lookup is retried next time.
+
+    With persistence, one worker at a time refreshes an entry: it holds a
+    lease while fetching, and the others poll icd_query_cache for the row it
+    writes instead of fetching too.
+    """
+
+    def __init__(self, maxsize=ICD_QUERY_CACHE_SIZE, ttl=ICD_QUERY_CACHE_TTL,
+                 stale=ICD_QUERY_CACHE_STALE, persist=ICD_QUERY_CACHE_PERSIST):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.stale = stale
+        self.persist = persist
+        self._entries = OrderedDict()  # key -> (value, stored_at)
+        self._refreshing = {}          # key -> task
+        self.hits = self.stale_hits = self.misses = 0
+        self.evictions = self.refreshes = self.refresh_errors = self.shared_refreshes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _put(self, key, value, stored_at):
+        self._entries[key] = (value, stored_at)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def _lookup(self, key):
+        entry = self._entries.get(key)
+        if entry is None and self.persist:
+            entry = await run_db(_load_row, key)
+            if entry is not None:
+                self._put(key, *entry)
+        if entry is not None:
+            self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key, value):
+        if not value:
+            return
+        stored_at = int(time.time())
+        self._put(key, value, stored_at)
+        if self.persist:
+            await run_db(_store_row, key, value, stored_at)
+
+    async def _wait_for_refresh(self, key, stored_at):
+        """Poll for the row another worker's refresh writes; True once it is loaded"""
+        deadline = time.monotonic() + ICD_QUERY_LEASE_WAIT
+        while time.monotonic() < deadline:
+            await asyncio.sleep(min(0.2, ICD_QUERY_LEASE_WAIT))
+            entry = await run_db(_load_row, key)
+            if entry is not None and entry[1] > stored_at:
+                self._put(key, *entry)
+                self.shared_refreshes += 1
+                return True
+        return False
+
+    async def _refresh(self, key, stored_at, fetch):
+        lease = f"{LEASE_PREFIX}{key}"
+        leased = False
+        try:
+            # with several workers, one of them refreshes a shared entry
+            if self.persist:
+                leased = await run_db(shared_state.acquire_lease, lease, ICD_QUERY_LEASE_TTL)
+                if not leased:
+                    await self._wait_for_refresh(key, stored_at)
+                    return
+            await self.set(key, await fetch())
+            self.refreshes += 1
+        except Exception as e:
+            self.refresh_errors += 1
+            print("Query cache refresh failed:", e)
+        finally:
+            if leased:
+                await run_db(shared_state.release_lease, lease)
+            self._refreshing.pop(key, None)
+
+    async def get_or_fetch(self, key, fetch):
+        """Return cached results for `key`, calling `await fetch()` on a miss"""
+        entry = await self._lookup(key)
+        if entry is not None:
+            value, stored_at = entry
+            age = time.time() - stored_at
+            if age < self.ttl:
+                self.hits += 1
+                mark_cache("hit")
+                return value
+            if age < self.ttl + self.stale:
+                self.stale_hits += 1
+                mark_cache("stale")
+                if key not in self._refreshing:
+                    self._refreshing[key] = asyncio.create_task(self._refresh(key, stored_at, fetch))
+                return value
+
+        self.misses += 1
+        mark_cache("miss")
+        value = await fetch()
+        await self.set(key, value)
+        return value
+
+    async def preload(self, keys):
+        """Load the persisted entries for `keys` (most wanted first) still
+        inside the stale window into memory; returns how many"""
+        if not self.persist:
+            return 0
+        keys = list(keys)[:self.maxsize]
+        rows = await run_db(_rows_for_keys, keys, int(time.time() - self.ttl - self.stale))
+        # the most wanted go in last, so they are the last the LRU evicts
+        for key in reversed(keys):
+            if key in rows:
+                self._put(key, *rows[key])
+        return len(rows)
+
+    async def purge_expired(self):
+        """Drop persisted entries that are past their stale window, and
+        refresh leases left behind by workers that died holding them"""
+        if not self.persist:
+            return 0
+        await run_db(shared_state.purge_leases, LEASE_PREFIX)
+        return await run_db(_purge_rows, int(time.time() - self.ttl - self.stale))
+
+    def stats(self):
+        lookups = self.hits + self.stale_hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "staleHits": self.stale_hits,
+            "misses": self.misses,
+            "hitRatio": round((self.hits + self.stale_hits) / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "refreshes": self.refreshes,
+            "refreshErrors": self.refresh_errors,
+            "sharedRefreshes": self.shared_refreshes,
+        }
+
+
+icd_query_cache = QueryCache()
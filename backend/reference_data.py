@@ -0,0 +1,291 @@
+# backend/reference_data.py
+"""Load NAMASTE codes and concept mappings from versioned source files.
+
+Sources live in REFERENCE_DATA_DIR as namaste.{json,csv} (FHIR CodeSystem or
+code,display,category CSV) and concept_map.{json,csv} (FHIR ConceptMap or
+namaste_code,icd_code,icd_display,module,confidence,mapping_type CSV).
+
+Each source's SHA-256 is recorded in reference_data_version. When every
+checksum matches, loading is a single SELECT. Otherwise the files are diffed
+row by row against the tables and only inserts, updates and deletes are
+written, all in one transaction, so readers never see an empty table.
+A malformed row raises ValueError naming the file and row; nothing from
+that load is written.
+
+    python reference_data.py [--force]
+"""
+import argparse
+import csv
+import hashlib
+import io
+import json
+import os
+import time
+from pathlib import Path
+
+import shared_state
+from analytics import rebuild_category_rollup
+from db import connection, init_db
+
+REFERENCE_DATA_DIR = Path(os.getenv("REFERENCE_DATA_DIR", Path(__file__).parent / "data"))
+
+# FHIR ConceptMap equivalence -> confidence when no confidence extension is given
+EQUIVALENCE_CONFIDENCE = {
+    "equal": 100, "equivalent": 95, "wider": 80, "narrower": 80, "subsumes": 80,
+    "specializes": 80, "relatedto": 70, "inexact": 70,
+}
+
+
+def find_source(name, directory=None):
+    """Path of `name`.json or `name`.csv in the data directory, or None"""
+    directory = Path(directory or REFERENCE_DATA_DIR)
+    for suffix in (".json", ".csv"):
+        path = directory / f"{name}{suffix}"
+        if path.exists():
+            return path
+    return None
+
+
+def _csv_rows(path, data, required):
+    """(line number, row with stripped values) for each CSV row; ValueError
+    if the header lacks a `required` column"""
+    reader = csv.DictReader(io.StringIO(data.decode("utf-8-sig")))
+    missing = [c for c in required if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"{path.name}: missing column(s) {', '.join(missing)}")
+    for r in reader:
+        # short rows leave None values; extra cells land under the None key
+        yield reader.line_num, {k: (v or "").strip() for k, v in r.items() if k is not None}
+
+
+def _confidence(value, where):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{where}: confidence must be an integer, got {value!r}") from None
+
+
+def _extension(element, suffix):
+    for ext in element.get("extension") or []:
+        if (ext.get("url") or "").endswith(suffix):
+            for key, value in ext.items():
+                if key.startswith("value"):
+                    return value
+    return None
+
+
+def namaste_rows(path, data):
+    """{code: (display, category)} and the source version"""
+    if path.suffix == ".csv":
+        rows = {r["code"]: (r["display"], r.get("category", ""))
+                for _, r in _csv_rows(path, data, ("code", "display")) if r["code"]}
+        return rows, None
+
+    resource = json.loads(data)
+    if resource.get("resourceType") != "CodeSystem":
+        raise ValueError(f"{path.name}: expected a CodeSystem")
+    rows = {}
+
+    def walk(concepts, parent_display):
+        for concept in concepts or []:
+            category = parent_display or ""
+            for prop in concept.get("property") or []:
+                if prop.get("code") == "category":
+                    category = prop.get("valueString") or prop.get("valueCode") or category
+            if not isinstance(concept.get("code"), str) or not concept["code"]:
+                raise ValueError(f"{path.name}: concept {concept.get('display')!r} has no code")
+            rows[concept["code"]] = (concept.get("display") or "", category)
+            # nested concepts inherit their parent's display as the category
+            walk(concept.get("concept"), concept.get("display"))
+
+    walk(resource.get("concept"), None)
+    return rows, resource.get("version")
+
+
+def _module(code, target_system):
+    return "TM2" if code.startswith("TM2") or "tm2" in (target_system or "").lower() else "Biomedical"
+
+
+def concept_map_rows(path, data):
+    """{(namaste_code, icd_code): (icd_display, module, confidence, mapping_type)} and the source version"""
+    if path.suffix == ".csv":
+        rows = {}
+        required = ("namaste_code", "icd_code", "icd_display", "module", "confidence")
+        for line, r in _csv_rows(path, data, required):
+            where = f"{path.name} line {line}"
+            if not r["namaste_code"] or not r["icd_code"]:
+                raise ValueError(f"{where}: namaste_code and icd_code are required")
+            rows[(r["namaste_code"], r["icd_code"])] = (
+                r["icd_display"], r["module"], _confidence(r["confidence"], where),
+                r.get("mapping_type") or "automatic",
+            )
+        return rows, None
+
+    resource = json.loads(data)
+    if resource.get("resourceType") != "ConceptMap":
+        raise ValueError(f"{path.name}: expected a ConceptMap")
+    rows = {}
+    for g, group in enumerate(resource.get("group") or []):
+        for e, element in enumerate(group.get("element") or []):
+            where = f"{path.name} group {g} element {e}"
+            if not isinstance(element.get("code"), str) or not element["code"]:
+                raise ValueError(f"{where}: element has no code")
+            for target in element.get("target") or []:
+                if not target.get("code") or target.get("equivalence") in ("unmatched", "disjoint"):
+                    continue
+                confidence = _extension(target, "confidence")
+                if confidence is None:
+                    confidence = EQUIVALENCE_CONFIDENCE.get(target.get("equivalence") or target.get("relationship"), 70)
+                rows[(element["code"], target["code"])] = (
+                    target.get("display") or "", _module(target["code"], group.get("target")),
+                    _confidence(confidence, where), _extension(target, "mapping-type") or "automatic",
+                )
+    return rows, resource.get("version")
+
+
+def _diff(current, incoming):
+    """(inserted, updated, deleted) keys between two {key: values} dicts"""
+    inserted = [k for k in incoming if k not in current]
+    updated = [k for k, v in incoming.items() if k in current and current[k] != v]
+    deleted = [k for k in current if k not in incoming]
+    return inserted, updated, deleted
+
+
+def _apply_namaste(conn, rows):
+    current = {r[0]: (r[1], r[2] or "") for r in conn.execute("SELECT code, display, category FROM namaste")}
+    inserted, updated, deleted = _diff(current, rows)
+    conn.executemany("INSERT OR REPLACE INTO namaste(code, display, category) VALUES (?, ?, ?)",
+                     [(code, *rows[code]) for code in inserted + updated])
+    conn.executemany("DELETE FROM namaste WHERE code = ?", [(code,) for code in deleted])
+    return {"inserted": len(inserted), "updated": len(updated), "deleted": len(deleted)}, \
+        set(inserted + updated + deleted)
+
+
+def _apply_concept_map(conn, rows):
+    current, ids, duplicates = {}, {}, []
+    # engine-generated suggestions (mapping_suggest.py) are not part of the source
+    for r in conn.execute("""SELECT id, namaste_code, icd_code, icd_display, module, confidence, mapping_type
+                             FROM concept_map WHERE mapping_type IS NOT 'suggested' ORDER BY id"""):
+        key = (r["namaste_code"], r["icd_code"])
+        if key in ids:
+            duplicates.append((r["id"],))
+            continue
+        ids[key] = r["id"]
+        current[key] = (r["icd_display"], r["module"], r["confidence"], r["mapping_type"])
+
+    inserted, updated, deleted = _diff(current, rows)
+    # a curated mapping replaces any suggestion for the same pair
+    conn.executemany("DELETE FROM concept_map WHERE mapping_type = 'suggested' AND namaste_code = ? AND icd_code = ?",
+                     inserted)
+    conn.executemany(
+        """INSERT INTO concept_map(namaste_code, icd_code, icd_display, module, confidence, mapping_type)
+           VALUES (?, ?, ?, ?, ?, ?)""",
+        [(*key, *rows[key]) for key in inserted],
+    )
+    conn.executemany(
+        "UPDATE concept_map SET icd_display = ?, module = ?, confidence = ?, mapping_type = ? WHERE id = ?",
+        [(*rows[key], ids[key]) for key in updated],
+    )
+    conn.executemany("DELETE FROM concept_map WHERE id = ?", [(ids[key],) for key in deleted] + duplicates)
+    return {"inserted": len(inserted), "updated": len(updated), "deleted": len(deleted) + len(duplicates)}, \
+        {key[0] for key in inserted + updated + deleted}
+
+
+SOURCES = (
+    ("namaste", namaste_rows, _apply_namaste),
+    ("concept_map", concept_map_rows, _apply_concept_map),
+)
+
+
+def load_reference_data(directory=None, force=False):
+    """Bring namaste/concept_map in line with the source files.
+
+    Returns {"changed": bool, "sources": {...}, "namasteCodes": set,
+    "mappedCodes": set, "generations": {name: int}}; the code sets name what
+    callers must refresh in the in-memory search index and concept map
+    cache, and "generations" holds the bumped shared generations ("namaste"
+    for the search index, "concept_map" for the concept map cache, which
+    also tracks which NAMASTE codes exist) other workers sync on.
+    """
+    result = {"changed": False, "sources": {}, "namasteCodes": set(), "mappedCodes": set(), "generations": {}}
+    files = {}
+    for name, _, _ in SOURCES:
+        path = find_source(name, directory)
+        if path is not None:
+            data = path.read_bytes()
+            files[name] = (path, data, hashlib.sha256(data).hexdigest())
+    if not files:
+        print(f"No reference data found in {directory or REFERENCE_DATA_DIR}")
+        return result
+
+    with connection() as conn:
+        loaded = {r["source"]: r["checksum"] for r in conn.execute(
+            "SELECT source, checksum FROM reference_data_version")}
+        if not force and all(loaded.get(name) == checksum for name, (_, _, checksum) in files.items()):
+            return result
+        # take the write lock and re-read: another worker may have just loaded these files
+        conn.execute("BEGIN IMMEDIATE")
+        loaded = {r["source"]: r["checksum"] for r in conn.execute(
+            "SELECT source, checksum FROM reference_data_version")}
+
+        now = int(time.time())
+        for name, parse, apply in SOURCES:
+            if name not in files:
+                continue
+            path, data, checksum = files[name]
+            if not force and loaded.get(name) == checksum:
+                continue
+            rows, version = parse(path, data)
+            counts, codes = apply(conn, rows)
+            conn.execute(
+                """INSERT OR REPLACE INTO reference_data_version(source, version, checksum, rows, loaded_at)
+                   VALUES (?, ?, ?, ?, ?)""",
+                (name, version or checksum[:12], checksum, len(rows), now),
+            )
+            result["sources"][name] = dict(counts, file=path.name, version=version or checksum[:12])
+            result["namasteCodes" if name == "namaste" else "mappedCodes"] |= codes
+        changed = {name for name, c in result["sources"].items()
+                   if any(c[k] for k in ("inserted", "updated", "deleted"))}
+        result["changed"] = bool(changed)
+        if result["changed"]:
+            if "namaste" in changed:
+                result["generations"]["namaste"] = shared_state.bump_generation(conn, "namaste")
+                rebuild_category_rollup(conn)  # categories of past problems follow the new data
+            # the concept map cache also tracks which NAMASTE codes exist
+            result["generations"]["concept_map"] = shared_state.bump_generation(conn, "concept_map")
+            conn.execute("ANALYZE namaste")
+            conn.execute("ANALYZE concept_map")
+    return result
+
+
+def refresh_caches(result):
+    """Apply a load_reference_data() result to the in-memory index and cache"""
+    from concept_map_cache import concept_map_cache
+    from search_index import namaste_index
+
+    codes = result["namasteCodes"]
+    if codes:
+        with connection() as conn:
+            rows = conn.execute(
+                "SELECT code, display, category FROM namaste WHERE code IN (SELECT value FROM json_each(?))",
+                (json.dumps(list(codes)),),
+            ).fetchall()
+        present = {r["code"] for r in rows}
+        for code in codes - present:
+            namaste_index.remove(code)
+        namaste_index.add_many((r["code"], r["display"], r["category"]) for r in rows)
+    concept_map_cache.refresh(codes | result["mappedCodes"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dir", help=f"source directory (default {REFERENCE_DATA_DIR})")
+    parser.add_argument("--force", action="store_true", help="re-diff even if checksums are unchanged")
+    args = parser.parse_args()
+
+    init_db()
+    start = time.perf_counter()
+    result = load_reference_data(args.dir, args.force)
+    for name, counts in result["sources"].items():
+        print(f"{name}: {counts}")
+    print(f"Reference data {'updated' if result['changed'] else 'unchanged'} in {time.perf_counter() - start:.3f}s")
@@ -0,0 +1,88 @@
+# backend/responses.py
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from fastapi.responses import JSONResponse, Response
+
+from concept_map_cache import etag
+
+try:
+    import orjson
+except ImportError:  # optional; the stdlib encoder is the fallback
+    orjson = None
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "4096"))
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes, via orjson when it is installed"""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """JSONResponse rendered with orjson (stdlib json without it)"""
+
+    def render(self, content):
+        return dumps(content)
+
+
+def _etag_matches(if_none_match, tag):
+    if not if_none_match:
+        return False
+    candidates = [t.strip() for t in if_none_match.split(",")]
+    # weak comparison, as RFC 9110 requires for If-None-Match
+    return "*" in candidates or tag in (c[2:] if c.startswith("W/") else c for c in candidates)
+
+
+def etag_response(request, body, tag, media_type="application/json"):
+    """`body` with its ETag, or an empty 304 if the client already has it"""
+    headers = {"ETag": tag, "Cache-Control": "no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), tag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+class ResponseCache:
+    """LRU of rendered response bytes and their ETags, keyed by request.
+
+    Each entry remembers the data version it was built from; a lookup with
+    a newer version misses, so entries never outlive a data reload.
+    """
+
+    def __init__(self, maxsize=RESPONSE_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (version, etag, body)
+        self.hits = self.misses = 0
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+
+    def put(self, key, version, value):
+        """Render `value`, store it, and return (etag, body)"""
+        body = dumps(value)
+        tag = etag(body)
+        if self.maxsize:
+            with self._lock:
+                self._entries[key] = (version, tag, body)
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return tag, body
+
+    def stats(self):
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+response_cache = ResponseCache()
@@ -0,0 +1,114 @@
+# backend/search_hits.py
+"""How often each ICD and NAMASTE search is asked, for the warm-up.
+
+Searches are counted in memory and added to search_hits every
+SEARCH_HITS_FLUSH_SECONDS (sooner past SEARCH_HITS_MAX_PENDING distinct
+searches) and once more on shutdown. Stored counts are halved once per
+interval across all workers, so the ranking follows recent use and
+survives restarts; warmup.py replays the most asked searches of each kind.
+"""
+import asyncio
+import json
+import os
+import time
+from collections import Counter
+
+from db import connection, run_db
+
+SEARCH_HITS_FLUSH_SECONDS = float(os.getenv("SEARCH_HITS_FLUSH_SECONDS", "300"))
+SEARCH_HITS_MAX_PENDING = 5000
+SEARCH_HIT_DECAY = 0.5
+
+
+def _store_search_hits(hits, decay):
+    now = time.time()
+    with connection() as conn:
+        conn.execute("BEGIN IMMEDIATE")
+        # halve once per interval, however many workers flush in it
+        row = conn.execute("SELECT value FROM shared_state WHERE key = 'search_hits_decayed_at'").fetchone()
+        if row is None or now - json.loads(row["value"]) >= SEARCH_HITS_FLUSH_SECONDS:
+            conn.execute("UPDATE search_hits SET hits = hits * ?", (decay,))
+            conn.execute("DELETE FROM search_hits WHERE hits < 0.01")
+            conn.execute("INSERT OR REPLACE INTO shared_state(key, value) VALUES ('search_hits_decayed_at', ?)",
+                         (json.dumps(now),))
+        conn.executemany(
+            """INSERT INTO search_hits(kind, search_key, hits, last_hit) VALUES (?, ?, ?, ?)
+               ON CONFLICT(kind, search_key) DO UPDATE
+               SET hits = hits + excluded.hits, last_hit = excluded.last_hit""",
+            [(kind, key, n, int(now)) for (kind, key), n in hits.items()],
+        )
+
+
+def top_searches(kind, limit):
+    """The `limit` most asked search keys of `kind`, most asked first"""
+    with connection() as conn:
+        rows = conn.execute("SELECT search_key FROM search_hits WHERE kind = ? ORDER BY hits DESC LIMIT ?",
+                            (kind, limit))
+        return [r["search_key"] for r in rows]
+
+
+def namaste_search_key(q, mode):
+    return json.dumps([mode, q])
+
+
+def parse_namaste_search_key(key):
+    """(q, mode) of a namaste_search_key"""
+    mode, q = json.loads(key)
+    return q, mode
+
+
+class SearchHits:
+    """Write-behind counter of searches by (kind, key)"""
+
+    def __init__(self, interval=SEARCH_HITS_FLUSH_SECONDS, max_pending=SEARCH_HITS_MAX_PENDING):
+        self.interval = interval
+        self.max_pending = max_pending
+        self._pending = Counter()
+        self._wake = None
+        self._task = None
+
+    def record(self, kind, key):
+        self._pending[(kind, key)] += 1
+        if len(self._pending) >= self.max_pending and self._wake is not None:
+            self._wake.set()
+
+    async def flush(self):
+        if not self._pending:
+            return 0
+        hits, self._pending = self._pending, Counter()
+        try:
+            await run_db(_store_search_hits, hits, SEARCH_HIT_DECAY)
+        except Exception:
+            self._pending.update(hits)
+            raise
+        return len(hits)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Search hit flush failed:", e)
+
+    def start(self):
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+
+search_hits = SearchHits()
@@ -0,0 +1,424 @@
+# backend/search_index.py
+import bisect
+import heapq
+import re
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+_ASPIRATE = re.compile(r"([kgcjtdpbs])h")
+_REPEAT = re.compile(r"(.)\1+")
+
+# Fuzzy matching: tokens shorter than this must match their phonetic key exactly
+FUZZY_MIN_LENGTH = 4
+# Keys this long or longer tolerate two edits, shorter ones one
+FUZZY_LONG_KEY = 8
+
+
+def normalize(text):
+    """Lowercase, drop diacritics (ā -> a, ṣ -> s) and collapse punctuation
+    so 'NAM-001' and 'nam 001' match."""
+    text = unicodedata.normalize("NFKD", (text or "").lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def phonetic(token):
+    """Fold common transliteration variants of a normalized Sanskrit token.
+
+    Aspirates lose their h (dh -> d, sh -> s, kh -> k), long vowels fold
+    (ee -> i, oo -> u), doubled letters collapse (aa -> a), w -> v, x -> ks,
+    and a final inherent 'a' is dropped, so Madhumeha/Madumeh and
+    Pratishyaya/Pratisyaya share a key.
+    """
+    key = token.replace("w", "v").replace("x", "ks").replace("q", "k").replace("ee", "i").replace("oo", "u")
+    key = _REPEAT.sub(r"\1", _ASPIRATE.sub(r"\1", key))
+    if len(key) > 3 and key.endswith("a"):
+        key = key[:-1]
+    return key
+
+
+def deletes(key):
+    """`key` with each single character removed (the symmetric-delete neighbourhood)"""
+    return {key[:i] + key[i + 1:] for i in range(len(key))}
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or limit + 1 once it exceeds `limit`"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2, prev = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def max_edits(key):
+    return 2 if len(key) >= FUZZY_LONG_KEY else 1
+
+
+class SortedKeys:
+    """A sorted list of unique keys. Between start_bulk() and end_bulk(),
+    added keys are collected and sorted in once instead of one insort each."""
+
+    def __init__(self):
+        self.keys = []
+        self._pending = None
+
+    def add(self, key):
+        if self._pending is not None:
+            self._pending.add(key)
+        else:
+            bisect.insort(self.keys, key)
+
+    def discard(self, key):
+        if self._pending is not None and key in self._pending:
+            self._pending.discard(key)
+            return
+        i = bisect.bisect_left(self.keys, key)
+        if i < len(self.keys) and self.keys[i] == key:
+            del self.keys[i]
+
+    def start_bulk(self):
+        self._pending = set()
+
+    def end_bulk(self):
+        pending, self._pending = self._pending, None
+        if pending:
+            self.keys.extend(pending)
+            self.keys.sort()  # two sorted runs: a linear merge
+
+
+class NamasteIndex:
+    """In-memory trigram + token-prefix index over NAMASTE codes.
+
+    Substring terms (3+ chars) are answered by intersecting trigram postings,
+    short terms by a prefix range over the sorted token vocabulary. Multi-word
+    queries require every term to match (AND). Rows are added and removed
+    incrementally, so the index never has to be rebuilt per request.
+
+    Codes and displays are also kept sorted, so code and display prefix
+    matches, the best ranked ones, are read off in order and search() stops
+    as soon as it has `limit` of them.
+
+    search_fuzzy() tolerates transliteration variants and typos: every token
+    is reduced to a phonetic() key, and each key is stored under its
+    single-character deletes (symmetric delete). A query key then only has
+    to look up its own deletes to find candidate keys, whose edit distance
+    is checked directly. Lookup cost depends on the query length, not on
+    the vocabulary size.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._docs = {}        # doc id -> (code, display, category, norm_code, norm_display, text)
+        self._ids = {}         # code -> doc id
+        self._grams = {}       # trigram -> set(doc id)
+        self._postings = {}    # token -> set(doc id)
+        self._vocab = SortedKeys()     # tokens, for prefix ranges
+        self._codes = SortedKeys()     # (norm_code, doc id)
+        self._displays = SortedKeys()  # (norm_display, norm_code, doc id)
+        self._keys = {}        # phonetic key -> set(token)
+        self._deletes = {}     # key with one char deleted -> set(phonetic key)
+        self._next_id = 0
+        self.version = 0       # bumped after every change; keys response caches
+
+    def __len__(self):
+        return len(self._docs)
+
+    # ------------------- Maintenance -------------------
+    def build(self, rows):
+        """Replace the whole index with `rows` of (code, display, category).
+
+        The new index is built aside and swapped in under the lock, so
+        searches keep being answered from the old one meanwhile.
+        """
+        fresh = NamasteIndex()
+        fresh._add_rows(rows)
+        with self._lock:
+            self._docs, self._ids, self._grams, self._postings = fresh._docs, fresh._ids, fresh._grams, fresh._postings
+            self._vocab, self._codes, self._displays = fresh._vocab, fresh._codes, fresh._displays
+            self._keys, self._deletes = fresh._keys, fresh._deletes
+            self._next_id = fresh._next_id
+            self.version += 1
+
+    def sync(self, rows):
+        """Bring the index in line with `rows` (every (code, display, category)),
+        re-indexing only the codes whose row changed; returns how many did"""
+        rows = {row[0]: tuple(row) for row in rows}
+        with self._lock:
+            current = {doc[0]: doc[:3] for doc in self._docs.values()}
+        changed = [row for code, row in rows.items() if current.get(code) != row]
+        removed = [code for code in current if code not in rows]
+        if len(changed) + len(removed) > len(rows) // 2:
+            self.build(rows.values())
+        elif changed or removed:
+            with self._lock:
+                for code in removed:
+                    self._remove(code)
+                self._add_rows(changed)
+                self.version += 1
+        return len(changed) + len(removed)
+
+    def add(self, code, display, category):
+        with self._lock:
+            self._remove(code)
+            self._add(code, display, category)
+            self.version += 1
+
+    def add_many(self, rows):
+        with self._lock:
+            self._add_rows(rows)
+            self.version += 1
+
+    def remove(self, code):
+        with self._lock:
+            self._remove(code)
+            self.version += 1
+
+    @contextmanager
+    def _bulk(self):
+        """Sort the keys added inside the block in once, at its end"""
+        sorted_keys = (self._vocab, self._codes, self._displays)
+        for keys in sorted_keys:
+            keys.start_bulk()
+        try:
+            yield
+        finally:
+            for keys in sorted_keys:
+                keys.end_bulk()
+
+    def _add_rows(self, rows):
+        with self._bulk():
+            for code, display, category in rows:
+                self._remove(code)
+                self._add(code, display, category)
+
+    def _add(self, code, display, category):
+        doc_id = self._next_id
+        self._next_id += 1
+        norm_code, norm_display = normalize(code), normalize(display)
+        text = f" {norm_code} {norm_display} "
+        self._docs[doc_id] = (code, display, category, norm_code, norm_display, text)
+        self._ids[code] = doc_id
+        self._codes.add((norm_code, doc_id))
+        self._displays.add((norm_display, norm_code, doc_id))
+
+        for gram in trigrams(text):
+            self._grams.setdefault(gram, set()).add(doc_id)
+        for token in set(text.split()):
+            posting = self._postings.get(token)
+            if posting is None:
+                posting = self._postings[token] = set()
+                self._vocab.add(token)
+                self._add_key(token)
+            posting.add(doc_id)
+
+    def _add_key(self, token):
+        key = phonetic(token)
+        tokens = self._keys.get(key)
+        if tokens is None:
+            tokens = self._keys[key] = set()
+            if len(key) >= FUZZY_MIN_LENGTH:
+                for variant in deletes(key):
+                    self._deletes.setdefault(variant, set()).add(key)
+        tokens.add(token)
+
+    def _remove_key(self, token):
+        key = phonetic(token)
+        tokens = self._keys.get(key)
+        if tokens is None:
+            return
+        tokens.discard(token)
+        if not tokens:
+            del self._keys[key]
+            if len(key) >= FUZZY_MIN_LENGTH:
+                for variant in deletes(key):
+                    keys = self._deletes.get(variant)
+                    if keys is not None:
+                        keys.discard(key)
+                        if not keys:
+                            del self._deletes[variant]
+
+    def _remove(self, code):
+        doc_id = self._ids.pop(code, None)
+        if doc_id is None:
+            return
+        _, _, _, norm_code, norm_display, text = self._docs.pop(doc_id)
+        self._codes.discard((norm_code, doc_id))
+        self._displays.discard((norm_display, norm_code, doc_id))
+
+        for gram in trigrams(text):
+            posting = self._grams.get(gram)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._grams[gram]
+        for token in set(text.split()):
+            posting = self._postings.get(token)
+            if posting is not None:
+                posting.discard(doc_id)
+                if not posting:
+                    del self._postings[token]
+                    self._remove_key(token)
+                    self._vocab.discard(token)
+
+    # ------------------- Lookup -------------------
+    def _prefix_ids(self, prefix, within=None):
+        if within is not None:
+            docs = self._docs
+            return {i for i in within if " " + prefix in docs[i][5]}
+        ids = set()
+        vocab = self._vocab.keys
+        i = bisect.bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            ids |= self._postings[vocab[i]]
+            i += 1
+        return ids
+
+    def _substring_ids(self, term, within=None):
+        postings = []
+        for gram in trigrams(term):
+            posting = self._grams.get(gram)
+            if not posting:
+                return set()
+            postings.append(posting)
+        postings.sort(key=len)
+        ids = within if within is not None else postings[0]
+        for posting in postings:
+            ids = ids & posting
+            if not ids:
+                return ids
+        # Trigrams only prove the pieces are present; confirm the substring.
+        docs = self._docs
+        return {i for i in ids if term in docs[i][5]}
+
+    def _rank(self, doc, query, terms):
+        _, display, _, norm_code, norm_display, text = doc
+        if norm_code == query:
+            tier = 0
+        elif norm_code.startswith(query):
+            tier = 1
+        elif norm_display.startswith(query):
+            tier = 2
+        elif all(" " + term in text for term in terms):
+            tier = 3  # every term starts a word
+        else:
+            tier = 4
+        return (tier, len(display or ""), norm_code)
+
+    def search(self, query, limit=50):
+        """Return up to `limit` (code, display, category) tuples, best match first."""
+        with self._lock:
+            q = normalize(query)
+            if not q:
+                return [doc[:3] for _, doc in zip(range(limit), self._docs.values())]
+
+            docs = self._docs
+            # exact and prefix matches of the code, then of the display (tiers
+            # 0-2 of _rank, in code/display order), straight off the sorted keys
+            found = {}
+            for keys in (self._codes.keys, self._displays.keys):
+                i = bisect.bisect_left(keys, (q,))
+                while len(found) < limit and i < len(keys) and keys[i][0].startswith(q):
+                    found.setdefault(keys[i][-1])
+                    i += 1
+            if len(found) >= limit:
+                return [docs[i][:3] for i in found]
+
+            terms = q.split()
+            # Longest terms first: they are the most selective, and every
+            # later term only filters the surviving candidates.
+            ids = None
+            for term in sorted(terms, key=len, reverse=True):
+                if len(term) >= 3:
+                    ids = self._substring_ids(term, ids)
+                else:
+                    ids = self._prefix_ids(term, ids)
+                if not ids:
+                    break
+            rest = heapq.nsmallest(limit - len(found), (i for i in ids or () if i not in found),
+                                   key=lambda i: self._rank(docs[i], q, terms))
+            return [docs[i][:3] for i in (*found, *rest)]
+
+    def search_mode(self, query, mode="auto", limit=50):
+        """search() for mode=exact, search_fuzzy() for mode=fuzzy; auto falls
+        back to fuzzy only when the exact search finds nothing"""
+        rows = self.search(query, limit) if mode != "fuzzy" else []
+        if not rows and mode != "exact":
+            rows = self.search_fuzzy(query, limit)
+        return rows
+
+    def _fuzzy_tokens(self, term):
+        """{token: edit distance} for vocabulary tokens phonetically close to `term`"""
+        key = phonetic(term)
+        if len(key) < FUZZY_MIN_LENGTH:
+            return {token: 0 for token in self._keys.get(key, ())}
+        limit = max_edits(key)
+        # candidates share a one-delete variant with the query key
+        candidates = set()
+        if key in self._keys:
+            candidates.add(key)
+        candidates |= self._deletes.get(key, set())
+        for variant in deletes(key):
+            if variant in self._keys:
+                candidates.add(variant)
+            candidates |= self._deletes.get(variant, set())
+
+        matches = {}
+        for candidate in candidates:
+            distance = edit_distance(key, candidate, min(limit, max_edits(candidate)))
+            if distance <= min(limit, max_edits(candidate)):
+                for token in self._keys[candidate]:
+                    matches[token] = min(distance, matches.get(token, distance))
+        return matches
+
+    def search_fuzzy(self, query, limit=50):
+        """Like search(), but each term may be a transliteration variant or
+        misspelling of a word; ranked by total edit distance"""
+        with self._lock:
+            q = normalize(query)
+            if not q:
+                return []
+            terms = q.split()
+            scores = None  # doc id -> summed distance
+            for term in sorted(terms, key=len, reverse=True):
+                term_scores = {}
+                if len(term) < 3:
+                    for i in self._prefix_ids(term, scores):
+                        term_scores[i] = 0
+                else:
+                    for token, distance in self._fuzzy_tokens(term).items():
+                        for i in self._postings[token]:
+                            if scores is None or i in scores:
+                                if distance < term_scores.get(i, distance + 1):
+                                    term_scores[i] = distance
+                    # an exact substring still beats any fuzzy match
+                    for i in self._substring_ids(term, set(scores) if scores is not None else None):
+                        term_scores[i] = 0
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {i: scores[i] + d for i, d in term_scores.items() if i in scores}
+                if not scores:
+                    return []
+
+            docs = self._docs
+            best = heapq.nsmallest(limit, scores, key=lambda i: (scores[i],) + self._rank(docs[i], q, terms))
+            return [docs[i][:3] for i in best]
+
+
+namaste_index = NamasteIndex()
@@ -0,0 +1,128 @@
+# backend/shared_state.py
+"""State shared by every worker process through the SQLite database.
+
+- get/put: small values with an optional expiry (the WHO token)
+- leases: at most one worker does a piece of work at a time (token refresh,
+  ICD cache refresh cycle, stale query refresh); a lease expires on its own
+  if its owner dies
+- generations: counters bumped when shared data changes, so each worker's
+  SharedStateWatcher brings its in-memory copies (search index, caches)
+  up to date
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from db import connection, run_db
+
+SHARED_POLL_SECONDS = float(os.getenv("SHARED_POLL_SECONDS", "2"))
+WORKER_ID = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def get(key):
+    """Stored value for `key`, or None if missing or expired"""
+    with connection() as conn:
+        row = conn.execute("SELECT value, expires_at FROM shared_state WHERE key = ?", (key,)).fetchone()
+    if row is None or (row["expires_at"] is not None and row["expires_at"] <= time.time()):
+        return None
+    return json.loads(row["value"])
+
+
+def put(key, value, expires_at=None):
+    with connection() as conn:
+        conn.execute("INSERT OR REPLACE INTO shared_state(key, value, expires_at) VALUES (?, ?, ?)",
+                     (key, json.dumps(value), expires_at))
+
+
+def acquire_lease(name, ttl):
+    """Take (or extend our own) lease on `name` for `ttl` seconds; False if another worker holds it"""
+    now = time.time()
+    with connection() as conn:
+        cur = conn.execute(
+            """INSERT INTO shared_leases(name, owner, expires_at) VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+               WHERE shared_leases.expires_at <= ? OR shared_leases.owner = excluded.owner""",
+            (name, WORKER_ID, now + ttl, now),
+        )
+        return cur.rowcount == 1
+
+
+def release_lease(name):
+    with connection() as conn:
+        conn.execute("DELETE FROM shared_leases WHERE name = ? AND owner = ?", (name, WORKER_ID))
+
+
+def purge_leases(prefix):
+    """Drop expired leases whose name starts with `prefix`; returns how many"""
+    with connection() as conn:
+        return conn.execute("DELETE FROM shared_leases WHERE substr(name, 1, ?) = ? AND expires_at <= ?",
+                            (len(prefix), prefix, time.time())).rowcount
+
+
+def bump_generation(conn, name):
+    """Increment generation `name` inside the caller's transaction; returns the new value"""
+    return conn.execute(
+        """INSERT INTO shared_state(key, value) VALUES (?, '1')
+           ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1
+           RETURNING CAST(value AS INTEGER)""",
+        (f"generation:{name}",),
+    ).fetchone()[0]
+
+
+def generations():
+    with connection() as conn:
+        rows = conn.execute("SELECT key, value FROM shared_state WHERE key LIKE 'generation:%'").fetchall()
+    return {r["key"][len("generation:"):]: int(r["value"]) for r in rows}
+
+
+class SharedStateWatcher:
+    """Polls the generations and runs a reload callback when another process
+    changed the data behind an in-memory copy"""
+
+    def __init__(self, interval=SHARED_POLL_SECONDS):
+        self.interval = interval
+        self._callbacks = {}  # name -> blocking fn, run on the DB executor
+        self._seen = {}
+        self._task = None
+
+    def watch(self, name, callback):
+        self._callbacks[name] = callback
+
+    def mark_seen(self, name, generation):
+        """Record a change this process made itself (and already applied)"""
+        self._seen[name] = max(self._seen.get(name, 0), generation)
+
+    async def check(self):
+        current = await run_db(generations)
+        for name, callback in self._callbacks.items():
+            generation = current.get(name, 0)
+            if generation > self._seen.get(name, 0):
+                self._seen[name] = generation
+                await run_db(callback)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                print("Shared state check failed:", e)
+
+    def start(self):
+        if self._task is None:
+            self._seen = generations()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+shared_watcher = SharedStateWatcher()
@@ -0,0 +1,233 @@
+# backend/telemetry.py
+import bisect
+import contextvars
+import itertools
+import math
+import os
+import time
+from datetime import datetime
+
+TELEMETRY_BUFFER_SIZE = int(os.getenv("TELEMETRY_BUFFER_SIZE", "4096"))
+
+# Histogram bucket upper bounds, milliseconds
+LATENCY_BUCKETS_MS = (0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, math.inf)
+
+# Per-request accumulators, set by the middleware: [db_ms, upstream_ms, cache]
+_request_stats = contextvars.ContextVar("request_stats", default=None)
+
+
+def add_db_time(ms):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[0] += ms
+
+
+def add_upstream_time(ms):
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[1] += ms
+
+
+def mark_cache(result):
+    """Record 'hit', 'stale' or 'miss' for the current request"""
+    stats = _request_stats.get()
+    if stats is not None:
+        stats[2] = result
+
+
+class RingBuffer:
+    """Fixed-size, preallocated buffer of the most recent request records.
+
+    Writers claim a slot from an itertools.count (atomic under the GIL) and
+    overwrite it, so recording takes no lock and never allocates a slot.
+    """
+
+    def __init__(self, size=TELEMETRY_BUFFER_SIZE):
+        self.size = size
+        self._slots = [None] * size
+        self._seq = itertools.count()
+        self._written = 0
+
+    def append(self, record):
+        i = next(self._seq)
+        self._slots[i % self.size] = record
+        self._written = i + 1
+
+    def recent(self, limit):
+        """Newest-first records (may skip a slot being overwritten concurrently)"""
+        end = self._written
+        out = []
+        for i in range(end - 1, max(end - min(limit, self.size), 0) - 1, -1):
+            record = self._slots[i % self.size]
+            if record is not None:
+                out.append(record)
+        return out
+
+
+class RouteHistogram:
+    __slots__ = ("counts", "count", "total_ms", "db_ms", "upstream_ms", "errors")
+
+    def __init__(self):
+        self.counts = [0] * len(LATENCY_BUCKETS_MS)
+        self.count = 0
+        self.total_ms = self.db_ms = self.upstream_ms = 0.0
+        self.errors = 0
+
+    def observe(self, ms, db_ms, upstream_ms, status):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS_MS, ms)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.db_ms += db_ms
+        self.upstream_ms += upstream_ms
+        if status >= 500:
+            self.errors += 1
+
+    def percentile(self, pct):
+        """Estimate from the buckets, interpolating linearly inside one"""
+        if not self.count:
+            return 0.0
+        rank = self.count * pct / 100
+        seen = 0
+        for i, n in enumerate(self.counts):
+            if n and seen + n >= rank:
+                low = LATENCY_BUCKETS_MS[i - 1] if i else 0.0
+                high = LATENCY_BUCKETS_MS[i]
+                if math.isinf(high):
+                    return low
+                return low + (high - low) * (rank - seen) / n
+            seen += n
+        return LATENCY_BUCKETS_MS[-2]
+
+
+class Telemetry:
+    def __init__(self, size=TELEMETRY_BUFFER_SIZE):
+        self.buffer = RingBuffer(size)
+        self.routes = {}  # (method, route) -> RouteHistogram
+
+    def record(self, method, route, status, ms, db_ms=0.0, upstream_ms=0.0, cache=None):
+        self.buffer.append((time.time(), method, route, status, ms, db_ms, upstream_ms, cache))
+        hist = self.routes.get((method, route))
+        if hist is None:
+            hist = self.routes[(method, route)] = RouteHistogram()
+        hist.observe(ms, db_ms, upstream_ms, status)
+
+    def recent(self, limit=50):
+        return [
+            {
+                "timestamp": datetime.fromtimestamp(ts).isoformat(),
+                "endpoint": f"{method} {route}",
+                "status": status,
+                "latencyMs": round(ms, 3),
+                "dbMs": round(db_ms, 3),
+                "upstreamMs": round(upstream_ms, 3),
+                "cache": cache,
+            }
+            for ts, method, route, status, ms, db_ms, upstream_ms, cache in self.buffer.recent(limit)
+        ]
+
+    def summary(self):
+        out = {}
+        for (method, route), hist in sorted(self.routes.items(), key=lambda kv: kv[0][1]):
+            out[f"{method} {route}"] = {
+                "count": hist.count,
+                "errors": hist.errors,
+                "meanMs": round(hist.total_ms / hist.count, 3),
+                "p50Ms": round(hist.percentile(50), 3),
+                "p95Ms": round(hist.percentile(95), 3),
+                "p99Ms": round(hist.percentile(99), 3),
+                "dbMsTotal": round(hist.db_ms, 3),
+                "upstreamMsTotal": round(hist.upstream_ms, 3),
+                "buckets": {
+                    ("+Inf" if math.isinf(le) else str(le)): n
+                    for le, n in zip(LATENCY_BUCKETS_MS, itertools.accumulate(hist.counts))
+                },
+            }
+        return out
+
+    def prometheus(self):
+        """Prometheus text exposition format (0.0.4)"""
+        lines = [
+            "# HELP ayusync_request_duration_seconds HTTP request latency",
+            "# TYPE ayusync_request_duration_seconds histogram",
+        ]
+        for (method, route), hist in self.routes.items():
+            labels = f'method="{method}",route="{route}"'
+            for le, n in zip(LATENCY_BUCKETS_MS, itertools.accumulate(hist.counts)):
+                bound = "+Inf" if math.isinf(le) else repr(le / 1000)
+                lines.append(f'ayusync_request_duration_seconds_bucket{{{labels},le="{bound}"}} {n}')
+            lines.append(f"ayusync_request_duration_seconds_sum{{{labels}}} {hist.total_ms / 1000}")
+            lines.append(f"ayusync_request_duration_seconds_count{{{labels}}} {hist.count}")
+        for name, attr, help_text in (
+            ("ayusync_request_db_seconds_total", "db_ms", "Time spent in SQLite per route"),
+            ("ayusync_request_upstream_seconds_total", "upstream_ms", "Time spent calling the WHO API per route"),
+        ):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for (method, route), hist in self.routes.items():
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {getattr(hist, attr) / 1000}')
+        lines.append("# HELP ayusync_request_errors_total Responses with status >= 500")
+        lines.append("# TYPE ayusync_request_errors_total counter")
+        for (method, route), hist in self.routes.items():
+            lines.append(f'ayusync_request_errors_total{{method="{method}",route="{route}"}} {hist.errors}')
+        return "\n".join(lines) + "\n"
+
+
+telemetry = Telemetry()
+
+
+class TelemetryMiddleware:
+    """Pure ASGI middleware recording every HTTP request into `telemetry`"""
+
+    def __init__(self, app, sink=telemetry):
+        self.app = app
+        self.sink = sink
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = [0.0, 0.0, None]
+        token = _request_stats.set(stats)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            ms = (time.perf_counter() - start) * 1000
+            _request_stats.reset(token)
+            route = scope.get("route")
+            # templated path keeps the route set bounded (no per-code series)
+            path = getattr(route, "path", None) or "<unmatched>"
+            self.sink.record(scope["method"], path, status[0], ms, stats[0], stats[1], stats[2])
+
+
+if __name__ == "__main__":
+    # Middleware overhead per request, against a no-op ASGI app
+    import asyncio
+
+    async def noop_app(scope, receive, send):
+        await send({"type": "http.response.start", "status": 200})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def noop_send(message):
+        pass
+
+    async def per_request_us(app, n=100_000):
+        scope = {"type": "http", "method": "GET", "path": "/api/namaste/search"}
+        start = time.perf_counter()
+        for _ in range(n):
+            await app(scope, None, noop_send)
+        return (time.perf_counter() - start) / n * 1e6
+
+    async def main():
+        bare = await per_request_us(noop_app)
+        wrapped = await per_request_us(TelemetryMiddleware(noop_app, Telemetry()))
+        print(f"TelemetryMiddleware overhead: {wrapped - bare:.2f} us/request")
+
+    asyncio.run(main())
@@ -0,0 +1,57 @@
+# backend/tests/conftest.py
+"""Runs the app modules against a scratch database.
+
+The environment is set here, before any app module is imported, because
+they read their settings at import time. Run from backend/:
+
+    python -m pytest
+"""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+BACKEND = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND))
+os.environ.update({
+    "AYUSYNC_DB": os.path.join(tempfile.mkdtemp(prefix="ayusync-test-"), "test.db"),
+    "REFERENCE_DATA_DIR": str(BACKEND / "data"),
+    "ICD_REFRESH_ENABLED": "0",
+    "WARMUP_ENABLED": "0",
+    # no WHO credentials: nothing leaves the machine
+    "WHO_API_BASE": "http://127.0.0.1:9",
+    "WHO_TOKEN_URL": "",
+    "WHO_CLIENT_ID": "",
+    "WHO_CLIENT_SECRET": "",
+})
+
+
+@pytest.fixture(scope="session")
+def database():
+    """The scratch database with every migration and the reference data"""
+    from db import init_db
+    from reference_data import load_reference_data
+
+    init_db()
+    load_reference_data()
+
+
+@pytest.fixture(scope="session")
+def client(database):
+    """TestClient over the app, started up once for the session"""
+    from fastapi.testclient import TestClient
+
+    import main
+
+    with TestClient(main.app) as client:
+        yield client
+
+
+@pytest.fixture
+def conn(database):
+    from db import connection
+
+    with connection() as conn:
+        yield conn
@@ -0,0 +1,79 @@
+# backend/tests/test_bundle.py
+"""/api/bundle saves all of a well-formed Bundle and none of a malformed one"""
+import json
+
+import pytest
+
+import bundle
+from db import connection
+
+
+def condition(patient, namaste="NAM-001", icd="1A00"):
+    return {"resource": {
+        "resourceType": "Condition", "id": f"{patient}-{namaste}",
+        "subject": {"reference": f"Patient/{patient}"},
+        "code": {"coding": [{"system": "urn:namaste", "code": namaste},
+                            {"system": "http://who.int/icd11", "code": icd}]},
+    }}
+
+
+def saved(patient_prefix):
+    with connection() as conn:
+        return conn.execute("SELECT COUNT(*) FROM problems WHERE patient_id LIKE ?",
+                            (patient_prefix + "%",)).fetchone()[0]
+
+
+@pytest.fixture
+def small_batches(monkeypatch):
+    """Commit every two Conditions, so a late error follows committed batches"""
+    monkeypatch.setattr(bundle, "BUNDLE_BATCH_SIZE", 2)
+
+
+def test_bundle_saves_every_batch(client, small_batches):
+    entries = [condition(f"bundle-ok-{i}") for i in range(5)] + [condition("bundle-ok-x", "NAM-404")]
+    res = client.post("/api/bundle", json={"resourceType": "Bundle", "entry": entries})
+    assert res.status_code == 200
+    body = res.json()
+    assert (body["saved"], body["rejected"], body["success"]) == (5, 1, False)
+    assert body["errors"] == [{"entry": 5, "id": "bundle-ok-x-NAM-404", "detail": "NAMASTE code not found"}]
+    assert saved("bundle-ok-") == 5
+
+
+@pytest.mark.parametrize("tail", ["", ", {", ", 12 13]}"], ids=["eof", "cut", "separator"])
+def test_malformed_bundle_saves_nothing(client, small_batches, tail):
+    entries = ", ".join(json.dumps(condition(f"bundle-bad-{i}")) for i in range(5))
+    text = '{"resourceType": "Bundle", "entry": [' + entries + tail
+    res = client.post("/api/bundle", content=text, headers={"Content-Type": "application/fhir+json"})
+    assert res.status_code == 400
+    assert res.json()["detail"]["saved"] == 0
+    assert saved("bundle-bad-") == 0
+
+
+def test_non_bundle_is_refused(client):
+    res = client.post("/api/bundle", json={"resourceType": "Patient", "entry": [condition("bundle-patient")]})
+    assert res.status_code == 400
+    assert "Expected a Bundle" in res.json()["detail"]["error"]
+    assert saved("bundle-patient") == 0
+
+
+def test_strict_icd_lookup_is_bounded(client, monkeypatch):
+    import main
+
+    looked_up = []
+
+    async def resolve(codes):
+        looked_up.append(set(codes))
+
+    monkeypatch.setattr(main, "who_configured", lambda: True)
+    monkeypatch.setattr(main, "resolve_icd_codes", resolve)
+    monkeypatch.setattr(main, "ICD_RESOLVE_MAX_CODES", 2)
+    entries = [condition(f"bundle-strict-{i}", icd=f"1A0{i}") for i in range(3)]
+
+    res = client.post("/api/bundle", params={"strict_icd": "true"}, json={"resourceType": "Bundle", "entry": entries})
+    assert res.status_code == 413
+    assert looked_up == [] and saved("bundle-strict-") == 0
+
+    res = client.post("/api/bundle", params={"strict_icd": "true"},
+                      json={"resourceType": "Bundle", "entry": entries[:2]})
+    assert res.status_code == 200
+    assert looked_up == [{"1A00", "1A01"}]
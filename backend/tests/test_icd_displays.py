@@ -0,0 +1,48 @@
+# backend/tests/test_icd_displays.py
+"""ICD displays fall back to concept_map wherever icd_cache has no entry yet"""
+import gzip
+import json
+
+import pytest
+
+from db import connection
+from problems import save_problems
+
+MAPPED_ONLY, CACHED = "DISP-1", "DISP-2"
+
+
+@pytest.fixture(scope="module")
+def displays(database):
+    """DISP-1 only concept_map knows; DISP-2 both know, under different displays"""
+    with connection() as conn:
+        conn.executemany(
+            "INSERT INTO concept_map(namaste_code, icd_code, icd_display, module, confidence, mapping_type) "
+            "VALUES ('NAM-001', ?, ?, 'TM2', 50, 'test')",
+            [(MAPPED_ONLY, "Mapped display"), (CACHED, "Stale mapped display")],
+        )
+        conn.execute("INSERT INTO icd_cache(code, display, module) VALUES (?, 'Cached display', 'TM2')", (CACHED,))
+    save_problems([("disp-patient", "NAM-001", [MAPPED_ONLY, CACHED])])
+    yield {MAPPED_ONLY: "Mapped display", CACHED: "Cached display"}
+    with connection() as conn:
+        conn.execute("DELETE FROM concept_map WHERE icd_code LIKE 'DISP-%'")
+        conn.execute("DELETE FROM icd_cache WHERE code LIKE 'DISP-%'")
+
+
+def test_patient_problems(client, displays):
+    rows = client.get("/api/patients/disp-patient/problems").json()["problems"]
+    assert {r["icd_code"]: r["icd_display"] for r in rows} == displays
+
+
+def test_top_icd_codes(client, displays):
+    rows = client.get("/api/analytics/top-icd", params={"limit": 100}).json()
+    assert {r["code"]: r["display"] for r in rows if r["code"] in displays} == displays
+
+
+def test_columnar_export(client, displays):
+    res = client.get("/api/export/problems", params={"format": "columnar"})
+    found = {}
+    for line in gzip.decompress(res.content).decode().splitlines():
+        batch = json.loads(line)
+        if batch.get("dictionary") == "icd_code":
+            found.update(zip(batch["values"], batch["display"]))
+    assert {code: found[code] for code in displays} == displays
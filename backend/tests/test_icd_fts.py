@@ -0,0 +1,55 @@
+# backend/tests/test_icd_fts.py
+"""icd_fts follows icd_cache through its triggers"""
+import pytest
+
+from db import connection
+from icd_client import search_cached_icd
+
+
+@pytest.fixture
+def fts(database):
+    with connection() as conn:
+        if not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'icd_fts'").fetchone():
+            pytest.skip("SQLite has no FTS5 trigram tokenizer")
+    yield
+    with connection() as conn:
+        conn.execute("DELETE FROM icd_cache WHERE code LIKE 'FTS-%'")
+
+
+def put(sql, params):
+    with connection() as conn:
+        conn.execute(sql, params)
+
+
+def codes(query):
+    return [r["code"] for r in search_cached_icd(query)]
+
+
+def check_integrity():
+    with connection() as conn:
+        conn.execute("INSERT INTO icd_fts(icd_fts, rank) VALUES ('integrity-check', 1)")
+
+
+def test_insert_is_searchable(fts):
+    put("INSERT INTO icd_cache(code, display, module) VALUES (?, ?, ?)", ("FTS-1", "Zorblaxitis acute", "TM2"))
+    assert codes("zorblax") == ["FTS-1"]
+    assert codes("zorblaxitis acu") == ["FTS-1"]
+    check_integrity()
+
+
+def test_update_replaces_the_indexed_title(fts):
+    put("INSERT INTO icd_cache(code, display, module) VALUES (?, ?, ?)", ("FTS-2", "Quendrosis", "TM2"))
+    put("UPDATE icd_cache SET display = ? WHERE code = ?", ("Vemtralgia", "FTS-2"))
+    assert codes("quendrosis") == []
+    assert codes("vemtralgia") == ["FTS-2"]
+    check_integrity()
+
+
+def test_replace_and_delete(fts):
+    put("INSERT INTO icd_cache(code, display, module) VALUES (?, ?, ?)", ("FTS-3", "Plixomeria", "TM2"))
+    # REPLACE deletes the old row first; the delete trigger must fire for it
+    put("INSERT OR REPLACE INTO icd_cache(code, display, module) VALUES (?, ?, ?)", ("FTS-3", "Plixomeria late", "TM2"))
+    assert codes("plixomeria") == ["FTS-3"]
+    put("DELETE FROM icd_cache WHERE code = ?", ("FTS-3",))
+    assert codes("plixomeria") == []
+    check_integrity()
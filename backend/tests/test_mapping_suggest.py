@@ -0,0 +1,84 @@
+# backend/tests/test_mapping_suggest.py
+"""Suggestions follow icd_cache changes without rescoring every NAMASTE code"""
+import pytest
+
+import mapping_suggest
+from db import connection
+from mapping_suggest import Vectorizer, ngrams, suggest_mappings, top_matches_python
+
+
+def suggestions(namaste_code):
+    with connection() as conn:
+        return {r[0]: r[1] for r in conn.execute(
+            "SELECT icd_code, confidence FROM concept_map WHERE mapping_type = 'suggested' AND namaste_code = ?",
+            (namaste_code,))}
+
+
+@pytest.fixture
+def put_icd(database, monkeypatch):
+    """Write icd_cache rows; never refit unless a test asks for it"""
+    monkeypatch.setattr(mapping_suggest, "SUGGEST_REFIT_FRACTION", 1.0)
+
+    def put(*rows):
+        with connection() as conn:
+            conn.executemany("INSERT OR REPLACE INTO icd_cache(code, display, module) VALUES (?, ?, 'TM2')", rows)
+
+    yield put
+    with connection() as conn:
+        conn.execute("DELETE FROM icd_cache WHERE code LIKE 'SUG-%'")
+    suggest_mappings(full=True)
+
+
+def test_new_titles_merge_into_stored_suggestions(put_icd):
+    put_icd(("SUG-1", "Pitta disorder of the skin"), ("SUG-2", "Kapha excess"))
+    suggest_mappings(full=True)
+    kapha = suggestions("NAM-003")
+    assert "SUG-2" in kapha
+
+    put_icd(("SUG-3", "Vata dosha imbalance"))
+    summary = suggest_mappings()
+    assert (summary["full"], summary["scored"], summary["icdScored"]) == (False, 0, 1)
+    assert "NAM-001" in summary["codes"] and "SUG-3" in suggestions("NAM-001")
+    assert suggestions("NAM-003") == kapha
+    merged = {code: set(suggestions(code)) for code in ("NAM-001", "NAM-002", "NAM-003")}
+
+    suggest_mappings(full=True)
+    assert {code: set(suggestions(code)) for code in merged} == merged
+
+
+def test_retitled_suggestion_is_rescored(put_icd):
+    put_icd(("SUG-1", "Pitta disorder"))
+    suggest_mappings(full=True)
+    assert "SUG-1" in suggestions("NAM-002")
+
+    put_icd(("SUG-1", "Fracture of femur"))
+    summary = suggest_mappings()
+    assert not summary["full"] and "NAM-002" in summary["codes"] and summary["scored"] >= 1
+    assert "SUG-1" not in suggestions("NAM-002")
+
+
+def test_growth_past_the_refit_fraction_rescores_everything(put_icd, monkeypatch):
+    suggest_mappings(full=True)
+    monkeypatch.setattr(mapping_suggest, "SUGGEST_REFIT_FRACTION", 0.0)
+    put_icd(("SUG-1", "Kapha excess"))
+    assert suggest_mappings()["full"]
+
+
+def test_unchanged_run_does_nothing(put_icd):
+    suggest_mappings(full=True)
+    summary = suggest_mappings()
+    assert (summary["full"], summary["scored"], summary["icdScored"], summary["codes"]) == (False, 0, 0, set())
+
+
+@pytest.mark.skipif(mapping_suggest.sparse is None, reason="numpy/scipy not installed")
+def test_small_blocks_match_the_python_product(monkeypatch):
+    titles = ["vata dosha imbalance", "pitta disorder", "kapha excess", "diabetes mellitus", "vata disorder"]
+    counts = [ngrams(t) for t in titles]
+    vectorizer = Vectorizer(counts)
+    corpus = [vectorizer.transform(c) for c in counts]
+    queries = [vectorizer.transform(ngrams(t)) for t in ("vata", "pitta dosha", "kapha", "madhumeha")]
+    monkeypatch.setattr(mapping_suggest, "SUGGEST_BLOCK_CELLS", len(corpus) * 2)  # two NAMASTE rows per block
+    chunked = mapping_suggest.top_matches_scipy(queries, corpus, len(vectorizer.vocab), 3, 0.1)
+    expected = top_matches_python(queries, corpus, len(vectorizer.vocab), 3, 0.1)
+    assert [[i for i, _ in row] for row in chunked] == [[i for i, _ in row] for row in expected]
+    assert [s for row in chunked for _, s in row] == pytest.approx([s for row in expected for _, s in row], rel=1e-5)
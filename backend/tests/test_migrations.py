@@ -0,0 +1,57 @@
+# backend/tests/test_migrations.py
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import db
+
+
+def versions(conn):
+    return [r[0] for r in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+
+
+def test_every_migration_applied(conn):
+    assert versions(conn) == [version for version, _, _ in db.MIGRATIONS]
+
+
+def test_migrate_again_is_a_no_op(database):
+    conn = db.get_conn()
+    try:
+        before = conn.execute("SELECT version, applied_at FROM schema_version").fetchall()
+        db.migrate(conn)
+        assert conn.execute("SELECT version, applied_at FROM schema_version").fetchall() == before
+    finally:
+        conn.close()
+
+
+def test_failed_migration_leaves_no_partial_state(database, monkeypatch):
+    monkeypatch.setattr(db, "MIGRATIONS", db.MIGRATIONS + [
+        (999, "Broken", ["CREATE TABLE partial_migration (x)", "INSERT INTO missing_table VALUES (1)"]),
+    ])
+    conn = db.get_conn()
+    try:
+        with pytest.raises(sqlite3.OperationalError):
+            db.migrate(conn)
+        assert 999 not in versions(conn)
+        assert not conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'partial_migration'").fetchone()
+    finally:
+        conn.close()
+
+
+def test_migrates_the_original_database(tmp_path):
+    """The database shipped before migrations existed upgrades in place"""
+    path = tmp_path / "original.db"
+    shutil.copy(Path(db.__file__).parent / "ayusync.db", path)
+    conn = db._connect(path)
+    try:
+        problems = conn.execute("SELECT COUNT(*) FROM problems").fetchone()[0]
+        db.migrate(conn)
+        assert versions(conn) == [version for version, _, _ in db.MIGRATIONS]
+        assert conn.execute("SELECT COUNT(*) FROM problems").fetchone()[0] == problems
+        # the rollup backfill counted the existing problems
+        rolled = conn.execute("SELECT COALESCE(SUM(codings), 0) FROM problem_rollup_icd").fetchone()[0]
+        assert rolled == problems
+    finally:
+        conn.close()
@@ -0,0 +1,67 @@
+# backend/tests/test_pagination.py
+import json
+
+import pytest
+
+from pagination import KeysetQuery, decode_cursor, encode_cursor
+from problems import save_problems
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor([1700000000, 42])) == [1700000000, 42]
+    assert decode_cursor(encode_cursor(["NAM-001", None, 1.5])) == ["NAM-001", None, 1.5]
+
+
+@pytest.mark.parametrize("cursor", ["!!!", encode_cursor({"a": 1}), encode_cursor([[1]]), encode_cursor([{"a": 1}])])
+def test_invalid_cursor(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
+
+
+def test_wrong_length_cursor():
+    with pytest.raises(ValueError):
+        KeysetQuery("*", "namaste", ["code"]).sql(encode_cursor(["a", "b"]))
+
+
+def test_pages_cover_every_row_once(database):
+    query = KeysetQuery("code", "namaste", ["code"])
+    seen, cursor = [], None
+    while True:
+        rows, cursor = query.page(cursor, limit=3)
+        seen += [r["code"] for r in rows]
+        if cursor is None:
+            break
+    assert seen == sorted(set(seen)) and len(seen) >= 10
+
+
+def test_patient_problems_pages(client):
+    save_problems([("page-patient", "NAM-001", [f"1A0{i}"]) for i in range(5)])
+    save_problems([("page-patient", "NAM-002", ["1B00"])])
+    codes, cursor = [], None
+    while True:
+        r = client.get("/api/patients/page-patient/problems", params={"limit": 2, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        codes += [(p["created_at"], p["id"]) for p in r.json()["problems"]]
+        cursor = r.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert len(codes) == 6 and codes == sorted(codes, reverse=True)
+
+
+@pytest.mark.parametrize("fmt", ["json", "ndjson"])
+@pytest.mark.parametrize("cursor", [encode_cursor(["a", "b", "c"]), encode_cursor([{"x": 1}]), "!!!"])
+def test_debug_listing_rejects_bad_cursor(client, fmt, cursor):
+    r = client.get("/api/debug/namaste", params={"format": fmt, "cursor": cursor})
+    assert r.status_code == 400
+
+
+def test_debug_listing_ndjson_continues_after_cursor(client):
+    def ndjson_codes(params):
+        r = client.get("/api/debug/namaste", params=dict(params, format="ndjson"))
+        assert r.status_code == 200
+        return [json.loads(line)["code"] for line in r.text.splitlines()]
+
+    first = client.get("/api/debug/namaste", params={"limit": 2})
+    everything = ndjson_codes({})
+    assert [r["code"] for r in first.json()] == everything[:2]
+    assert ndjson_codes({"cursor": first.headers["X-Next-Cursor"]}) == everything[2:]
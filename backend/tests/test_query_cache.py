@@ -0,0 +1,112 @@
+# backend/tests/test_query_cache.py
+import asyncio
+import time
+
+import query_cache
+from db import connection
+from query_cache import QueryCache, _load_row, _store_row, query_key
+
+
+class Fetcher:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        return self.value
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def lease_rows(key):
+    with connection() as conn:
+        return conn.execute("SELECT owner FROM shared_leases WHERE name = ?", (f"query:{key}",)).fetchall()
+
+
+def test_query_key_ignores_case_and_spacing():
+    assert query_key("  Diabetes   Mellitus ", 20, "en") == query_key("diabetes mellitus", 20, "en")
+    assert query_key("diabetes", 20, "en") != query_key("diabetes", 10, "en")
+
+
+def test_miss_then_hit(database):
+    cache = QueryCache(persist=False)
+    fetch = Fetcher([{"code": "1A00"}])
+    assert run(cache.get_or_fetch("hit-key", fetch)) == [{"code": "1A00"}]
+    assert run(cache.get_or_fetch("hit-key", fetch)) == [{"code": "1A00"}]
+    assert fetch.calls == 1 and cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_empty_results_are_not_cached(database):
+    cache = QueryCache(persist=False)
+    fetch = Fetcher([])
+    run(cache.get_or_fetch("empty-key", fetch))
+    run(cache.get_or_fetch("empty-key", fetch))
+    assert fetch.calls == 2 and len(cache) == 0
+
+
+def test_lru_eviction(database):
+    cache = QueryCache(maxsize=2, persist=False)
+
+    async def fill():
+        for key in ("a", "b", "a", "c"):  # "a" was used after "b"
+            await cache.get_or_fetch(key, Fetcher([key]))
+
+    run(fill())
+    assert set(cache._entries) == {"a", "c"} and cache.evictions == 1
+
+
+def test_persisted_entry_survives_restart(database):
+    run(QueryCache().get_or_fetch("persist-key", Fetcher(["stored"])))
+    fetch = Fetcher(["fresh"])
+    assert run(QueryCache().get_or_fetch("persist-key", fetch)) == ["stored"] and fetch.calls == 0
+
+
+def test_stale_entry_refreshes_and_releases_lease(database):
+    _store_row("stale-key", ["old"], int(time.time()) - 7200)
+    cache = QueryCache(ttl=3600)
+    fetch = Fetcher(["new"])
+
+    async def scenario():
+        assert await cache.get_or_fetch("stale-key", fetch) == ["old"]  # served stale
+        await asyncio.gather(*cache._refreshing.values())
+
+    run(scenario())
+    assert fetch.calls == 1 and _load_row("stale-key")[0] == ["new"]
+    assert lease_rows("stale-key") == []
+
+
+def test_lost_lease_picks_up_the_winners_result(database, monkeypatch):
+    monkeypatch.setattr(query_cache, "ICD_QUERY_LEASE_WAIT", 2)
+    _store_row("shared-key", ["old"], int(time.time()) - 7200)
+    with connection() as conn:  # another worker is refreshing this entry
+        conn.execute("INSERT INTO shared_leases(name, owner, expires_at) VALUES (?, 'other', ?)",
+                     ("query:shared-key", time.time() + 30))
+    cache = QueryCache(ttl=3600)
+    fetch = Fetcher(["ours"])
+
+    async def scenario():
+        assert await cache.get_or_fetch("shared-key", fetch) == ["old"]
+        await asyncio.sleep(0.3)
+        await asyncio.to_thread(_store_row, "shared-key", ["theirs"], int(time.time()))
+        await asyncio.gather(*cache._refreshing.values())
+        return await cache.get_or_fetch("shared-key", fetch)
+
+    assert run(scenario()) == ["theirs"]
+    assert fetch.calls == 0 and cache.shared_refreshes == 1
+    assert [r["owner"] for r in lease_rows("shared-key")] == ["other"]
+
+
+def test_purge_drops_only_expired_query_leases(database):
+    now = time.time()
+    with connection() as conn:
+        conn.executemany("INSERT OR REPLACE INTO shared_leases(name, owner, expires_at) VALUES (?, 'gone', ?)", [
+            ("query:expired", now - 10), ("query:live", now + 60), ("icd_refresh_test", now - 10)])
+    run(QueryCache().purge_expired())
+    with connection() as conn:
+        names = {r[0] for r in conn.execute("SELECT name FROM shared_leases")}
+    assert "query:expired" not in names and {"query:live", "icd_refresh_test"} <= names
+    with connection() as conn:
+        conn.execute("DELETE FROM shared_leases WHERE owner = 'gone'")
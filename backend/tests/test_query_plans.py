@@ -0,0 +1,21 @@
+# backend/tests/test_query_plans.py
+import pytest
+
+from check_schema import HOT_QUERIES, app_queries, plan_problem
+
+QUERIES = HOT_QUERIES + app_queries()
+
+
+@pytest.mark.parametrize("description, sql, params, index", QUERIES, ids=[q[0] for q in QUERIES])
+def test_query_uses_index(conn, description, sql, params, index):
+    assert plan_problem(conn, sql, params, index) is None
+
+
+def test_app_queries_cover_keyset_listings():
+    from export import PROBLEMS_EXPORT
+    from main import DEBUG_CONCEPT_MAP, DEBUG_ICD_CACHE, DEBUG_NAMASTE, DEBUG_PROBLEMS, PATIENT_PROBLEMS
+
+    sqls = {sql for _, sql, _, _ in app_queries()}
+    for query, params in ((PATIENT_PROBLEMS, ("patient-1",)), (DEBUG_PROBLEMS, ()), (DEBUG_CONCEPT_MAP, ()),
+                          (DEBUG_NAMASTE, ()), (DEBUG_ICD_CACHE, ()), (PROBLEMS_EXPORT, (0, 1))):
+        assert query.sql(None, params)[0] + " LIMIT 500" in sqls
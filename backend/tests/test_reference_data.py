@@ -0,0 +1,71 @@
+# backend/tests/test_reference_data.py
+"""Malformed reference rows are reported by file and row, and load nothing"""
+import json
+import shutil
+from pathlib import Path
+
+import pytest
+
+from db import connection
+from reference_data import REFERENCE_DATA_DIR, concept_map_rows, load_reference_data, namaste_rows
+
+HEADER = "namaste_code,icd_code,icd_display,module,confidence,mapping_type\n"
+
+
+def parse(parser, name, text):
+    return parser(Path(name), text.encode())
+
+
+def test_concept_map_csv():
+    rows, _ = parse(concept_map_rows, "concept_map.csv", HEADER + " NAM-001 , 1A00 ,Cholera,Biomedical, 90 ,\n")
+    assert rows == {("NAM-001", "1A00"): ("Cholera", "Biomedical", 90, "automatic")}
+
+
+@pytest.mark.parametrize("line, error", [
+    ("NAM-001,1A00,Cholera,Biomedical,,automatic", "concept_map.csv line 3: confidence must be an integer, got ''"),
+    ("NAM-001,1A00,Cholera,Biomedical,high,automatic", "concept_map.csv line 3: confidence must be an integer"),
+    ("NAM-001,1A00,Cholera", "concept_map.csv line 3: confidence must be an integer"),
+    (",1A00,Cholera,Biomedical,90,automatic", "concept_map.csv line 3: namaste_code and icd_code are required"),
+], ids=["blank", "text", "short", "no-code"])
+def test_concept_map_csv_bad_row(line, error):
+    with pytest.raises(ValueError, match=error):
+        parse(concept_map_rows, "concept_map.csv", HEADER + "NAM-002,1A01,Typhoid,Biomedical,80,automatic\n" + line)
+
+
+def test_csv_missing_column():
+    with pytest.raises(ValueError, match="concept_map.csv: missing column\\(s\\) confidence"):
+        parse(concept_map_rows, "concept_map.csv", "namaste_code,icd_code,icd_display,module\n")
+    with pytest.raises(ValueError, match="namaste.csv: missing column\\(s\\) display"):
+        parse(namaste_rows, "namaste.csv", "code,category\nNAM-001,Dosha\n")
+
+
+def test_concept_map_json_bad_element():
+    concept_map = {"resourceType": "ConceptMap", "group": [{"element": [
+        {"code": "NAM-001", "target": [{"code": "1A00", "equivalence": "equal"}]},
+        {"target": [{"code": "1A01", "equivalence": "equal"}]},
+    ]}]}
+    with pytest.raises(ValueError, match="concept_map.json group 0 element 1: element has no code"):
+        parse(concept_map_rows, "concept_map.json", json.dumps(concept_map))
+
+
+def test_namaste_json_concept_without_code():
+    code_system = {"resourceType": "CodeSystem", "concept": [{"code": "NAM-001", "display": "Vata"},
+                                                             {"display": "Pitta"}]}
+    with pytest.raises(ValueError, match="namaste.json: concept 'Pitta' has no code"):
+        parse(namaste_rows, "namaste.json", json.dumps(code_system))
+
+
+def test_bad_file_loads_nothing(database, tmp_path):
+    shutil.copy(REFERENCE_DATA_DIR / "namaste.csv", tmp_path)
+    good = (REFERENCE_DATA_DIR / "concept_map.csv").read_text()
+    (tmp_path / "concept_map.csv").write_text(good + "NAM-001,1A00,Cholera,Biomedical,,automatic\n")
+
+    def mappings():
+        with connection() as conn:
+            return conn.execute("SELECT COUNT(*) FROM concept_map").fetchone()[0]
+
+    before = mappings()
+    with pytest.raises(ValueError, match="concept_map.csv line"):
+        load_reference_data(tmp_path)
+    assert mappings() == before
+    assert not load_reference_data()["changed"]  # the loaded version is still the shipped one
@@ -0,0 +1,102 @@
+# backend/tests/test_rollups.py
+"""The analytics rollups kept by save_problems match a rebuild from `problems`"""
+import shutil
+import threading
+
+import pytest
+
+import analytics
+import problems
+from db import connection
+from reference_data import REFERENCE_DATA_DIR, load_reference_data
+
+TABLES = ("problem_rollup_namaste", "problem_rollup_icd", "problem_rollup_daily", "problem_rollup_category")
+
+
+def snapshot():
+    with connection() as conn:
+        return {t: sorted(map(tuple, conn.execute(f"SELECT * FROM {t}"))) for t in TABLES}
+
+
+def assert_matches_rebuild():
+    incremental = snapshot()
+    analytics.rebuild_rollups()
+    assert snapshot() == incremental
+
+
+def namaste_problems(code):
+    with connection() as conn:
+        row = conn.execute("SELECT problems FROM problem_rollup_namaste WHERE namaste_code = ?", (code,)).fetchone()
+    return row[0] if row else 0
+
+
+@pytest.fixture
+def frozen_time(monkeypatch):
+    """Every save lands in the same second"""
+    monkeypatch.setattr(problems.time, "time", lambda: 1_800_000_000.5)
+
+
+def test_incremental_matches_rebuild(database):
+    problems.save_problems([
+        ("roll-1", "NAM-001", ["1A00", "1A01"]),
+        ("roll-1", "NAM-001", ["1A02"]),         # same patient and code in one save: one problem
+        ("roll-2", "NAM-003", ["1A00", "1A00"]),  # a repeated code is two codings
+        ("roll-3", "NAM-004", []),                # nothing saved
+    ])
+    problems.save_problems([("roll-2", "NAM-005", ["5A10"])])
+    assert_matches_rebuild()
+
+
+def test_same_second_saves_count_once(database, frozen_time):
+    before = namaste_problems("NAM-006")
+    problems.save_problems([("roll-same", "NAM-006", ["1A00"])])
+    problems.save_problems([("roll-same", "NAM-006", ["1A01"])])
+    assert namaste_problems("NAM-006") == before + 1
+    assert_matches_rebuild()
+
+
+def test_concurrent_same_second_saves_count_once(database, frozen_time, monkeypatch):
+    # hold each save between reading what was saved this second and updating
+    # the rollups until the other save got there too; only the write lock
+    # keeps the second one from reading before the first one has written
+    arrived = threading.Barrier(2)
+    read = analytics.saved_at
+
+    def read_and_wait(*args):
+        joined = read(*args)
+        try:
+            arrived.wait(timeout=0.5)
+        except threading.BrokenBarrierError:
+            pass
+        return joined
+
+    monkeypatch.setattr(analytics, "saved_at", read_and_wait)
+    before = namaste_problems("NAM-007")
+    threads = [threading.Thread(target=problems.save_problems, args=([("roll-race", "NAM-007", [code])],))
+               for code in ("1A00", "1A01")]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert namaste_problems("NAM-007") == before + 1
+    assert_matches_rebuild()
+
+
+def test_categories_follow_reference_reload(database, tmp_path):
+    problems.save_problems([("roll-cat", "NAM-008", ["1A00"])])
+    source = tmp_path / "reference"
+    shutil.copytree(REFERENCE_DATA_DIR, source)
+    path = source / "namaste.csv"
+    lines = path.read_text().splitlines()
+    lines = [line if not line.startswith("NAM-008,") else line.rsplit(",", 1)[0] + ",Recategorised"
+             for line in lines]
+    path.write_text("\n".join(lines) + "\n")
+    try:
+        load_reference_data(source)
+        categories = {c["category"]: c for c in analytics.category_counts()}
+        assert categories["Recategorised"]["codes"] == 1
+        assert categories["Recategorised"]["problems"] == namaste_problems("NAM-008")
+        assert_matches_rebuild()
+    finally:
+        load_reference_data()
+    assert "Recategorised" not in {c["category"] for c in analytics.category_counts()}
@@ -0,0 +1,73 @@
+# backend/tests/test_warmup.py
+"""The warm-up primes the most asked ICD and NAMASTE searches"""
+import asyncio
+import time
+from collections import Counter
+
+import pytest
+
+import search_hits
+import warmup
+from db import connection
+from query_cache import QueryCache, _store_row
+from responses import response_cache
+from search_hits import _store_search_hits, namaste_search_key, top_searches
+
+
+@pytest.fixture
+def hits(database):
+    with connection() as conn:
+        conn.execute("DELETE FROM search_hits")
+        conn.execute("DELETE FROM shared_state WHERE key = 'search_hits_decayed_at'")
+    yield
+    with connection() as conn:
+        conn.execute("DELETE FROM search_hits")
+        conn.execute("DELETE FROM icd_query_cache WHERE cache_key LIKE 'warm|%'")
+
+
+def stored_hits(kind):
+    with connection() as conn:
+        return {r[0]: r[1] for r in conn.execute("SELECT search_key, hits FROM search_hits WHERE kind = ?", (kind,))}
+
+
+def test_counts_add_up_and_decay_once_per_interval(hits, monkeypatch):
+    _store_search_hits(Counter({("icd", "a"): 4, ("icd", "b"): 1}), 0.5)
+    _store_search_hits(Counter({("icd", "b"): 2}), 0.5)  # same interval: no decay
+    assert stored_hits("icd") == {"a": 4, "b": 3}
+    assert top_searches("icd", 1) == ["a"]
+
+    monkeypatch.setattr(search_hits, "SEARCH_HITS_FLUSH_SECONDS", 0)
+    _store_search_hits(Counter({("icd", "b"): 2}), 0.5)
+    assert stored_hits("icd") == {"a": 2, "b": 3.5}
+    assert top_searches("icd", 2) == ["b", "a"]
+
+
+def test_searches_are_counted(client, hits):
+    for _ in range(3):
+        client.get("/api/namaste/search", params={"q": "vata", "mode": "exact"})
+    client.get("/api/namaste/search", params={"q": "kapha"})
+    asyncio.run(search_hits.search_hits.flush())
+    assert stored_hits("namaste") == {namaste_search_key("vata", "exact"): 3, namaste_search_key("kapha", "auto"): 1}
+
+
+def test_query_cache_warms_the_most_asked(hits, monkeypatch):
+    now = int(time.time())
+    _store_row("warm|rare", [{"code": "1A00"}], now)  # stored last, asked least
+    _store_row("warm|popular", [{"code": "1A01"}], now - 60)
+    _store_search_hits(Counter({("icd", "warm|popular"): 9, ("icd", "warm|rare"): 1}), 0.5)
+    cache = QueryCache(maxsize=10, persist=True)
+    monkeypatch.setattr(warmup, "icd_query_cache", cache)
+    monkeypatch.setattr(warmup, "WARMUP_QUERY_CACHE", 1)
+
+    assert asyncio.run(warmup._query_cache()) == 1
+    assert list(cache._entries) == ["warm|popular"]
+
+
+def test_namaste_searches_are_rendered(client, hits):
+    import main
+
+    _store_search_hits(Counter({("namaste", namaste_search_key("pitta dis", "auto")): 5}), 0.5)
+    key = ("namaste", "pitta dis", "auto")
+    assert response_cache.get(key, main.namaste_index.version) is None
+    assert asyncio.run(warmup._namaste_searches(main.cached_namaste_search)) == 1
+    assert response_cache.get(key, main.namaste_index.version) is not None
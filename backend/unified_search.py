@@ -0,0 +1,113 @@
+# backend/unified_search.py
+import asyncio
+import os
+import time
+
+from concept_map_cache import concept_map_cache
+from db import run_db
+from icd_client import ICD_SEARCH_MODE, search_cached_icd, search_who_icd
+from icd_refresh import icd_refresher
+from query_cache import icd_query_cache, query_key
+from search_hits import search_hits
+from search_index import namaste_index
+
+# How long a keystroke waits for WHO before answering with local results only
+UNIFIED_WHO_BUDGET_MS = float(os.getenv("UNIFIED_WHO_BUDGET_MS", "300"))
+# Top NAMASTE hits whose concept-map targets are merged into the ICD list
+UNIFIED_EXPAND = 3
+# Reciprocal rank fusion constant: higher flattens the difference between ranks
+RRF_K = 10
+# A curated mapping counts double against a bare text match at the same rank
+CONCEPT_MAP_WEIGHT = 2.0
+
+
+async def _timed(coro):
+    start = time.perf_counter()
+    result = await coro
+    return result, round((time.perf_counter() - start) * 1000, 3)
+
+
+async def _namaste(q, limit):
+    # in-memory index and cache; no I/O
+    hits = namaste_index.search(q, limit=limit) or namaste_index.search_fuzzy(q, limit=limit)
+    return [
+        {"code": code, "display": display, "category": category, "system": "urn:namaste",
+         "mappings": concept_map_cache.get(code) or []}
+        for code, display, category in hits
+    ]
+
+
+async def _who(q, limit, language, budget):
+    """WHO results, or None if they miss the budget (the lookup keeps running
+    in the background and lands in the query cache for the next keystroke)"""
+    if ICD_SEARCH_MODE == "local":
+        return None
+    key = query_key(q, limit, language)
+    search_hits.record("icd", key)
+    task = asyncio.ensure_future(icd_query_cache.get_or_fetch(
+        key,
+        lambda: search_who_icd(q, limit=limit, language=language),
+    ))
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    try:
+        return await asyncio.wait_for(asyncio.shield(task), budget)
+    except asyncio.TimeoutError:
+        return None
+    except Exception as e:
+        print("WHO search failed:", e)
+        return []
+
+
+def _merge(namaste, local, who, limit):
+    """Rank ICD candidates by reciprocal rank fusion over the three sources.
+
+    Concept-map targets of the top NAMASTE hits are weighted by mapping
+    confidence and CONCEPT_MAP_WEIGHT.
+    """
+    merged = {}
+
+    def add(item, source, score):
+        entry = merged.get(item["code"])
+        if entry is None:
+            entry = merged[item["code"]] = {
+                "code": item["code"], "display": item["display"], "module": item["module"],
+                "sources": [], "score": 0.0,
+            }
+        if source not in entry["sources"]:
+            entry["sources"].append(source)
+        entry["score"] += score
+
+    for rank, hit in enumerate(namaste[:UNIFIED_EXPAND]):
+        for mapping in hit["mappings"]:
+            add(mapping, "conceptMap", CONCEPT_MAP_WEIGHT * mapping["confidence"] / 100 / (RRF_K + rank))
+    for rank, item in enumerate(local):
+        add(item, "local", 1 / (RRF_K + rank))
+    for rank, item in enumerate(who or []):
+        add(item, "who", 1 / (RRF_K + rank))
+
+    ranked = sorted(merged.values(), key=lambda e: -e["score"])[:limit]
+    for entry in ranked:
+        entry["score"] = round(entry["score"], 4)
+    return ranked
+
+
+async def unified_search(q, limit=10, language="en", budget_ms=UNIFIED_WHO_BUDGET_MS):
+    """NAMASTE, local ICD-11 and WHO lookups run concurrently; total latency is
+    bounded by the slowest local source or the WHO budget, whichever is longer"""
+    (namaste, namaste_ms), (local, local_ms), (who, who_ms) = await asyncio.gather(
+        _timed(_namaste(q, limit)),
+        _timed(run_db(search_cached_icd, q, limit)),
+        _timed(_who(q, limit, language, budget_ms / 1000)),
+    )
+    icd_refresher.record_hits(r["code"] for r in local)
+    return {
+        "query": q,
+        "namaste": namaste,
+        "icd": _merge(namaste, local, who, limit),
+        "timings": {
+            "namasteMs": namaste_ms,
+            "localIcdMs": local_ms,
+            "whoMs": who_ms,
+            "whoTimedOut": who is None and ICD_SEARCH_MODE != "local",
+        },
+    }
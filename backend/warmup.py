@@ -0,0 +1,198 @@
+# backend/warmup.py
+"""Post-startup warm-up and the readiness state behind /health/ready.
+
+startup() in main.py builds what every request needs before the server
+accepts connections (schema, reference data, NAMASTE index, concept_map
+cache). warm_up() then runs in the background and takes the remaining
+first-request costs off the first callers:
+
+- pool: open every pooled SQLite connection
+- preload: read the WARMUP_PRELOAD tables (with their indexes; FTS5 tables
+  through their shadow tables) and indexes, so their pages are in the OS
+  page cache instead of being faulted in by requests
+- who_token: fetch the WHO token
+- query_cache: load the stored results of the WARMUP_QUERY_CACHE most asked
+  ICD searches (see search_hits.py) into the in-memory query cache
+- namaste_search: render the WARMUP_NAMASTE_SEARCHES most asked NAMASTE
+  searches into the response cache
+- gc_freeze: move everything built so far out of the collector's view, so
+  full collections stop rescanning the index (~0.6s each at 100k codes)
+
+The worker reports ready when warm-up finishes, or after WARMUP_TIMEOUT
+whatever is left, and stops reporting ready once shutdown begins.
+"""
+import asyncio
+import gc
+import os
+import sqlite3
+import time
+
+from db import connection, pool, run_db
+from icd_client import get_who_token, who_configured
+from query_cache import ICD_QUERY_CACHE_SIZE, icd_query_cache
+from responses import RESPONSE_CACHE_SIZE
+from search_hits import parse_namaste_search_key, top_searches
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "1") == "1"
+WARMUP_TIMEOUT = float(os.getenv("WARMUP_TIMEOUT", "120"))
+# table names (with their indexes) or index names
+WARMUP_PRELOAD = [name for name in os.getenv(
+    "WARMUP_PRELOAD",
+    "namaste,concept_map,icd_cache,icd_fts,problem_rollup_namaste,problem_rollup_category,problem_rollup_icd,"
+    "problem_rollup_daily,idx_problems_patient",
+).split(",") if name]
+WARMUP_QUERY_CACHE = int(os.getenv("WARMUP_QUERY_CACHE", str(ICD_QUERY_CACHE_SIZE)))
+WARMUP_NAMASTE_SEARCHES = int(os.getenv("WARMUP_NAMASTE_SEARCHES", str(RESPONSE_CACHE_SIZE // 2)))
+
+
+def _touch(conn, table, columns, indexed_by=None):
+    """Read every page of `table` (or of its index `indexed_by`) holding `columns`"""
+    total = "+".join(f'COALESCE(LENGTH("{c}"), 0)' for c in columns) or "0"
+    source = f'"{table}" INDEXED BY "{indexed_by}"' if indexed_by else f'"{table}"'
+    conn.execute(f"SELECT SUM({total}) FROM {source}").fetchone()
+
+
+def _index_columns(conn, index):
+    columns = [r["name"] for r in conn.execute(f'PRAGMA index_info("{index}")')]
+    return None if None in columns else columns  # expression indexes are left out
+
+
+def preload_pages(names=WARMUP_PRELOAD):
+    """Read the listed tables and indexes through; returns {"tables", "indexes"} counts"""
+    done = {"tables": 0, "indexes": 0}
+    with connection() as conn:
+        schema = {r["name"]: r for r in conn.execute("SELECT type, name, tbl_name, sql FROM sqlite_master")}
+        for name in names:
+            entry = schema.get(name)
+            if entry is None:
+                continue
+            if entry["type"] == "index":
+                columns = _index_columns(conn, name)
+                if columns:
+                    _touch(conn, entry["tbl_name"], columns, name)
+                    done["indexes"] += 1
+                continue
+            tables = [name]
+            if (entry["sql"] or "").upper().startswith("CREATE VIRTUAL TABLE"):
+                tables = [t for t, e in schema.items() if e["type"] == "table" and t.startswith(f"{name}_")]
+            for table in tables:
+                _touch(conn, table, [r["name"] for r in conn.execute(f'PRAGMA table_info("{table}")')])
+                done["tables"] += 1
+                for index in conn.execute(f'PRAGMA index_list("{table}")').fetchall():
+                    columns = _index_columns(conn, index["name"])
+                    if not columns:
+                        continue
+                    try:
+                        _touch(conn, table, columns, index["name"])
+                        done["indexes"] += 1
+                    except sqlite3.OperationalError:
+                        pass  # e.g. the primary key of a WITHOUT ROWID table, read with the table
+    return done
+
+
+class Readiness:
+    """Warm-up progress and whether this worker should receive traffic"""
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.ready_at = None
+        self.draining = False
+        self.steps = {}
+
+    @property
+    def ready(self):
+        return self.ready_at is not None and not self.draining
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "draining": self.draining,
+            "warmupSeconds": round(self.ready_at - self.started_at, 3) if self.ready_at else None,
+            "steps": self.steps,
+        }
+
+
+readiness = Readiness()
+
+
+async def _step(name, fn):
+    start = time.perf_counter()
+    try:
+        result = await fn()
+        readiness.steps[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "result": result}
+    except Exception as e:
+        readiness.steps[name] = {"ms": round((time.perf_counter() - start) * 1000, 1), "error": str(e)}
+        print(f"Warm-up step {name} failed:", e)
+
+
+async def _who_token():
+    if not who_configured():
+        return "not configured"
+    await get_who_token()
+    return "fetched"
+
+
+async def _query_cache():
+    keys = await run_db(top_searches, "icd", WARMUP_QUERY_CACHE)
+    return await icd_query_cache.preload(keys)
+
+
+async def _namaste_searches(search):
+    keys = await run_db(top_searches, "namaste", WARMUP_NAMASTE_SEARCHES)
+
+    def render():
+        # least asked first, so the most asked are the last the LRU evicts
+        for key in reversed(keys):
+            search(*parse_namaste_search_key(key))
+
+    # off the event loop: fuzzy searches take milliseconds each
+    await run_db(render)
+    return len(keys)
+
+
+async def _gc_freeze():
+    gc.freeze()
+    return gc.get_freeze_count()
+
+
+async def _warm_up(namaste_search):
+    await _step("pool", lambda: run_db(pool.fill))
+    # the token fetch waits on the network while the DB thread reads pages
+    await asyncio.gather(_step("preload", lambda: run_db(preload_pages)), _step("who_token", _who_token))
+    await _step("query_cache", _query_cache)
+    if namaste_search is not None:
+        await _step("namaste_search", lambda: _namaste_searches(namaste_search))
+    await _step("gc_freeze", _gc_freeze)
+
+
+async def warm_up(namaste_search=None):
+    """Run the warm-up steps, then mark this worker ready; `namaste_search(q,
+    mode)` renders one NAMASTE search into the response cache"""
+    readiness.started_at = time.time()
+    if WARMUP_ENABLED:
+        try:
+            await asyncio.wait_for(_warm_up(namaste_search), WARMUP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"Warm-up incomplete after {WARMUP_TIMEOUT}s; reporting ready anyway")
+    readiness.ready_at = time.time()
+    print(f"Ready after {readiness.ready_at - readiness.started_at:.2f}s of warm-up")
+
+
+_task = None
+
+
+def start_warm_up(namaste_search=None):
+    """Run warm_up() in the background; the server accepts requests meanwhile"""
+    global _task
+    _task = asyncio.ensure_future(warm_up(namaste_search))
+
+
+async def stop_warm_up():
+    """Stop reporting ready (shutdown has begun) and cancel an unfinished warm-up"""
+    readiness.draining = True
+    if _task and not _task.done():
+        _task.cancel()
+        try:
+            await _task
+        except asyncio.CancelledError:
+            pass